@@ -1,5 +1,4 @@
 import asyncio
-import datetime
 import os
 import pkgutil
 import sys
@@ -7,12 +6,16 @@ import traceback
 import psutil
 
 from discord import Intents, NoEntryPointError, ExtensionFailed, Activity, ActivityType, Interaction, Message, Member, \
-    TextChannel, Embed, Role, Colour
+    TextChannel, Role, Colour
 from discord.ext.commands import Bot
 
-from app.lib.db import DatabaseManager
-from app.lib.db.queries import get_persistent_views, get_role
+from app.lib.db import DatabaseManager, DATABASE_URL
+from app.lib.db.queries import get_persistent_views
+from app.lib.db.rank_plan import rank_plans
 from app.lib.db.schemes import GuildSchema, PersistentViewEnum
+from app.lib.log_digest import log_digest
+from app.rematch_tracker import close_caches
+from app.lib.role_sync import target_roles, role_sync_stats
 from app.lib.extension_context import RematchContext as Context, RematchApplicationContext as ApplicationContext
 from app.logger import logger
 from app.views import OpenFormView
@@ -71,7 +74,7 @@ class RematchItaliaBot(Bot):
             intents=intents
         )
         models = {"models": ["app.lib.db.schemes"]}
-        self.db = DatabaseManager("sqlite://data/rematch_italia.db", models)
+        self.db = DatabaseManager(DATABASE_URL, models)
         self.version = None
         self.token = os.getenv("API_KEY")
         if not self.token:
@@ -218,49 +221,32 @@ class RematchItaliaBot(Bot):
     async def update_member_rank(self, member: Member, new_rank: RankLinkEnum, platform_id: str | None = None,
                                  platform: PlatformEnum | None = None) -> None:
         guild = member.guild
+        plan = await rank_plans.get(guild.id)
+        rank_roles = [role for role_id in plan.roles.values() if (role := guild.get_role(role_id))]
         new_role: Role | None = None
-        rank_to_role_id = {}
-        for rank in RankLinkEnum:
-            role_id = await get_role(guild, rank)
-            if role_id is not None:
-                rank_to_role_id[rank] = role_id
-
-        to_remove = []
-        for rank, role_id in rank_to_role_id.items():
-            if rank is new_rank:
-                continue
-            role = guild.get_role(role_id)
-            if role and role in member.roles:
-                to_remove.append(role)
-
-        if to_remove:
-            await member.remove_roles(
-                *to_remove,
-                reason="Removing old ranks"
-            )
-        new_role_id = rank_to_role_id.get(new_rank)
+        new_role_id = plan.role_id(new_rank)
         if new_role_id:
             new_role = guild.get_role(new_role_id)
-            if new_role and new_role not in member.roles:
-                await member.add_roles(
-                    new_role,
-                    reason="Automatic rank update"
-                )
+        roles, legacy_calls = target_roles(member.roles, rank_roles, new_role)
+        # Una sola chiamata al posto di remove_roles + add_roles, nessuna se i ruoli sono gia' giusti
+        if legacy_calls:
+            await member.edit(roles=roles, reason="Automatic rank update")
+        role_sync_stats.record(legacy_calls)
 
         db_guild = await get_guild(guild)
-        if db_guild.log_chanel_id:
-            log_channel: TextChannel = guild.get_channel(db_guild.log_chanel_id)
-            embed = Embed(
-                title="Auto Rank Update",
-                description=f"Member {member.mention} rank updated to {new_role.mention}",
-                color=Colour.dark_gold(),
-                timestamp=datetime.datetime.now(datetime.UTC)
-            )
-            if platform_id and platform:
-                embed.add_field(name="User platform", value=f"{platform_id}, {platform}", inline=True)
-            embed.set_author(name=self.user.name, icon_url=self.user.avatar.url if self.user.avatar else None)
-            embed.set_footer(text="© Rematch Italia. All rights reserved.")
-            await log_channel.send(embed=embed)
+        if db_guild and db_guild.log_chanel_id:
+            log_channel: TextChannel | None = guild.get_channel(db_guild.log_chanel_id)
+            if log_channel is not None:
+                line = f"{member.mention} → {new_role.mention if new_role else new_rank.name}"
+                if platform_id and platform:
+                    line += f" ({platform_id}, {platform})"
+                # Le promozioni finiscono in un unico riepilogo invece di un embed ciascuna
+                log_digest.add(log_channel, "Auto Rank Update", line, Colour.dark_gold())
+
+    async def close(self) -> None:
+        await log_digest.flush()
+        await close_caches()
+        await super().close()
 
     # noinspection PyMethodMayBeStatic
     def memory_monitor(self):
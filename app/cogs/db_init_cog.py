@@ -6,6 +6,7 @@ from discord import Guild, Member
 from discord.ext import commands
 
 from app.lib.db import queries
+from app.lib.db.membership import membership
 from app.logger import logger
 
 if TYPE_CHECKING:
@@ -38,6 +39,7 @@ class DBInitCog(commands.Cog):
                 continue
             if created:
                 logger.info(f"Registered member {member.id} ({member.name}) in the database.")
+        membership.add_members(guild.id, (member.id for member in members if not member.bot))
 
     @commands.command(name="sync_guild", hidden=True)
     @commands.is_owner()
@@ -69,6 +71,11 @@ class DBInitCog(commands.Cog):
         await self.bot.sync_commands(guild_ids=[guild.id])
         await self.register_guild(guild, fetch_members)
 
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: Guild):
+        logger.info(f"Bot removed from guild {guild.id} ({guild.name}).")
+        membership.guild_removed(guild.id)
+
     @commands.Cog.listener()
     async def on_member_join(self, member: Member):
         if member.bot:
@@ -84,12 +91,14 @@ class DBInitCog(commands.Cog):
             return
         if created:
             logger.info(f"Registered member {member.id} ({member.name}) in the database.")
+        membership.member_joined(member.guild.id, member.id)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: Member):
         if member.bot:
             return
         logger.info("Member left: %s (%s)", member.id, member.name)
+        membership.member_left(member.guild.id, member.id)
         member_db = await queries.get_member(member)
         if not member_db:
             logger.error(f"Member {member.id} ({member.name}) not found in the database.")
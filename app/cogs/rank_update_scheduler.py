@@ -1,18 +1,47 @@
 import asyncio
 import datetime
 import os
+import random
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Awaitable, Callable
 
-from discord import Cog, User, Guild
+from discord import Cog, User, Guild, HTTPException
 from discord.ext import commands, tasks
 from app.logger import logger
-from app.lib.db.queries import get_platform_to_update, check_guild_rank, update_rank
-from app.lib.db.schemes import PlatformLink, PlatformEnum, RankLinkEnum
-from app.rematch_tracker import get_rematch_profile, ProfileResponse
+from app.lib.db.queries import save_cached_ranks, get_check_schedule, save_check_results, \
+    claim_links, get_existing_links, release_leases, start_run, finish_run, recover_interrupted_runs, get_recent_runs, \
+    mark_members_left, member_left
+from app.lib.db.schemes import PlatformLink, PlatformEnum, RankLinkEnum, RankUpdateRun, RunStatusEnum
+from app.rematch_tracker import get_rematch_profile, get_cache_stats, get_single_flight_stats, Profile, \
+    RequestPriority, rate_limiter, retry_policy, profile_breaker, get_circuit_breakers, CircuitState
 from app.lib.extension_context import RematchContext as Context
-
-RANK_UPDATE_SCHEDULER_INTERVAL = int(os.getenv("RANK_UPDATE_SCHEDULER_INTERVAL", "1800"))
+from app.lib.db.eligibility import eligibility
+from app.lib.db.membership import membership
+from app.lib.db.rank_plan import rank_plans
+from app.lib.fanout import GuildFanout
+from app.lib.log_digest import log_digest, chunk_lines
+from app.lib.role_sync import role_sync_stats
+from app.lib.user_resolver import UserResolver
+from app.lib.scheduling import DueQueue, jittered_interval, to_timestamp, to_datetime, AdaptivePollingPolicy, \
+    interval_distribution, RunStats, RunStatsHistory, StageStats
+
+RANK_UPDATE_SCHEDULER_TICK = int(os.getenv("RANK_UPDATE_SCHEDULER_TICK", "60"))
+RANK_CHECK_INTERVAL = int(os.getenv("RANK_CHECK_INTERVAL", "2700"))
+RANK_CHECK_JITTER = float(os.getenv("RANK_CHECK_JITTER", "0.1"))
+RANK_CHECK_LEASE = int(os.getenv("RANK_CHECK_LEASE", "600"))
+RANK_CHECK_RETRY_DELAY = int(os.getenv("RANK_CHECK_RETRY_DELAY", "120"))
+RANK_CHECK_MIN_INTERVAL = int(os.getenv("RANK_CHECK_MIN_INTERVAL", "900"))
+RANK_CHECK_MAX_INTERVAL = int(os.getenv("RANK_CHECK_MAX_INTERVAL", "21600"))
+RANK_CHECK_BACKOFF = float(os.getenv("RANK_CHECK_BACKOFF", "1.5"))
+RANK_DORMANT_AFTER = int(os.getenv("RANK_DORMANT_AFTER", str(14 * 86400)))
+REMATCH_FETCH_CONCURRENCY = int(os.getenv("REMATCH_FETCH_CONCURRENCY", "8"))
+RANK_PIPELINE_QUEUE_SIZE = int(os.getenv("RANK_PIPELINE_QUEUE_SIZE", "64"))
+RANK_LOOKUP_WORKERS = int(os.getenv("RANK_LOOKUP_WORKERS", "4"))
+RANK_SAVE_BATCH = int(os.getenv("RANK_SAVE_BATCH", "200"))
+RANK_UPDATE_WORKERS = int(os.getenv("RANK_UPDATE_WORKERS", "8"))
+RANK_STATS_HISTORY = int(os.getenv("RANK_STATS_HISTORY", "20"))
+RANK_STATS_FILE = os.getenv("RANK_STATS_FILE")
+FETCH_PROGRESS_LOG_EVERY = 100
 DOWNTIME_START = datetime.time(0, 0)
 DOWNTIME_END = datetime.time(6, 0)
 LOCK_LOGGED = False # Used to prevent multiple logs during downtime
@@ -31,17 +60,81 @@ def is_downtime() -> bool:
 if TYPE_CHECKING:
     from app.bot import RematchItaliaBot
 
-last_rematch_fail: float | None = None
-rematch_fail_cooldown = 300
+polling_policy = AdaptivePollingPolicy(
+    base_interval=RANK_CHECK_INTERVAL,
+    min_interval=RANK_CHECK_MIN_INTERVAL,
+    max_interval=RANK_CHECK_MAX_INTERVAL,
+    backoff=RANK_CHECK_BACKOFF,
+    dormant_after=RANK_DORMANT_AFTER
+)
+
+
+def schedule_next_check(link: PlatformLink, now: datetime.datetime, rank_changed: bool) -> None:
+    """
+    Sets the check interval and the next check time of a link just checked, following polling_policy.
+    :param link: The platform link, with the profile markers of this check already set.
+    :param now: The time of the check.
+    :param rank_changed: Whether the league of the player changed in this check.
+    """
+    if rank_changed:
+        link.last_rank_change_at = now
+    interval = polling_policy.next_interval(link.check_interval, rank_changed, now, link.last_updated_at,
+                                            link.last_rank_change_at)
+    link.check_interval = int(interval)
+    link.next_check_at = now + datetime.timedelta(seconds=jittered_interval(interval, RANK_CHECK_JITTER))
+    link.last_checked = now
+
+
+def release_lease(link: PlatformLink) -> None:
+    """
+    Marks the check of a link as completed. The lease is saved together with the other check results.
+    """
+    link.lease_run_id = None
+    link.lease_expires_at = None
+
+
+class FetchProgress:
+    """
+    Per-run counters of the Rematch profiles fetch.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def __str__(self) -> str:
+        return (f"{self.done}/{self.total} done ({self.changed} changed, {self.unchanged} unchanged, "
+                f"{self.skipped} skipped, {self.failed} failed) in {self.elapsed:.1f}s")
+
 
 class RankUpdateScheduler(Cog):
     """
     This class is responsible for scheduling rank updates.
-    It uses a background task to periodically check and update ranks for members.
+    Every platform link has its own due time, kept in the next_check_at column and in an in-memory DueQueue.
+    A background task wakes up every RANK_UPDATE_SCHEDULER_TICK seconds and checks only the links that are due,
+    so the load is spread over the whole RANK_CHECK_INTERVAL instead of arriving in a single burst.
+    Every stage of a run is timed, and the statistics of the last RANK_STATS_HISTORY runs are kept in memory.
     """
+    run_stats: RunStats | None = None
 
     def __init__(self, bot: "RematchItaliaBot"):
         self.bot = bot
+        self.fetch_progress: FetchProgress | None = None
+        self.run_history = RunStatsHistory(RANK_STATS_HISTORY, RANK_STATS_FILE or None)
+        self.user_resolver = UserResolver(bot)
+        self.role_fanout = GuildFanout()
+        self.due_queue = DueQueue()
+        self.check_intervals: dict[int, int] = {}
+        self._due_queue_loaded = False
         self._updater_loop.start()
 
     def cog_unload(self):
@@ -51,150 +144,511 @@ class RankUpdateScheduler(Cog):
         """
         self._updater_loop.cancel()
 
-    async def _fetch_users(self, discord_ids: list[int]) -> list[User]:
-        ret = []
-        for uid in discord_ids:
-            user = self.bot.get_user(uid)
-            if user is None:
-                user = await self.bot.fetch_user(uid)
-            ret.append(user)
-        return ret
+    def _stage(self, name: str) -> StageStats:
+        """
+        Returns the statistics of the given stage of the current run.
+        Outside of a run, e.g. in benchmarks, they are kept in a run not added to the history.
+        """
+        if self.run_stats is None:
+            self.run_stats = RunStats(None)
+        return self.run_stats.stage(name)
 
-    # noinspection PyMethodMayBeStatic
-    async def _fetch_rematch_profile(self, platform_links: list[PlatformLink]) -> dict[int, RankLinkEnum]:
+    async def _fetch_user(self, discord_id: int) -> User | None:
+        return await self.user_resolver.resolve(discord_id)
+
+    async def _fetch_rematch_profile(
+            self,
+            platform_links: list[PlatformLink],
+            on_changed: Callable[[PlatformLink, RankLinkEnum], Awaitable[None]] | None = None
+    ) -> dict[int, RankLinkEnum] | None:
         """
         This method fetches the Rematch profile for the given platform links.
+        Profiles are fetched concurrently by a pool of at most REMATCH_FETCH_CONCURRENCY workers.
         It checkes if the rank retrieved from the rematch API is different from the cached rank.
-        If it is not different, the object will be removed from the list.
+        If it is not different, the link is not returned.
+        Profiles with the same last_updated_at and rank hash stored on the link are skipped without any
+        further work. Every checked link gets its next check from polling_policy, and the results are
+        saved with a single bulk update.
         :rtype: dict[int, RankLinkEnum]
         :param platform_links:
-        :return: A list of PlatformLink that has to be updated
+        :param on_changed: If given, it is awaited with the link and the new rank of every member to update
+            as soon as the profile is fetched, instead of collecting them in the returned dict.
+            The lease of these links is left to the caller, the others are released when their results are saved.
+        :return: A dict mapping the discord id of the members to update to their new rank,
+            or None if the fetch has been skipped because the profile circuit is open.
         """
-        global last_rematch_fail
-
-        # Se siamo in cooldown, saltiamo la chiamata
-        if last_rematch_fail and (time.time() - last_rematch_fail) < rematch_fail_cooldown:
-            remaining = int(rematch_fail_cooldown - (time.time() - last_rematch_fail))
-            logger.warning(f"Skipping Rematch profile fetch due to recent failures (cooldown {remaining}s).")
+        # Se il circuito è aperto, saltiamo la chiamata
+        if profile_breaker.state is CircuitState.OPEN:
+            logger.warning(f"Skipping Rematch profile fetch, profile circuit is open "
+                           f"(retry in {profile_breaker.retry_in:.0f}s).")
             return None
 
         ret = {}
-        logger.info(f"Fetching Rematch profiles for {len(platform_links)} members...")
-        original_links = platform_links.copy()
-
-        try:
-            for link in platform_links:
-                platform = link.platform.value if link.platform != PlatformEnum.PSN else "psn"
-                platform_id = link.platform_id
-
+        checked: list[PlatformLink] = []
+        now = datetime.datetime.now(datetime.UTC)
+        progress = FetchProgress(len(platform_links))
+        self.fetch_progress = progress
+        workers = max(1, min(REMATCH_FETCH_CONCURRENCY, len(platform_links)))
+        stats = self._stage("fetch")
+        logger.info(f"Fetching Rematch profiles for {len(platform_links)} members with {workers} workers...")
+        links = iter(platform_links)
+
+        async def fetch(link: PlatformLink) -> None:
+            platform = link.platform.value if link.platform != PlatformEnum.PSN else "psn"
+            platform_id = link.platform_id
+
+            try:
+                started = time.perf_counter()
                 try:
-                    profile: ProfileResponse = await get_rematch_profile(
+                    profile: Profile = await get_rematch_profile(
                         platform=platform,
-                        platform_id=platform_id
+                        platform_id=platform_id,
+                        priority=RequestPriority.BACKGROUND
                     )
-                    if profile is None:
-                        logger.warning(f"Failed to fetch Rematch profile for {platform}/{platform_id}")
-                        continue
-
-                    rank = RankLinkEnum(profile["rank"]["current_league"])
-                    if rank != link.cached_rank:
-                        ret[link.discord_id_id] = rank
-                        logger.debug(f"Rank set for update for {link.discord_id_id}: {rank}")
+                finally:
+                    stats.observe(time.perf_counter() - started)
+                if profile is None:
+                    progress.failed += 1
+                    stats.errors += 1
+                    logger.warning(f"Failed to fetch Rematch profile for {platform}/{platform_id}")
+                    return
+
+                rank = RankLinkEnum(profile.current_league)
+                rank_hash = profile.rank_hash
+                # Il controllo sul rank copre i link il cui ultimo aggiornamento dei ruoli non è andato a buon fine
+                if (link.last_updated_at == profile.last_updated_at and link.rank_hash == rank_hash
+                        and rank == link.cached_rank):
+                    progress.skipped += 1
+                    stats.dropped += 1
+                    schedule_next_check(link, now, rank_changed=False)
+                    release_lease(link)
+                    checked.append(link)
+                    return
+
+                link.last_updated_at = profile.last_updated_at
+                link.rank_hash = rank_hash
+                # Il cambio di rank conta solo quando il nuovo rank viene salvato, vedi _save_ranks
+                schedule_next_check(link, now, rank_changed=False)
+                if rank == link.cached_rank or on_changed is None:
+                    release_lease(link)
+                checked.append(link)
+                if rank != link.cached_rank:
+                    progress.changed += 1
+                    stats.passed += 1
+                    logger.debug(f"Rank set for update for {link.discord_id_id}: {rank}")
+                    if on_changed is not None:
+                        await on_changed(link, rank)
                     else:
-                        original_links.remove(link)
-
-                except asyncio.TimeoutError:
-                    last_rematch_fail = time.time()
-                    logger.error(f"Timeout fetching Rematch profile for {platform}/{platform_id}")
-                    continue
-                except Exception as e:
-                    last_rematch_fail = time.time()
-                    logger.error(f"Error fetching Rematch profile for {platform}/{platform_id}: {e}", exc_info=True)
-                    continue
-
-            # Se almeno una chiamata è andata a buon fine, resettiamo il cooldown
-            if ret:
-                last_rematch_fail = None
+                        ret[link.discord_id_id] = rank
+                else:
+                    progress.unchanged += 1
+                    stats.dropped += 1
+
+            except asyncio.TimeoutError:
+                progress.failed += 1
+                stats.errors += 1
+                logger.error(f"Timeout fetching Rematch profile for {platform}/{platform_id}")
+            except Exception as e:
+                progress.failed += 1
+                stats.errors += 1
+                logger.error(f"Error fetching Rematch profile for {platform}/{platform_id}: {e}", exc_info=True)
+
+        async def worker() -> None:
+            # Gli iteratori sono condivisi tra i worker: ogni link viene preso una sola volta
+            for link in links:
+                if profile_breaker.state is CircuitState.OPEN:
+                    logger.warning("Profile circuit opened during the fetch, stopping the worker.")
+                    return
+                await fetch(link)
+                progress.done += 1
+                if progress.done % FETCH_PROGRESS_LOG_EVERY == 0:
+                    logger.info(f"Rematch profiles fetch progress: {progress}")
 
-            logger.info("Rematch profiles fetch completed.")
-            logger.debug(f"Ranks will be updated for {len(ret)}/{len(platform_links)} members.")
+        try:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+            logger.info(f"Rematch profiles fetch completed: {progress}")
+            logger.debug(f"Ranks will be updated for {progress.changed}/{len(platform_links)} members.")
             return ret
 
         except Exception as e:
-            last_rematch_fail = time.time()
             logger.error(f"Fatal error during Rematch profiles fetch: {e}", exc_info=True)
             return None
 
-    # noinspection PyMethodMayBeStatic
-    async def _get_mutual_guilds(self, users: list[User]) -> dict[User, list[Guild]]:
+        finally:
+            # Anche se il salvataggio fallisce i rank cambiati vengono comunque aggiornati
+            try:
+                with self._stage("save").timer(len(checked)):
+                    await save_check_results(checked)
+            except Exception as e:
+                logger.error(f"Failed to save the rank check results of {len(checked)} links: {e}", exc_info=True)
+
+    async def _get_mutual_guilds(self, user: User) -> list[Guild]:
         """
-        This method retrieves the mutual guilds for the given users.
+        This method retrieves the mutual guilds of the given user from the membership index.
         The method does not return the guilds where the role to rank link is not beeing set.
         :rtype: list[Guild]
-        :param users:
-        :return: A list of Guilds where the users are members.
-        """
-        member_guilds_map = {}
-        for user in users:
-            guilds = []
-            for guild in user.mutual_guilds:
-                if not await check_guild_rank(guild):
-                    continue
-                guilds.append(guild)
-            if guilds:
-                logger.debug(f"User {user.id} has {len(guilds)} mutual guilds with ranks.")
-                member_guilds_map[user] = guilds
-
-        logger.info(f"Found mutual guilds for {len(member_guilds_map)} users.")
-        return member_guilds_map
-
-    async def _update_member_ranks(
-            self,
-            member_guilds_map: dict[User, list[Guild]],
-            to_update: dict[int, RankLinkEnum]
-    ) -> None:
-        """
-        This method updates the ranks for members in the given guilds.
-        It iterates over the member-guilds map and updates the rank for each member in each guild.
-        :param member_guilds_map:
-            A dictionary mapping users to their mutual guilds.
-        :param to_update:
-            A dictionary mapping user IDs to their new ranks.
-        :return:
-            None
+        :param user:
+        :return: A list of Guilds where the user is a member.
         """
-        logger.info("Starting to update member ranks...")
-        for user, guilds in member_guilds_map.items():
-            if user.id not in to_update:
-                logger.debug(f"User {user.id} has no rank to update.")
+        guilds = []
+        # Copia: un evento di ingresso o uscita durante l'attesa modificherebbe l'insieme
+        for guild_id in tuple(membership.guilds_of(user.id)):
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or not (await rank_plans.get(guild_id)).configured:
                 continue
-            rank = to_update[user.id]
-            logger.info(f"Updating rank for user {user.id} to {rank.name} in {len(guilds)} guilds.")
-            for guild in guilds:
+            guilds.append(guild)
+        if guilds:
+            logger.debug(f"User {user.id} has {len(guilds)} mutual guilds with ranks.")
+        return guilds
+
+    async def _update_member_ranks(self, user: User, guilds: list[Guild], rank: RankLinkEnum) -> int:
+        """
+        This method updates the rank of the given user in each of the given guilds.
+        The cached rank is not saved here: the pipeline saves it once per member, in batches.
+        :param user:
+            The user whose rank changed.
+        :param guilds:
+            The mutual guilds with linked ranks.
+        :param rank:
+            The new rank.
+        :return:
+            The number of guilds where the roles have been updated.
+        """
+        logger.info(f"Updating rank for user {user.id} to {rank.name} in {len(guilds)} guilds.")
+
+        async def update(guild: Guild) -> bool:
+            try:
+                return await self.role_fanout.run(guild.id, self._update_guild_member, user, guild, rank)
+            except Exception as e:
+                logger.error(f"Failed to update member rank for user {user.id} in guild {guild.id}: {e}",
+                             exc_info=True)
+                return False
+
+        # Ogni guild ha la sua corsia: una guild lenta o limitata non blocca le altre
+        results = await asyncio.gather(*(update(guild) for guild in guilds))
+        return sum(results)
+
+    async def _update_guild_member(self, user: User, guild: Guild, rank: RankLinkEnum) -> bool:
+        """
+        This method updates the rank roles of the given user in a guild.
+        A 429 is raised again, so that role_fanout can back off the guild and retry.
+        :return: True if the roles have been updated, False if the user is not a member of the guild.
+        """
+        member = guild.get_member(user.id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(user.id)
+            except HTTPException as e:
+                if e.status == 429:
+                    raise
+                logger.error(f"Failed to fetch member {user.id} in guild {guild.id}: {e}")
+                if e.status == 404:
+                    await self._member_gone(user, guild)
+                return False
+        await self.bot.update_member_rank(member, rank)
+        logger.debug(f"Updated rank for user {user.id} in guild {guild.id}.")
+        return True
+
+    # noinspection PyMethodMayBeStatic
+    async def _member_gone(self, user: User, guild: Guild) -> None:
+        """
+        This method marks as left a member that Discord does not find in the guild anymore,
+        so that the membership index stops counting the guild for them.
+        """
+        membership.member_left(guild.id, user.id)
+        try:
+            await member_left(user, datetime.datetime.now(datetime.UTC), guild.id)
+        except Exception as e:
+            logger.error(f"Failed to mark member {user.id} as left from guild {guild.id}: {e}", exc_info=True)
+
+    async def _save_ranks(self, platform_links: list[PlatformLink]) -> None:
+        """
+        This method saves the new cached rank of the given links with a single bulk update.
+        Only then the links count as changed for polling_policy, and are checked again after its minimum
+        interval. If the save fails the ranks are found changed again at the next check, the roles are left
+        as they are and the links keep the backed off schedule of their check.
+        """
+        if not platform_links:
+            return
+        now = datetime.datetime.now(datetime.UTC)
+        schedules = [(link.check_interval, link.next_check_at, link.last_checked, link.last_rank_change_at)
+                     for link in platform_links]
+        for link in platform_links:
+            schedule_next_check(link, now, rank_changed=True)
+        try:
+            with self._stage("rank_save").timer(len(platform_links)):
+                await save_cached_ranks(platform_links)
+        except Exception as e:
+            logger.error(f"Failed to save the cached rank of {len(platform_links)} links: {e}", exc_info=True)
+            for link, schedule in zip(platform_links, schedules):
+                link.check_interval, link.next_check_at, link.last_checked, link.last_rank_change_at = schedule
+
+    async def _load_due_queue(self, now: float) -> None:
+        """
+        This method fills the due queue with every platform link.
+        Links left unfinished by an interrupted run are retried within RANK_CHECK_RETRY_DELAY seconds.
+        Links never scheduled or overdue, e.g. after a restart, are spread over the next RANK_CHECK_INTERVAL.
+        """
+        unfinished = set(await recover_interrupted_runs())
+        schedule = await get_check_schedule()
+        spread = 0
+        for link_id, next_check_at, check_interval in schedule:
+            self.check_intervals[link_id] = check_interval or RANK_CHECK_INTERVAL
+            due_at = to_timestamp(next_check_at)
+            if link_id in unfinished:
+                due_at = now + random.uniform(0, RANK_CHECK_RETRY_DELAY)
+            elif due_at is None or due_at < now:
+                due_at = now + random.uniform(0, RANK_CHECK_INTERVAL)
+                spread += 1
+            self.due_queue.push(link_id, due_at)
+        self._due_queue_loaded = True
+        logger.info(f"Rank check queue loaded with {len(schedule)} links ({len(unfinished)} unfinished, {spread} "
+                    f"overdue or new, spread over {RANK_CHECK_INTERVAL}s).")
+
+    async def _schedule_new_links(self, now: float) -> None:
+        """
+        This method adds to the due queue the links created after the queue was loaded.
+        """
+        added = 0
+        for link_id, _, _ in await get_check_schedule(unscheduled_only=True):
+            if link_id not in self.due_queue:
+                self.due_queue.push(link_id, now + random.uniform(0, RANK_CHECK_INTERVAL))
+                self.check_intervals[link_id] = RANK_CHECK_INTERVAL
+                added += 1
+        if added:
+            logger.debug(f"Scheduled {added} new platform links.")
+
+    async def _claim_due_links(self, link_ids: list[int], run: RankUpdateRun, now: float) -> list[PlatformLink]:
+        """
+        This method claims for the run the given due links, leasing them for RANK_CHECK_LEASE seconds.
+        Their next check is set to RANK_CHECK_RETRY_DELAY seconds from now, and moved by polling_policy once
+        they are checked: links whose profile cannot be fetched are retried soon.
+        Links leased by another run are put back in the queue, deleted links leave it.
+        """
+        platform_links = await claim_links(link_ids, run, RANK_CHECK_LEASE)
+        unclaimed = list(set(link_ids).difference(link.id for link in platform_links))
+        if unclaimed:
+            existing = set(await get_existing_links(unclaimed))
+            for link_id in unclaimed:
+                if link_id in existing:
+                    self.due_queue.push(link_id, now + jittered_interval(RANK_CHECK_RETRY_DELAY, RANK_CHECK_JITTER))
+                else:
+                    self.check_intervals.pop(link_id, None)
+        for link in platform_links:
+            link.next_check_at = to_datetime(now + jittered_interval(RANK_CHECK_RETRY_DELAY, RANK_CHECK_JITTER))
+        return platform_links
+
+    async def _finish_run(self, run: RankUpdateRun, platform_links: list[PlatformLink], updated: int,
+                          status: RunStatusEnum) -> None:
+        """
+        This method releases the links the run did not complete, which will be retried soon,
+        and saves the counters of the run in the run journal.
+        """
+        unfinished = [link for link in platform_links if link.lease_run_id is not None]
+        try:
+            await release_leases(unfinished)
+        except Exception as e:
+            logger.error(f"Failed to release {len(unfinished)} unfinished links of run {run.id}: {e}", exc_info=True)
+        progress = self.fetch_progress
+        counters = {"claimed": len(platform_links), "updated": updated}
+        if progress is not None:
+            counters.update(checked=progress.done - progress.failed, changed=progress.changed,
+                            skipped=progress.skipped, failed=progress.failed)
+        try:
+            await finish_run(run, status, **counters)
+        except Exception as e:
+            # Il run resta aperto nel journal e viene segnato come interrotto al prossimo avvio
+            logger.error(f"Failed to save run {run.id} in the run journal: {e}", exc_info=True)
+        logger.info(f"Rank update run {run.id} {status.value}: {counters}, {len(unfinished)} links to retry.")
+
+    async def _load_indexes(self) -> None:
+        """
+        This method loads the membership and eligibility indexes from the database, and adds to the
+        membership index the members in the gateway cache, which may not be registered yet.
+        The members of a fully chunked guild missing from the gateway cache left while the bot was offline:
+        they are marked as left, in the index and in the database.
+        """
+        await membership.load()
+        now = datetime.datetime.now(datetime.UTC)
+        pruned = 0
+        for guild in self.bot.guilds:
+            if guild.chunked:
+                gone = membership.members_of(guild.id).difference(member.id for member in guild.members)
+                for discord_id in gone:
+                    membership.member_left(guild.id, discord_id)
+                if gone:
+                    pruned += await mark_members_left(guild.id, gone, now)
+            membership.add_members(guild.id, (member.id for member in guild.members if not member.bot))
+        if pruned:
+            logger.info(f"Marked as left {pruned} members who left while the bot was offline.")
+        await eligibility.load()
+
+    async def _filter_eligible(self, platform_links: list[PlatformLink], now: float) -> list[PlatformLink]:
+        """
+        This method keeps only the links of members in at least one guild with linked ranks,
+        before any Rematch API request. The other links are not checked: their next check is moved
+        one check interval ahead and their lease is released.
+        :return: The eligible links.
+        """
+        if not eligibility.loaded:
+            await self._load_indexes()
+        stats = self._stage("eligibility")
+        with stats.timer(len(platform_links)):
+            eligible, ineligible = [], []
+            for link in platform_links:
+                (eligible if eligibility.is_eligible(link.discord_id_id) else ineligible).append(link)
+            for link in ineligible:
+                interval = link.check_interval or RANK_CHECK_INTERVAL
+                link.next_check_at = to_datetime(now + jittered_interval(interval, RANK_CHECK_JITTER))
+                release_lease(link)
+            await save_check_results(ineligible)
+        stats.passed += len(eligible)
+        stats.dropped += len(ineligible)
+        eligibility.record(len(platform_links), len(ineligible))
+        if ineligible:
+            logger.info(f"Skipped {len(ineligible)}/{len(platform_links)} links of members not in a guild "
+                        f"with linked ranks (skip rate {eligibility.skip_rate:.1%}).")
+        return eligible
+
+    async def _finish_run_stats(self) -> None:
+        """
+        This method closes the statistics of the current run and dumps them to RANK_STATS_FILE, if set.
+        """
+        self.run_stats.counters["users"] = self.user_resolver.run_stats.as_dict()
+        try:
+            await self.run_history.finish(self.run_stats)
+        except OSError as e:
+            logger.error(f"Failed to dump the statistics of run {self.run_stats.run_id}: {e}")
+        logger.debug(f"Rank update run {self.run_stats.run_id} stages: "
+                     + "; ".join(f"{name}: {stage}" for name, stage in self.run_stats.stages.items()))
+
+    def _requeue(self, link_ids: list[int], now: float) -> None:
+        """
+        This method puts back in the due queue the given links, which could not be claimed,
+        to be retried within RANK_CHECK_RETRY_DELAY seconds.
+        """
+        for link_id in link_ids:
+            self.due_queue.push(link_id, now + jittered_interval(RANK_CHECK_RETRY_DELAY, RANK_CHECK_JITTER))
+
+    def _reschedule(self, platform_links: list[PlatformLink]) -> None:
+        """
+        This method puts back the given links in the due queue, at their next check time.
+        """
+        for link in platform_links:
+            self.due_queue.push(link.id, to_timestamp(link.next_check_at))
+            self.check_intervals[link.id] = link.check_interval or RANK_CHECK_INTERVAL
+
+    async def _process_links(self, platform_links: list[PlatformLink]) -> int:
+        """
+        This method checks the ranks of the given links and updates the roles of the members whose rank changed.
+        The work flows through a pipeline of three stages connected by queues of at most RANK_PIPELINE_QUEUE_SIZE
+        items: profile fetch, user and mutual guilds lookup (by RANK_LOOKUP_WORKERS workers), role update
+        (by RANK_UPDATE_WORKERS workers, whose Discord calls go through the per-guild lanes of role_fanout).
+        A role update starts as soon as the first changed profile is fetched, and a slow stage slows down
+        the previous ones instead of piling up work in memory. The lease of a changed link is released once
+        its roles have been handled, and the new cached ranks are saved in batches of RANK_SAVE_BATCH links.
+        :return: The number of members whose roles have been updated.
+        """
+        logger.debug(f"Checking ranks of {len(platform_links)} members...")
+        changed: asyncio.Queue[tuple[PlatformLink, RankLinkEnum] | None] = asyncio.Queue(RANK_PIPELINE_QUEUE_SIZE)
+        to_update: asyncio.Queue[tuple[PlatformLink, User, list[Guild], RankLinkEnum] | None] = \
+            asyncio.Queue(RANK_PIPELINE_QUEUE_SIZE)
+        updated = 0
+
+        async def fetch_stage() -> None:
+            try:
+                await self._fetch_rematch_profile(platform_links, on_changed=lambda *item: changed.put(item))
+            finally:
+                # None segnala la fine del lavoro allo stadio successivo
+                await changed.put(None)
+
+        async def lookup_worker() -> None:
+            user_stats, guild_stats = self._stage("user_fetch"), self._stage("guild_filter")
+            while (item := await changed.get()) is not None:
+                link, rank = item
+                # Un errore su un utente non deve fermare lo stadio, altrimenti quello precedente si blocca
                 try:
-                    member = guild.get_member(user.id)
-                    if member is None:
-                        try:
-                            member = await guild.fetch_member(user.id)
-                        except Exception as e:
-                            logger.error(f"Failed to fetch member {user.id} in guild {guild.id}: {e}", exc_info=True)
-                            continue
-                    try:
-                        await self.bot.update_member_rank(member, rank)
-                    except Exception as e:
-                        logger.error(f"Failed to update member rank for user {user.id} in guild {guild.id}: {e}",
-                                     exc_info=True)
-                        continue
-                    await update_rank(member, rank)
-                    logger.debug(f"Updated rank for user {user.id} in guild {guild.id}.")
+                    guilds = []
+                    with user_stats.timer():
+                        user = await self._fetch_user(link.discord_id_id)
+                    if user is None:
+                        user_stats.dropped += 1
+                    else:
+                        user_stats.passed += 1
+                        with guild_stats.timer():
+                            guilds = await self._get_mutual_guilds(user)
+                        if guilds:
+                            guild_stats.passed += 1
+                        else:
+                            guild_stats.dropped += 1
                 except Exception as e:
-                    logger.error(f"Failed to update rank for user {user.id} in guild {guild.id}: {e}", exc_info=True)
+                    logger.error(f"Failed to look up the guilds of user {link.discord_id_id}: {e}", exc_info=True)
+                    guilds = []
+                if guilds:
+                    await to_update.put((link, user, guilds, rank))
+                else:
+                    await self._complete(link)
+            # Il segnale di fine resta in coda per gli altri worker
+            changed.put_nowait(None)
+
+        async def lookup_stage() -> None:
+            try:
+                await asyncio.gather(*(lookup_worker() for _ in range(max(1, RANK_LOOKUP_WORKERS))))
+            finally:
+                await to_update.put(None)
+
+        # I rank salvati a blocchi invece di una save() per membro e per guild
+        to_save: list[PlatformLink] = []
+
+        async def update_worker() -> None:
+            nonlocal updated, to_save
+            role_stats = self._stage("role_update")
+            while (item := await to_update.get()) is not None:
+                link, user, guilds, rank = item
+                try:
+                    with role_stats.timer():
+                        guilds_updated = await self._update_member_ranks(user, guilds, rank)
+                    if guilds_updated:
+                        role_stats.passed += 1
+                        updated += 1
+                        link.cached_rank = rank
+                        to_save.append(link)
+                    else:
+                        role_stats.dropped += 1
+                except Exception as e:
+                    logger.error(f"Failed to update the rank of user {user.id}: {e}", exc_info=True)
+                await self._complete(link)
+                if len(to_save) >= RANK_SAVE_BATCH:
+                    batch, to_save = to_save, []
+                    await self._save_ranks(batch)
+            to_update.put_nowait(None)
+
+        async def update_stage() -> None:
+            try:
+                await asyncio.gather(*(update_worker() for _ in range(max(1, RANK_UPDATE_WORKERS))))
+            finally:
+                await self._save_ranks(to_save)
+
+        await asyncio.gather(fetch_stage(), lookup_stage(), update_stage())
+        if not updated:
+            logger.info("No ranks to update.")
+            return 0
+        self.bot.memory_monitor()
+        logger.info(f"Rank update completed for {updated} members.")
+        return updated
 
-    @tasks.loop(seconds=RANK_UPDATE_SCHEDULER_INTERVAL)
+    # noinspection PyMethodMayBeStatic
+    async def _complete(self, link: PlatformLink) -> None:
+        try:
+            await release_leases([link])
+        except Exception as e:
+            # Il lease scade comunque dopo RANK_CHECK_LEASE secondi
+            logger.error(f"Failed to release the lease of link {link.id}: {e}", exc_info=True)
+
+    @tasks.loop(seconds=RANK_UPDATE_SCHEDULER_TICK)
     async def _updater_loop(self):
         """
-        This method runs periodically to update ranks for members.
-        It checks if the bot is ready and then calls the update method.
+        This method runs every tick and checks the ranks of the links that are due.
         """
         global LOCK_LOGGED
         if is_downtime():
@@ -203,32 +657,67 @@ class RankUpdateScheduler(Cog):
                 LOCK_LOGGED = True
             return
 
+        now = time.time()
+        if LOCK_LOGGED:
+            # Fine del downtime: i link scaduti nel frattempo non partono tutti insieme
+            spread = self.due_queue.spread_overdue(now, RANK_CHECK_INTERVAL)
+            logger.info(f"Rank update scheduler downtime ended, {spread} overdue links spread "
+                        f"over {RANK_CHECK_INTERVAL}s.")
         LOCK_LOGGED = False
 
-        logger.info("Running rank update scheduler...")
-        platform_links = await get_platform_to_update()
-        if not platform_links or platform_links is None:
-            logger.info("No platform links to update ranks for.")
-            return
-        logger.debug(f"Checking ranks of {len(platform_links)} members...")
+        # Un errore del database non deve uscire dal task, altrimenti lo scheduler si ferma
+        try:
+            if not self._due_queue_loaded:
+                await self._load_due_queue(now)
+            else:
+                await self._schedule_new_links(now)
+        except Exception as e:
+            logger.error(f"Failed to load the rank check queue: {e}", exc_info=True)
+            if not self._due_queue_loaded:
+                return
 
-        to_update = await self._fetch_rematch_profile(platform_links)
-        if not to_update:
-            logger.info("No ranks to update.")
+        link_ids = self.due_queue.pop_due(now)
+        if not link_ids:
+            logger.debug("No platform links due for a rank check.")
             return
-        del platform_links
-        discord_ids = list(to_update.keys())
-        users = await self._fetch_users(discord_ids)
-        del discord_ids
-        if not users:
-            logger.info("No users to update ranks for.")
+        try:
+            run = await start_run()
+        except Exception as e:
+            self._requeue(link_ids, now)
+            logger.error(f"Failed to start a rank update run, {len(link_ids)} links retried soon: {e}",
+                         exc_info=True)
             return
-        member_guilds_map = await self._get_mutual_guilds(users)
-        del users
-        self.bot.memory_monitor()
-        await self._update_member_ranks(member_guilds_map, to_update)
-        logger.info("Rank update scheduler completed.")
-
+        self.fetch_progress = None
+        self.run_stats = self.run_history.start(run.id)
+        self.user_resolver.new_run()
+        claim_stats = self.run_stats.stage("claim")
+        try:
+            with claim_stats.timer(len(link_ids)):
+                platform_links = await self._claim_due_links(link_ids, run, now)
+        except Exception as e:
+            self._requeue(link_ids, now)
+            logger.error(f"Failed to claim the due links of run {run.id}, {len(link_ids)} links retried soon: {e}",
+                         exc_info=True)
+            await self._finish_run(run, [], 0, RunStatusEnum.FAILED)
+            await self._finish_run_stats()
+            return
+        claim_stats.passed = len(platform_links)
+        claim_stats.dropped = len(link_ids) - len(platform_links)
+        logger.info(f"Running rank update run {run.id} for {len(platform_links)} due links "
+                    f"({len(self.due_queue)} scheduled).")
+        updated, status = 0, RunStatusEnum.COMPLETED
+        try:
+            updated = await self._process_links(await self._filter_eligible(platform_links, now))
+        except Exception as e:
+            status = RunStatusEnum.FAILED
+            logger.error(f"Rank update run {run.id} failed: {e}", exc_info=True)
+        finally:
+            # Prima la coda: i link tornano in programma anche se il journal non può essere scritto
+            self._reschedule(platform_links)
+            await self._finish_run(run, platform_links, updated, status)
+            log_digest.flush_soon()
+            await self._finish_run_stats()
+        logger.debug(f"Check intervals: {interval_distribution(self.check_intervals.values())}")
 
     @_updater_loop.before_loop
     async def before_updater_loop(self):
@@ -237,8 +726,21 @@ class RankUpdateScheduler(Cog):
         It waits until the bot is ready.
         """
         await self.bot.wait_until_ready()
+        try:
+            await self._load_indexes()
+        except Exception as e:
+            # Verranno caricati dal primo run
+            logger.error(f"Failed to load the membership indexes: {e}", exc_info=True)
         logger.info("Rank update scheduler is ready.")
 
+    # noinspection PyMethodMayBeStatic
+    async def _send_lines(self, ctx: Context, lines: list[str]) -> None:
+        """
+        This method sends the given lines in as few messages as the Discord message length allows.
+        """
+        for message in chunk_lines(lines):
+            await ctx.send(message)
+
     @commands.command(
         name="rank_update_scheduler",
         description="Starts the rank update scheduler.",
@@ -253,6 +755,103 @@ class RankUpdateScheduler(Cog):
         await self._updater_loop()
         await ctx.send("Rank update scheduler started.")
 
+    @commands.command(
+        name="rank_stats",
+        description="Shows the per-stage statistics of the last rank update runs.",
+        hidden=True
+    )
+    @commands.is_owner()
+    async def rank_stats(self, ctx: Context, runs: int = 1):
+        """
+        This command shows, for each stage of the last rank update runs, the items handled, passed on,
+        dropped and failed, the time spent and the latency percentiles.
+        It is intended for use by the bot owner only.
+        """
+        history = list(self.run_history)[-max(1, min(runs, 3)):]
+        if not history:
+            await ctx.send("No rank update run statistics yet.")
+            return
+        lines = []
+        for stats in reversed(history):
+            duration = f"{stats.duration:.1f}s" if stats.duration is not None else "running"
+            lines.append(f"**#{stats.run_id}** {stats.started_at:%Y-%m-%d %H:%M:%S} ({duration})")
+            for name, stage in stats.stages.items():
+                lines.append(f"- **{name}**: {stage}")
+            for name, counters in stats.counters.items():
+                lines.append(f"- **{name}**: " + ", ".join(f"{k}={v}" for k, v in counters.items()))
+        await self._send_lines(ctx, lines)
+
+    @commands.command(
+        name="tracker_stats",
+        description="Shows the Rematch tracker client statistics.",
+        hidden=True
+    )
+    @commands.is_owner()
+    async def tracker_stats(self, ctx: Context):
+        """
+        This command shows the counters of the Rematch tracker client.
+        It is intended for use by the bot owner only.
+        """
+        lines = []
+        for name, stats in get_cache_stats().items():
+            counters = ", ".join(f"{k}={v}" for k, v in stats.as_dict().items())
+            lines.append(f"**{name} cache**: {counters}")
+        for name, flight in get_single_flight_stats().items():
+            counters = ", ".join(f"{k}={v}" for k, v in flight.as_dict().items())
+            lines.append(f"**{name} single-flight**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in rate_limiter.as_dict().items())
+        lines.append(f"**rate limiter**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in retry_policy.as_dict().items())
+        lines.append(f"**retries**: {counters}")
+        for name, breaker in get_circuit_breakers().items():
+            counters = ", ".join(f"{k}={v}" for k, v in breaker.as_dict().items())
+            lines.append(f"**{name} circuit**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in self.user_resolver.stats.as_dict().items())
+        lines.append(f"**users**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in membership.as_dict().items())
+        lines.append(f"**membership**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in eligibility.as_dict().items())
+        lines.append(f"**eligibility**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in rank_plans.as_dict().items())
+        lines.append(f"**rank plans**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in self.role_fanout.as_dict().items())
+        lines.append(f"**role fan-out**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in role_sync_stats.as_dict().items())
+        lines.append(f"**role sync**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in log_digest.stats.as_dict().items())
+        lines.append(f"**log digest**: {counters}, queued={len(log_digest)}")
+        counters = ", ".join(f"{k}={v}" for k, v in self.due_queue.as_dict(time.time()).items())
+        lines.append(f"**rank check queue**: {counters}")
+        counters = ", ".join(f"{k}={v}" for k, v in interval_distribution(self.check_intervals.values()).items())
+        lines.append(f"**check intervals**: {counters}")
+        if self.fetch_progress is not None:
+            lines.append(f"**last fetch**: {self.fetch_progress}")
+        await self._send_lines(ctx, lines)
+
+
+    @commands.command(
+        name="rank_runs",
+        description="Shows the last rank update runs.",
+        hidden=True
+    )
+    @commands.is_owner()
+    async def rank_runs(self, ctx: Context, limit: int = 10):
+        """
+        This command shows the last rank update runs from the run journal.
+        It is intended for use by the bot owner only.
+        """
+        runs = await get_recent_runs(min(limit, 25))
+        if not runs:
+            await ctx.send("No rank update runs yet.")
+            return
+        lines = []
+        for run in runs:
+            duration = (run.finished_at - run.started_at).total_seconds() if run.finished_at else None
+            lines.append(f"**#{run.id}** {run.status.value} {run.started_at:%Y-%m-%d %H:%M:%S}"
+                         f"{f' ({duration:.1f}s)' if duration is not None else ''}: {run.claimed} claimed, "
+                         f"{run.checked} checked, {run.changed} changed, {run.skipped} skipped, "
+                         f"{run.failed} failed, {run.updated} updated")
+        await self._send_lines(ctx, lines)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+_MISSING = object()
+
+
+class CacheStats:
+    """
+    Counters of a cache, exposed for monitoring.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.disk_flushes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "disk_hits": self.disk_hits,
+            "disk_writes": self.disk_writes,
+            "disk_flushes": self.disk_flushes,
+            "hit_ratio": round(self.hit_ratio, 3),
+        }
+
+
+class TTLCache:
+    """
+    In-memory LRU cache where every entry expires after a time to live.
+    When the cache is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stats: CacheStats | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.stats.expirations += 1
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float | None = None) -> None:
+        if self.maxsize <= 0:
+            return
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
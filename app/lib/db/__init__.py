@@ -1,20 +1,82 @@
 import asyncio
 import atexit
+import os
 import signal
+from pathlib import Path
 from typing import Any, Sequence
+from urllib.parse import parse_qsl, urlencode
 
 from tortoise import Tortoise, connections, BaseDBAsyncClient
 
+from app.lib.db.migrations import apply_migrations
 from app.logger import logger
 
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite://data/rematch_italia.db")
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+DATABASE_POOL_MIN = int(os.getenv("DATABASE_POOL_MIN", "1"))
+DATABASE_POOL_MAX = int(os.getenv("DATABASE_POOL_MAX", "10"))
+
+# PRAGMA applicati da Tortoise a ogni connessione SQLite
+SQLITE_PROFILES: dict[str, dict[str, str | int]] = {
+    # Rollback journal, as SQLite does out of the box
+    "legacy": {"journal_mode": "DELETE", "synchronous": "FULL"},
+    # Tortoise defaults: WAL journal with synchronous=FULL
+    "default": {},
+    # WAL without an fsync per commit: a crash may lose the last commits, never corrupt the file
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout", "temp_store")
+
+
+def with_params(db_url: str, params: dict[str, str | int]) -> str:
+    """
+    Adds query parameters to a database URL. The parameters already in the URL win over the given ones.
+    """
+    base, _, query = db_url.partition("?")
+    merged = {**params, **dict(parse_qsl(query))}
+    return f"{base}?{urlencode(merged)}" if merged else base
+
+
+def configure_url(db_url: str, sqlite_profile: str = SQLITE_PROFILE) -> str:
+    """
+    Adds the PRAGMA of the given profile to a SQLite URL, or the pool bounds to a Postgres URL.
+    Tortoise passes the query parameters to the client: for SQLite they are run as PRAGMA on connect,
+    for Postgres minsize and maxsize size the asyncpg pool.
+    :raises ValueError: If the SQLite profile does not exist, or the database is neither SQLite nor Postgres,
+        the only dialects the migrations support.
+    """
+    if db_url.startswith("sqlite://"):
+        if sqlite_profile not in SQLITE_PROFILES:
+            raise ValueError(f"Unknown SQLite profile {sqlite_profile!r}, expected one of {', '.join(SQLITE_PROFILES)}")
+        return with_params(db_url, SQLITE_PROFILES[sqlite_profile])
+    if db_url.startswith(("postgres://", "asyncpg://", "psycopg://")):
+        return with_params(db_url, {"minsize": DATABASE_POOL_MIN, "maxsize": DATABASE_POOL_MAX})
+    raise ValueError(f"Unsupported database URL scheme {db_url.partition('://')[0]!r}, "
+                     f"expected sqlite, postgres, asyncpg or psycopg")
+
 
 class DatabaseManager:
     _initialized = False
 
-    def __init__(self, db_url: str, modules: dict, generate_schemas: bool = False):
-        self.db_url = db_url
-        self.modules = modules
+    def __init__(self, db_url: str = DATABASE_URL, modules: dict | None = None, generate_schemas: bool = False,
+                 sqlite_profile: str = SQLITE_PROFILE):
+        """
+        :param db_url: The database URL. Parameters in the URL override the ones of the profile.
+        :param modules: The Tortoise model modules.
+        :param generate_schemas: Whether to create the tables on connect.
+        :param sqlite_profile: The name of the PRAGMA profile in SQLITE_PROFILES, used for SQLite URLs.
+        """
+        self.db_url = configure_url(db_url, sqlite_profile)
+        self.modules = modules or {"models": ["app.lib.db.schemes"]}
         self.generate_schemas = generate_schemas
+        self.sqlite_profile = sqlite_profile
 
         atexit.register(self._sync_close)
         for sig in (signal.SIGINT, signal.SIGTERM):
@@ -22,14 +84,35 @@ class DatabaseManager:
 
     async def connect(self) -> None:
         if not self._initialized:
+            if self.db_url.startswith("sqlite://") and ":memory:" not in self.db_url:
+                # SQLite crea il file ma non la cartella
+                Path(self.db_url.removeprefix("sqlite://").split("?")[0]).parent.mkdir(parents=True, exist_ok=True)
             await Tortoise.init(
                 db_url=self.db_url,
                 modules=self.modules
             )
-            logger.debug("Database connection initialized with URL: %s", self.db_url)
+            logger.debug("Database connection initialized with URL: %s", self.db_url.split("@")[-1])
             if self.generate_schemas:
                 await Tortoise.generate_schemas()
+            await apply_migrations(self.connection)
             DatabaseManager._initialized = True
+            if self.is_sqlite:
+                pragmas = ", ".join(f"{name}={value}" for name, value in (await self.pragmas()).items())
+                logger.info(f"SQLite profile {self.sqlite_profile}: {pragmas}")
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.db_url.startswith("sqlite://")
+
+    async def pragmas(self) -> dict[str, Any]:
+        """
+        :return: The values of the performance PRAGMA on the current SQLite connection.
+        """
+        values = {}
+        for name in SQLITE_PRAGMAS:
+            rows = await self.connection.execute_query_dict(f"PRAGMA {name}")
+            values[name] = next(iter(rows[0].values())) if rows else None
+        return values
 
     @staticmethod
     async def close() -> None:
@@ -66,9 +149,8 @@ class DatabaseManager:
 
 if __name__ == "__main__":
     # Create tables
-    db_path = "sqlite://data/rematch_italia.db"
     modules = {"models": ["schemes"]}
-    db_manager = DatabaseManager(db_url=db_path, modules=modules, generate_schemas=True)
+    db_manager = DatabaseManager(db_url=DATABASE_URL, modules=modules, generate_schemas=True)
     asyncio.run(db_manager.connect())
     logger.info("Database initialized and schemas generated.")
     asyncio.run(db_manager.close())
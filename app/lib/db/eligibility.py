@@ -0,0 +1,63 @@
+from app.lib.db.membership import MembershipIndex, membership as default_membership
+from app.lib.db.schemes import Rank
+from app.logger import logger
+
+
+class EligibilityIndex:
+    """
+    Tells whether a member is in at least one guild with linked ranks.
+    Only their platform links are worth a Rematch profile fetch: for the others no role can change.
+    The guilds of a member come from the membership index, the guilds with linked ranks are loaded
+    from Rank and kept up to date by link_rank.
+    :param membership: The membership index.
+    """
+
+    def __init__(self, membership: MembershipIndex = default_membership):
+        self.membership = membership
+        self.loaded = False
+        self._ranked_guilds: set[int] = set()
+        self.checked = 0
+        self.skipped = 0
+
+    async def load(self) -> None:
+        """
+        Loads the guilds with linked ranks, and the membership index if it is not loaded yet.
+        """
+        if not self.membership.loaded:
+            await self.membership.load()
+        ranked = await Rank.filter(role_id__isnull=False).distinct().values_list("guild_id_id", flat=True)
+        self._ranked_guilds = set(ranked)
+        self.loaded = True
+        logger.info(f"Eligibility index loaded: {len(self._ranked_guilds)} guilds with linked ranks.")
+
+    def is_ranked(self, guild_id: int) -> bool:
+        return guild_id in self._ranked_guilds
+
+    def is_eligible(self, discord_id: int) -> bool:
+        return not self._ranked_guilds.isdisjoint(self.membership.guilds_of(discord_id))
+
+    def guild_ranked(self, guild_id: int) -> None:
+        """
+        Marks a guild that just linked a rank.
+        """
+        if self.loaded:
+            self._ranked_guilds.add(guild_id)
+
+    def record(self, checked: int, skipped: int) -> None:
+        self.checked += checked
+        self.skipped += skipped
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "ranked_guilds": len(self._ranked_guilds),
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skip_rate, 3),
+        }
+
+
+eligibility = EligibilityIndex()
@@ -0,0 +1,67 @@
+from typing import Iterable
+
+from app.lib.db.schemes import GuildMemberSchema
+from app.logger import logger
+
+
+class MembershipIndex:
+    """
+    In-memory map from a member to the guilds they are in, so that the guilds of a member are found
+    in O(1) instead of scanning every guild of the bot.
+    It is loaded from the GuildMemberSchema rows without left_at, warmed with the gateway member cache
+    at startup and kept up to date by the member join and leave events.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._guilds: dict[int, set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    async def load(self) -> None:
+        rows = await GuildMemberSchema.filter(left_at__isnull=True).values_list("discord_id_id", "guild_id_id")
+        self._guilds = {}
+        for discord_id, guild_id in rows:
+            self._guilds.setdefault(discord_id, set()).add(guild_id)
+        self.loaded = True
+        logger.info(f"Membership index loaded: {len(self._guilds)} members, {len(rows)} memberships.")
+
+    def guilds_of(self, discord_id: int) -> set[int]:
+        """
+        :return: The ids of the guilds the member is in. The set must not be modified.
+        """
+        return self._guilds.get(discord_id, set())
+
+    def members_of(self, guild_id: int) -> set[int]:
+        """
+        :return: The ids of the members of the given guild. It scans the whole index.
+        """
+        return {discord_id for discord_id, guilds in self._guilds.items() if guild_id in guilds}
+
+    def add_members(self, guild_id: int, discord_ids: Iterable[int]) -> None:
+        for discord_id in discord_ids:
+            self._guilds.setdefault(discord_id, set()).add(guild_id)
+
+    def member_joined(self, guild_id: int, discord_id: int) -> None:
+        self.add_members(guild_id, (discord_id,))
+
+    def member_left(self, guild_id: int, discord_id: int) -> None:
+        guilds = self._guilds.get(discord_id)
+        if guilds is not None:
+            guilds.discard(guild_id)
+            if not guilds:
+                del self._guilds[discord_id]
+
+    def guild_removed(self, guild_id: int) -> None:
+        for discord_id in self.members_of(guild_id):
+            self.member_left(guild_id, discord_id)
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "members": len(self._guilds),
+            "memberships": sum(len(guilds) for guilds in self._guilds.values()),
+        }
+
+
+membership = MembershipIndex()
@@ -0,0 +1,75 @@
+from tortoise import BaseDBAsyncClient
+from tortoise.utils import generate_schema_for_client
+
+from app.logger import logger
+
+# Tipi SQL per dialetto, come li genera Tortoise con generate_schemas
+COLUMN_TYPES = {
+    "datetime": {"sqlite": "TIMESTAMP", "postgres": "TIMESTAMPTZ"},
+    "varchar32": {"sqlite": "VARCHAR(32)", "postgres": "VARCHAR(32)"},
+    "int": {"sqlite": "INT", "postgres": "INT"},
+}
+
+# (table, column, type) added after the first release. New columns must be nullable.
+COLUMNS: list[tuple[str, str, str]] = [
+    ("platformlink", "last_updated_at", "datetime"),
+    ("platformlink", "rank_hash", "varchar32"),
+    ("platformlink", "next_check_at", "datetime"),
+    ("platformlink", "check_interval", "int"),
+    ("platformlink", "last_rank_change_at", "datetime"),
+    ("platformlink", "lease_run_id", "int"),
+    ("platformlink", "lease_expires_at", "datetime"),
+]
+
+# (index name, table, columns), created if missing on every database
+INDEXES: list[tuple[str, str, tuple[str, ...]]] = [
+    ("idx_platformlink_next_check_at", "platformlink", ("next_check_at",)),
+    ("idx_platformlink_lease_run_id", "platformlink", ("lease_run_id",)),
+    ("idx_guildmember_discord_id_left_at", "guildmember", ("discord_id_id", "left_at")),
+]
+
+
+async def _get_columns(connection: BaseDBAsyncClient, table: str) -> set[str]:
+    """
+    :return: The column names of the table, empty if the table does not exist.
+    """
+    # Non basta una SELECT della colonna: SQLite tratta come stringa un identificatore sconosciuto tra virgolette
+    if connection.capabilities.dialect == "sqlite":
+        rows = await connection.execute_query_dict(f'PRAGMA table_info("{table}")')
+        return {row["name"] for row in rows}
+    # Nome di tabella costante: niente placeholder, che cambiano tra asyncpg ($1) e psycopg (%s)
+    rows = await connection.execute_query_dict(
+        f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table}'"
+    )
+    return {row["column_name"] for row in rows}
+
+
+async def apply_migrations(connection: BaseDBAsyncClient) -> int:
+    """
+    Creates the missing tables, then adds the columns introduced after the tables were created
+    and the indexes not declared on the models.
+    :param connection: The database connection.
+    :return: The number of columns added.
+    """
+    # Solo CREATE TABLE IF NOT EXISTS: le tabelle esistenti non vengono toccate
+    await generate_schema_for_client(connection, safe=True)
+    dialect = connection.capabilities.dialect
+    columns: dict[str, set[str]] = {}
+    added = 0
+    for table, column, column_type in COLUMNS:
+        if table not in columns:
+            columns[table] = await _get_columns(connection, table)
+        if not columns[table] or column in columns[table]:
+            continue
+        sql_type = COLUMN_TYPES[column_type][dialect]
+        await connection.execute_script(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {sql_type} NULL')
+        logger.info(f"Database migration: added column {table}.{column}")
+        added += 1
+    for name, table, index_columns in INDEXES:
+        if table not in columns:
+            columns[table] = await _get_columns(connection, table)
+        if not columns[table]:
+            continue
+        quoted = ", ".join(f'"{column}"' for column in index_columns)
+        await connection.execute_script(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quoted})')
+    return added
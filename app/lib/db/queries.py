@@ -1,10 +1,15 @@
 import datetime
+from typing import Iterable
 
 from discord import Role, Guild, Member, TextChannel, Message
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
 
+from app.lib.db.eligibility import eligibility
+from app.lib.db.rank_plan import rank_plans
 from app.lib.db.schemes import *
 from app.logger import logger
-from app.rematch_tracker import ProfileResponse
+from app.rematch_tracker import Profile
 
 
 async def add_or_get_guild(guild: Guild) -> tuple[GuildSchema, bool]:
@@ -23,7 +28,6 @@ async def add_or_get_guild(guild: Guild) -> tuple[GuildSchema, bool]:
 
 
 async def add_or_get_member(member: Member) -> tuple[MemberSchema, GuildMemberSchema | None, bool]:
-    guild_member_db = None
     db_member, created = await MemberSchema.get_or_create(
         discord_id=member.id,
         defaults={
@@ -42,8 +46,8 @@ async def add_or_get_member(member: Member) -> tuple[MemberSchema, GuildMemberSc
             db_member.avatar_hash = str(member.avatar.url) if member.avatar else None
             db_member.updated_at = datetime.datetime.now(datetime.UTC)
             await db_member.save()
-    if created:
-        guild_member_db = await add_or_get_guild_member(member)
+    # Anche un membro già registrato può entrare in una nuova guild
+    guild_member_db = await add_or_get_guild_member(member)
     return db_member, guild_member_db, created
 
 
@@ -57,8 +61,9 @@ async def add_or_get_guild_member(member: Member) -> GuildMemberSchema | None:
             defaults={"joined_at": member.joined_at or None}
         )
         if not created:
-            if guild_member.joined_at != member.joined_at:
+            if guild_member.joined_at != member.joined_at or guild_member.left_at is not None:
                 guild_member.joined_at = member.joined_at or None
+                guild_member.left_at = None
                 await guild_member.save()
         return guild_member
     logger.warning(f"Guild not found for member {member.name}")
@@ -85,6 +90,21 @@ async def member_left(discord_user: Member, left_at: datetime.datetime, guild_id
     return guild_member
 
 
+async def mark_members_left(guild_id: int, discord_ids: Iterable[int], left_at: datetime.datetime) -> int:
+    """
+    Marks as left the given members of a guild, e.g. the ones who left while the bot was offline.
+    :return:
+        The number of guild members updated.
+    """
+    discord_ids = list(discord_ids)
+    updated = 0
+    for i in range(0, len(discord_ids), 500):
+        updated += await GuildMemberSchema.filter(
+            guild_id_id=guild_id, discord_id_id__in=discord_ids[i:i + 500], left_at__isnull=True
+        ).update(left_at=left_at)
+    return updated
+
+
 async def add_command_permission(
         guild: Guild, command: CommandEnum, role_id: int
 ) -> tuple[CommandPermissionSchema | None, bool | None]:
@@ -185,20 +205,11 @@ async def link_rank(guild: Guild, role: Role, rank: RankLinkEnum) -> tuple[Rank
         if updated:
             rank_link.updated_at = datetime.datetime.now(datetime.UTC)
             await rank_link.save()
+    rank_plans.invalidate(guild.id)
+    eligibility.guild_ranked(guild.id)
     return rank_link, created
 
 
-async def get_role(guild: Guild, rank: RankLinkEnum) -> int | None:
-    db_guild = await GuildSchema.get_or_none(guild_id=guild.id)
-    if not db_guild:
-        logger.error(f"Guild {guild.name} ({guild.id}) not found in database")
-        return None
-    rank_obj = await Rank.get_or_none(guild_id = db_guild, name=rank.name)
-    if not rank_obj:
-        logger.error("Failed to retrieve rank object from database")
-        return None
-    return rank_obj.role_id
-
 async def get_guild(guild: Guild) -> GuildSchema | None:
     db_guild = await GuildSchema.get_or_none(guild_id=guild.id)
     if not db_guild:
@@ -255,7 +266,7 @@ async def remove_persistent_view(
 
 
 async def create_platform_link(
-        member: Member, profile: ProfileResponse
+        member: Member, profile: Profile
 ) -> tuple[PlatformLink | None, bool]:
     member_db = await get_member(member)
     if not member_db:
@@ -270,7 +281,9 @@ async def create_platform_link(
             "platform": platform,
             "cached_rank": cached_rank,
             "last_checked": datetime.datetime.now(datetime.UTC),
-            "rematch_display_name": profile["player"]["display_name"]
+            "rematch_display_name": profile["player"]["display_name"],
+            "last_updated_at": profile.last_updated_at,
+            "rank_hash": profile.rank_hash
         }
     )
     if not created:
@@ -278,6 +291,8 @@ async def create_platform_link(
             platform_link.cached_rank = cached_rank
             platform_link.last_checked = datetime.datetime.now(datetime.UTC)
             platform_link.rematch_display_name = profile["player"]["display_name"]
+            platform_link.last_updated_at = profile.last_updated_at
+            platform_link.rank_hash = profile.rank_hash
             await platform_link.save()
     return platform_link, created
 
@@ -300,40 +315,153 @@ async def update_rank(
     return platform_link
 
 
-async def get_platform_to_update() -> list[PlatformLink]:
+async def save_cached_ranks(platform_links: list[PlatformLink]) -> int:
     """
-    Retrieves a list of platform links where their last checked time is older than 45 minutes.
+    Saves the cached rank of the given platform links, together with the schedule set by the rank change,
+    in a single transaction, with bulk UPDATE ... SET cached_rank = CASE id ... statements instead of one
+    save per link.
     :return:
+        The number of platform links updated.
     """
-    delay = datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=45)
-    platform_links = await PlatformLink.filter(last_checked__lt=delay).all()
-    #platform_links = await PlatformLink.all()
     if not platform_links:
-        logger.info("No platform links found that need updating.")
+        return 0
+    async with in_transaction() as connection:
+        await PlatformLink.bulk_update(
+            platform_links,
+            fields=["cached_rank", "last_rank_change_at", "check_interval", "next_check_at", "last_checked"],
+            batch_size=500,
+            using_db=connection
+        )
+    logger.debug(f"Saved the cached rank of {len(platform_links)} platform links.")
+    return len(platform_links)
+
+
+async def get_check_schedule(
+        unscheduled_only: bool = False
+) -> list[tuple[int, datetime.datetime | None, int | None]]:
+    """
+    Retrieves the next check time and the check interval of the platform links, without loading the full rows.
+    :param unscheduled_only:
+        If True, only the links never scheduled (next_check_at is null) are returned.
+    :return:
+        A list of (platform link id, next_check_at, check_interval) tuples.
+    """
+    query = PlatformLink.filter(next_check_at__isnull=True) if unscheduled_only else PlatformLink.all()
+    return await query.values_list("id", "next_check_at", "check_interval")
+
+
+async def start_run() -> RankUpdateRun:
+    """
+    Adds a rank update run to the run journal.
+    """
+    return await RankUpdateRun.create(status=RunStatusEnum.RUNNING)
+
+
+async def finish_run(run: RankUpdateRun, status: RunStatusEnum, **counters: int) -> RankUpdateRun:
+    """
+    Marks a rank update run as finished and saves its counters.
+    :param run:
+        The run to finish.
+    :param status:
+        The final status of the run.
+    :param counters:
+        Values of the claimed, checked, changed, skipped, failed and updated counters.
+    """
+    run.status = status
+    run.finished_at = datetime.datetime.now(datetime.UTC)
+    for name, value in counters.items():
+        setattr(run, name, value)
+    await run.save()
+    return run
+
+
+async def get_recent_runs(limit: int = 10) -> list[RankUpdateRun]:
+    return await RankUpdateRun.all().order_by("-id").limit(limit)
+
+
+async def recover_interrupted_runs() -> list[int]:
+    """
+    Marks as interrupted the runs left running by a previous process and releases the links they claimed,
+    so that they can be checked again right away.
+    :return:
+        The ids of the released platform links.
+    """
+    run_ids = await RankUpdateRun.filter(status=RunStatusEnum.RUNNING).values_list("id", flat=True)
+    if not run_ids:
         return []
-    logger.info(f"Found {len(platform_links)} platform links that need updating.")
-    # update the last checked time to now
+    link_ids = await PlatformLink.filter(lease_run_id__in=run_ids).values_list("id", flat=True)
+    await PlatformLink.filter(lease_run_id__in=run_ids).update(lease_run_id=None, lease_expires_at=None)
+    await RankUpdateRun.filter(id__in=run_ids).update(status=RunStatusEnum.INTERRUPTED,
+                                                      finished_at=datetime.datetime.now(datetime.UTC))
+    logger.warning(f"Recovered {len(run_ids)} interrupted rank update runs, {len(link_ids)} links released.")
+    return list(link_ids)
+
+
+async def claim_links(link_ids: list[int], run: RankUpdateRun, lease_seconds: float) -> list[PlatformLink]:
+    """
+    Claims the platform links with the given ids for a run.
+    A link is claimed only if no other run holds a valid lease on it, so a link is never processed twice.
+    Ids of deleted links are ignored.
+    The leases are written in a single transaction, then the claimed links are read back with one query.
+    :param link_ids:
+        The ids of the platform links to claim.
+    :param run:
+        The run claiming the links.
+    :param lease_seconds:
+        Duration of the lease. After it a link claimed by a run that died can be claimed again.
+    :return:
+        The claimed platform links.
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    expires_at = now + datetime.timedelta(seconds=lease_seconds)
+    async with in_transaction() as connection:
+        # Blocchi da 500 per restare sotto il limite di variabili di SQLite, con un solo commit
+        for i in range(0, len(link_ids), 500):
+            await PlatformLink.filter(
+                Q(lease_run_id__isnull=True) | Q(lease_expires_at__lt=now),
+                id__in=link_ids[i:i + 500]
+            ).using_db(connection).update(lease_run_id=run.id, lease_expires_at=expires_at)
+    return await PlatformLink.filter(lease_run_id=run.id).all()
+
+
+async def get_existing_links(link_ids: list[int]) -> list[int]:
+    """
+    :return: The ids, among the given ones, of the platform links that still exist.
+    """
+    existing = []
+    for i in range(0, len(link_ids), 500):
+        existing.extend(await PlatformLink.filter(id__in=link_ids[i:i + 500]).values_list("id", flat=True))
+    return existing
+
+
+async def release_leases(platform_links: list[PlatformLink]) -> int:
+    """
+    Marks the given platform links as completed, releasing their lease and saving their next check time.
+    """
+    if not platform_links:
+        return 0
     for link in platform_links:
-        link.last_checked = datetime.datetime.now(datetime.UTC)
-        await link.save()
-    return platform_links
+        link.lease_run_id = None
+        link.lease_expires_at = None
+    await PlatformLink.bulk_update(platform_links, fields=["lease_run_id", "lease_expires_at", "next_check_at"],
+                                   batch_size=500)
+    return len(platform_links)
 
 
-async def check_guild_rank(guild: Guild) -> bool:
+async def save_check_results(platform_links: list[PlatformLink]) -> int:
     """
-    Checks if the guild has linked ranks.
-    :param guild:
-        The guild to check for linked ranks.
+    Saves the outcome of a rank check (profile markers, schedule and lease) of the given platform links
+    with a single bulk update.
     :return:
-        True if the guild has linked ranks, False otherwise.
+        The number of platform links updated.
     """
-    db_guild = await GuildSchema.get_or_none(guild_id=guild.id)
-    if not db_guild:
-        logger.error(f"Guild {guild.name} ({guild.id}) not found in database.")
-        return False
-    ranks = await Rank.filter(guild_id=db_guild).all()
-    if not ranks:
-        logger.info(f"No ranks linked for guild {guild.name} ({guild.id}).")
-        return False
-    logger.info(f"Guild {guild.name} ({guild.id}) has {len(ranks)} linked ranks.")
-    return True
\ No newline at end of file
+    if not platform_links:
+        return 0
+    await PlatformLink.bulk_update(
+        platform_links,
+        fields=["last_updated_at", "rank_hash", "next_check_at", "check_interval", "last_rank_change_at",
+                "last_checked", "lease_run_id", "lease_expires_at"],
+        batch_size=500
+    )
+    logger.debug(f"Saved the rank check results of {len(platform_links)} platform links.")
+    return len(platform_links)
@@ -0,0 +1,71 @@
+from app.lib.db.schemes import Rank, RankLinkEnum
+from app.logger import logger
+
+
+class RankPlan:
+    """
+    The rank to role mapping of a guild.
+    :param guild_id: The id of the guild.
+    :param roles: The role id linked to each rank.
+    """
+
+    def __init__(self, guild_id: int, roles: dict[RankLinkEnum, int]):
+        self.guild_id = guild_id
+        self.roles = roles
+
+    @property
+    def configured(self) -> bool:
+        """
+        True if the guild has at least one linked rank.
+        """
+        return bool(self.roles)
+
+    def role_id(self, rank: RankLinkEnum) -> int | None:
+        return self.roles.get(rank)
+
+
+class RankPlanCache:
+    """
+    Per-guild cache of the rank plans. A plan is loaded with a single query the first time it is needed
+    and kept until link_rank changes the ranks of the guild.
+    """
+
+    def __init__(self):
+        self._plans: dict[int, RankPlan] = {}
+        self.loads = 0
+        self.hits = 0
+        self.invalidations = 0
+
+    async def get(self, guild_id: int) -> RankPlan:
+        plan = self._plans.get(guild_id)
+        if plan is not None:
+            self.hits += 1
+            return plan
+        rows = await Rank.filter(guild_id_id=guild_id, role_id__isnull=False).values_list("name", "role_id")
+        roles = {}
+        for name, role_id in rows:
+            if name in RankLinkEnum.__members__:
+                roles[RankLinkEnum[name]] = role_id
+            else:
+                logger.warning(f"Ignoring unknown rank {name} linked in guild {guild_id}")
+        plan = self._plans[guild_id] = RankPlan(guild_id, roles)
+        self.loads += 1
+        return plan
+
+    def invalidate(self, guild_id: int) -> None:
+        if self._plans.pop(guild_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._plans.clear()
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "guilds": len(self._plans),
+            "loads": self.loads,
+            "hits": self.hits,
+            "invalidations": self.invalidations,
+        }
+
+
+rank_plans = RankPlanCache()
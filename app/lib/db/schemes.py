@@ -31,6 +31,13 @@ class PersistentViewEnum(str, Enum):
     REMATCH_FORM = "rematch_form"
 
 
+class RunStatusEnum(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    INTERRUPTED = "interrupted"
+
+
 class GuildSchema(models.Model):
     guild_id = fields.BigIntField(primary_key=True, unique=True)
     name = fields.CharField(max_length=255, null=True)
@@ -65,9 +72,36 @@ class PlatformLink(models.Model):
     rematch_display_name = fields.CharField(max_length=255, null=False)
     cached_rank = fields.IntEnumField(RankLinkEnum)
     last_checked = fields.DatetimeField(auto_now_add=True, null=True)
+    # Ultimo last_updated_at visto sul profilo Rematch e hash del rank, per saltare i profili non cambiati
+    last_updated_at = fields.DatetimeField(null=True)
+    rank_hash = fields.CharField(max_length=32, null=True)
+    # Prossimo controllo del rank; l'indice viene creato da app.lib.db.migrations
+    next_check_at = fields.DatetimeField(null=True)
+    # Intervallo adattivo tra due controlli, in secondi, e ultimo cambio di lega
+    check_interval = fields.IntField(null=True)
+    last_rank_change_at = fields.DatetimeField(null=True)
+    # Run che ha preso in carico il link e scadenza della presa in carico, null quando il controllo è completato
+    lease_run_id = fields.IntField(null=True)
+    lease_expires_at = fields.DatetimeField(null=True)
     created_at = fields.DatetimeField(auto_now_add=True)
 
 
+class RankUpdateRun(models.Model):
+    id = fields.IntField(primary_key=True, unique=True)
+    status = fields.CharEnumField(RunStatusEnum, null=False, max_length=20, default=RunStatusEnum.RUNNING)
+    started_at = fields.DatetimeField(auto_now_add=True)
+    finished_at = fields.DatetimeField(null=True)
+    claimed = fields.IntField(default=0)
+    checked = fields.IntField(default=0)
+    changed = fields.IntField(default=0)
+    skipped = fields.IntField(default=0)
+    failed = fields.IntField(default=0)
+    updated = fields.IntField(default=0)
+
+    class Meta:
+        table = "rank_update_run"
+
+
 class Rank(models.Model):
     id = fields.IntField(primary_key=True, unique=True)
     guild_id = fields.ForeignKeyField("models.GuildSchema", related_name="ranks",
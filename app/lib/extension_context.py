@@ -4,6 +4,8 @@ from typing import Optional
 from discord import TextChannel, ApplicationContext, Colour, Embed
 from discord.ext.commands import Context
 
+from app.lib.log_digest import log_digest
+
 
 class RematchContext(Context):
     log_channel: Optional[TextChannel]
@@ -19,7 +21,7 @@ class RematchContext(Context):
                 )
                 embed.set_author(name=self.author.name, icon_url=self.author.avatar.url if self.author.avatar else None)
                 embed.set_footer(text="ID: " + str(self.author.id))
-                await self.log_channel.send(embed=embed)
+                log_digest.send(self.log_channel, embed)
 
 
 class RematchApplicationContext(ApplicationContext):
@@ -36,4 +38,4 @@ class RematchApplicationContext(ApplicationContext):
                 )
                 embed.set_author(name=self.author.name, icon_url=self.author.avatar.url if self.author.avatar else None)
                 embed.set_footer(text="ID: " + str(self.author.id))
-                await self.log_channel.send(embed=embed)
+                log_digest.send(self.log_channel, embed)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from discord import HTTPException
+
+from app.logger import logger
+
+ROLE_FANOUT_CONCURRENCY = int(os.getenv("ROLE_FANOUT_CONCURRENCY", "8"))
+ROLE_FANOUT_ATTEMPTS = int(os.getenv("ROLE_FANOUT_ATTEMPTS", "3"))
+ROLE_FANOUT_BACKOFF = float(os.getenv("ROLE_FANOUT_BACKOFF", "1.0"))
+
+
+class FanoutStats:
+    def __init__(self):
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failed = 0
+        self.backoff_time = 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "failed": self.failed,
+            "backoff_time": round(self.backoff_time, 1),
+        }
+
+
+class GuildLane:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.retry_at = 0.0
+
+
+def retry_after(error: HTTPException, attempt: int, backoff: float) -> float:
+    """
+    :return: The delay asked by a 429 answer, or an exponential backoff if the answer has none.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, ValueError):
+        return backoff * 2 ** attempt
+
+
+class GuildFanout:
+    """
+    Runs Discord calls concurrently across guilds with one lane per guild.
+    Calls for the same guild run one at a time, in order, while calls for different guilds run in parallel
+    up to concurrency at once. When a call gets a 429 only its guild backs off for the Retry-After delay
+    and the call is retried, up to attempts times: the other guilds keep going.
+    :param concurrency: Maximum number of calls running at once over all the guilds.
+    :param attempts: Maximum number of attempts of a throttled call.
+    :param backoff: Base delay, in seconds, used when a 429 has no Retry-After.
+    """
+
+    def __init__(self, concurrency: int = ROLE_FANOUT_CONCURRENCY, attempts: int = ROLE_FANOUT_ATTEMPTS,
+                 backoff: float = ROLE_FANOUT_BACKOFF):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.stats = FanoutStats()
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._lanes: dict[int, GuildLane] = {}
+
+    def _lane(self, guild_id: int) -> GuildLane:
+        lane = self._lanes.get(guild_id)
+        if lane is None:
+            lane = self._lanes[guild_id] = GuildLane()
+        return lane
+
+    def backing_off(self) -> int:
+        """
+        :return: The number of guilds waiting for a Retry-After delay.
+        """
+        now = time.monotonic()
+        return sum(1 for lane in self._lanes.values() if lane.retry_at > now)
+
+    async def run(self, guild_id: int, func: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """
+        Runs func(*args) in the lane of the given guild.
+        :return: The result of func.
+        :raises HTTPException: If the call is still throttled after the last attempt, or fails with another status.
+        """
+        lane = self._lane(guild_id)
+        async with lane.lock:
+            for attempt in range(self.attempts):
+                # L'attesa avviene fuori dal semaforo: le altre guild non vengono bloccate
+                wait = lane.retry_at - time.monotonic()
+                if wait > 0:
+                    self.stats.backoff_time += wait
+                    await asyncio.sleep(wait)
+                async with self._semaphore:
+                    self.stats.calls += 1
+                    try:
+                        return await func(*args)
+                    except HTTPException as e:
+                        if e.status != 429:
+                            self.stats.failed += 1
+                            raise
+                        self.stats.throttled += 1
+                        delay = retry_after(e, attempt, self.backoff)
+                        lane.retry_at = max(lane.retry_at, time.monotonic() + delay)
+                        if attempt == self.attempts - 1:
+                            self.stats.failed += 1
+                            raise
+                        self.stats.retries += 1
+                        logger.warning(f"Guild {guild_id} is rate limited, retrying in {delay:.1f}s "
+                                       f"(attempt {attempt + 1}/{self.attempts}).")
+                    except Exception:
+                        self.stats.failed += 1
+                        raise
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {**self.stats.as_dict(), "guilds": len(self._lanes), "backing_off": self.backing_off()}
@@ -0,0 +1,214 @@
+import asyncio
+import datetime
+import os
+import time
+
+from discord import Colour, Embed, TextChannel
+
+from app.logger import logger
+
+LOG_DIGEST_WINDOW = float(os.getenv("LOG_DIGEST_WINDOW", 30))
+LOG_CHANNEL_INTERVAL = float(os.getenv("LOG_CHANNEL_INTERVAL", 1.0))
+LOG_DIGEST_PAGE_LINES = int(os.getenv("LOG_DIGEST_PAGE_LINES", 20))
+
+# Limiti di Discord per un singolo messaggio
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_MESSAGE_EMBED_CHARS = 6000
+MAX_DESCRIPTION_CHARS = 4096
+MAX_MESSAGE_CHARS = 2000
+
+
+class LogDigestStats:
+    def __init__(self):
+        self.entries = 0
+        self.embeds = 0
+        self.messages = 0
+        self.failures = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "entries": self.entries,
+            "embeds": self.embeds,
+            "messages": self.messages,
+            "failures": self.failures,
+        }
+
+
+def digest_embeds(title: str, lines: list[str], page_lines: int, colour: Colour) -> list[Embed]:
+    """
+    Builds the pages of a digest, each page holds at most page_lines lines.
+    :param title: The title of the digest, the page number is appended when there is more than one page.
+    :param lines: The lines of the digest.
+    :param page_lines: The maximum number of lines of a page.
+    :param colour: The colour of the embeds.
+    :return: One embed per page.
+    """
+    pages = []
+    current = []
+    size = 0
+    for line in lines:
+        line = line[:MAX_DESCRIPTION_CHARS - 1]
+        if current and (len(current) >= page_lines or size + len(line) + 1 > MAX_DESCRIPTION_CHARS):
+            pages.append(current)
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pages.append(current)
+
+    embeds = []
+    now = datetime.datetime.now(datetime.UTC)
+    for number, page in enumerate(pages, 1):
+        embed = Embed(
+            title=title if len(pages) == 1 else f"{title} ({number}/{len(pages)})",
+            description="\n".join(page),
+            color=colour,
+            timestamp=now
+        )
+        embed.set_footer(text=f"{len(lines)} entries | © Rematch Italia. All rights reserved.")
+        embeds.append(embed)
+    return embeds
+
+
+def chunk_lines(lines: list[str], limit: int = MAX_MESSAGE_CHARS) -> list[str]:
+    """
+    Joins the lines into as few messages as possible, each of at most limit characters.
+    A line is never split between two messages, longer lines are truncated.
+    """
+    messages = []
+    current = []
+    size = 0
+    for line in lines:
+        line = line[:limit]
+        if current and size + len(line) > limit:
+            messages.append("\n".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        messages.append("\n".join(current))
+    return messages
+
+
+def group_messages(embeds: list[Embed]) -> list[list[Embed]]:
+    """
+    Packs the embeds into as few messages as the Discord limits allow.
+    """
+    messages = []
+    current = []
+    size = 0
+    for embed in embeds:
+        length = len(embed)
+        if current and (len(current) >= MAX_EMBEDS_PER_MESSAGE or size + length > MAX_MESSAGE_EMBED_CHARS):
+            messages.append(current)
+            current = []
+            size = 0
+        current.append(embed)
+        size += length
+    if current:
+        messages.append(current)
+    return messages
+
+
+class LogDigestDispatcher:
+    """
+    Batches the messages sent to the guild log channels.
+    Digest lines are aggregated per channel and title into paginated embeds, single embeds are packed
+    up to ten per message. Everything queued is flushed in the background after window seconds, or
+    earlier with flush_soon, and two messages to the same channel are at least channel_interval seconds apart.
+    :param window: Seconds the entries are kept before being flushed.
+    :param channel_interval: Minimum seconds between two messages sent to the same channel.
+    :param page_lines: Maximum number of lines of a digest page.
+    """
+
+    def __init__(self, window: float = LOG_DIGEST_WINDOW, channel_interval: float = LOG_CHANNEL_INTERVAL,
+                 page_lines: int = LOG_DIGEST_PAGE_LINES):
+        self.window = window
+        self.channel_interval = channel_interval
+        self.page_lines = page_lines
+        self.stats = LogDigestStats()
+        self._channels: dict[int, TextChannel] = {}
+        self._digests: dict[int, dict[tuple[str, int], list[str]]] = {}
+        self._embeds: dict[int, list[Embed]] = {}
+        self._last_sent: dict[int, float] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._timer: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return sum(len(lines) for digests in self._digests.values() for lines in digests.values()) + \
+            sum(len(embeds) for embeds in self._embeds.values())
+
+    def add(self, channel: TextChannel, title: str, line: str, colour: Colour | None = None) -> None:
+        """
+        Queues a line of the digest with the given title.
+        """
+        colour = colour or Colour.default()
+        self._channels[channel.id] = channel
+        self._digests.setdefault(channel.id, {}).setdefault((title, colour.value), []).append(line)
+        self.stats.entries += 1
+        self._schedule()
+
+    def send(self, channel: TextChannel, embed: Embed) -> None:
+        """
+        Queues an embed, it is sent together with the other embeds queued for the same channel.
+        """
+        self._channels[channel.id] = channel
+        self._embeds.setdefault(channel.id, []).append(embed)
+        self.stats.entries += 1
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        await self.flush()
+
+    def flush_soon(self) -> None:
+        """
+        Flushes the queued entries in the background, without waiting for the window to end.
+        """
+        if not self._channels:
+            return
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """
+        Sends every queued entry and waits until it is delivered.
+        """
+        channels, self._channels = self._channels, {}
+        digests, self._digests = self._digests, {}
+        queued, self._embeds = self._embeds, {}
+        deliveries = []
+        for channel_id, channel in channels.items():
+            embeds = []
+            for (title, colour), lines in digests.get(channel_id, {}).items():
+                embeds.extend(digest_embeds(title, lines, self.page_lines, Colour(colour)))
+            embeds.extend(queued.get(channel_id, []))
+            deliveries.append(self._deliver(channel, embeds))
+        await asyncio.gather(*deliveries)
+
+    async def _deliver(self, channel: TextChannel, embeds: list[Embed]) -> None:
+        lock = self._locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            for message in group_messages(embeds):
+                wait = self._last_sent.get(channel.id, 0.0) + self.channel_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    await channel.send(embeds=message)
+                    self.stats.messages += 1
+                    self.stats.embeds += len(message)
+                except Exception as e:
+                    self.stats.failures += 1
+                    logger.error(f"Failed to send {len(message)} log embeds to channel {channel.id}: {e}")
+                self._last_sent[channel.id] = time.monotonic()
+
+
+log_digest = LogDigestDispatcher()
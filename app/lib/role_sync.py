@@ -0,0 +1,58 @@
+from typing import Iterable
+
+from discord import Role
+
+
+class RoleSyncStats:
+    """
+    Counters of the rank role reconciliation.
+    calls_avoided counts the REST calls saved by sending a single member edit where the old update
+    made both a remove_roles and an add_roles call; unchanged counts the members left untouched.
+    """
+
+    def __init__(self):
+        self.edits = 0
+        self.unchanged = 0
+        self.calls_avoided = 0
+
+    def record(self, legacy_calls: int) -> None:
+        """
+        :param legacy_calls: The REST calls the remove_roles/add_roles update would have made.
+            The member is edited with a single call only when it is not 0.
+        """
+        if legacy_calls:
+            self.edits += 1
+            self.calls_avoided += legacy_calls - 1
+        else:
+            self.unchanged += 1
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "edits": self.edits,
+            "unchanged": self.unchanged,
+            "calls_avoided": self.calls_avoided,
+        }
+
+
+def target_roles(current: Iterable[Role], rank_roles: Iterable[Role], new_role: Role | None) -> tuple[list[Role], int]:
+    """
+    Computes the full role set of a member after a rank change.
+    Every rank role other than new_role is dropped, new_role is added, the other roles are kept.
+    The @everyone role is left out since it can not be assigned.
+    :param current: The roles the member has now.
+    :param rank_roles: The roles linked to a rank in the guild.
+    :param new_role: The role of the new rank, None if the rank is not linked.
+    :return: The target roles and the number of REST calls a remove_roles/add_roles update would need,
+        0 when the member already has exactly the right rank role.
+    """
+    current = [role for role in current if not role.is_default()]
+    stale = {role.id for role in rank_roles if new_role is None or role.id != new_role.id}
+    kept = [role for role in current if role.id not in stale]
+    legacy_calls = int(len(kept) != len(current))
+    if new_role is not None and all(role.id != new_role.id for role in kept):
+        kept.append(new_role)
+        legacy_calls += 1
+    return kept, legacy_calls
+
+
+role_sync_stats = RoleSyncStats()
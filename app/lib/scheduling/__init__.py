@@ -0,0 +1,3 @@
+from app.lib.scheduling.due_queue import DueQueue, jittered_interval, to_timestamp, to_datetime
+from app.lib.scheduling.policy import AdaptivePollingPolicy, interval_distribution
+from app.lib.scheduling.run_stats import RunStats, RunStatsHistory, StageStats
@@ -0,0 +1,109 @@
+import datetime
+import heapq
+import random
+
+
+def jittered_interval(interval: float, jitter: float, rng: random.Random | None = None) -> float:
+    """
+    Returns the interval moved randomly by at most jitter * interval, so that links checked together
+    drift apart instead of staying in the same batch forever.
+    :param interval: The interval in seconds.
+    :param jitter: The maximum relative deviation, between 0 and 1.
+    """
+    rng = rng or random
+    return interval * rng.uniform(1 - jitter, 1 + jitter)
+
+
+def to_timestamp(value: datetime.datetime | None) -> float | None:
+    return value.timestamp() if value is not None else None
+
+
+def to_datetime(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.UTC)
+
+
+class DueQueue:
+    """
+    Min-heap of platform link ids ordered by the time of their next check.
+    Rescheduling a link pushes a new entry and the outdated one is dropped when it reaches the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, link_id: int) -> bool:
+        return link_id in self._due
+
+    def push(self, link_id: int, due_at: float) -> None:
+        """
+        Schedules a link, replacing its previous due time if any.
+        :param link_id: The id of the platform link.
+        :param due_at: The time of the next check, as a UNIX timestamp.
+        """
+        self._due[link_id] = due_at
+        heapq.heappush(self._heap, (due_at, link_id))
+        # Troppe voci obsolete: si ricostruisce l'heap
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(due, link) for link, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, link_id: int) -> None:
+        self._due.pop(link_id, None)
+
+    def due_at(self, link_id: int) -> float | None:
+        return self._due.get(link_id)
+
+    def _is_current(self, entry: tuple[float, int]) -> bool:
+        due_at, link_id = entry
+        return self._due.get(link_id) == due_at
+
+    def next_due(self) -> float | None:
+        """
+        :return: The due time of the first link to check, or None if the queue is empty.
+        """
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, limit: int | None = None) -> list[int]:
+        """
+        Removes and returns the links due at the given time, the most overdue first.
+        :param now: The current time, as a UNIX timestamp.
+        :param limit: The maximum number of links to return.
+        """
+        ret = []
+        while self._heap and (limit is None or len(ret) < limit):
+            entry = self._heap[0]
+            if not self._is_current(entry):
+                heapq.heappop(self._heap)
+                continue
+            if entry[0] > now:
+                break
+            heapq.heappop(self._heap)
+            del self._due[entry[1]]
+            ret.append(entry[1])
+        return ret
+
+    def spread_overdue(self, now: float, window: float, rng: random.Random | None = None) -> int:
+        """
+        Reschedules the overdue links at random times between now and now + window.
+        Used after restarts and downtimes, when many links are overdue at once.
+        :return: The number of links rescheduled.
+        """
+        rng = rng or random
+        overdue = [link_id for link_id, due_at in self._due.items() if due_at < now]
+        for link_id in overdue:
+            self.push(link_id, now + rng.uniform(0, window))
+        return len(overdue)
+
+    def as_dict(self, now: float) -> dict[str, int | float | None]:
+        next_due = self.next_due()
+        return {
+            "scheduled": len(self),
+            "overdue": sum(1 for due_at in self._due.values() if due_at <= now),
+            "next_in": round(max(0.0, next_due - now), 1) if next_due is not None else None,
+        }
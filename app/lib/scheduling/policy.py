@@ -0,0 +1,65 @@
+import datetime
+
+# Limiti superiori dei bucket della distribuzione, in secondi
+INTERVAL_BUCKETS: tuple[tuple[str, float], ...] = (
+    ("<=15m", 900),
+    ("<=45m", 2700),
+    ("<=2h", 7200),
+    ("<=6h", 21600),
+    (">6h", float("inf")),
+)
+
+
+class AdaptivePollingPolicy:
+    """
+    Chooses how long to wait before checking a platform link again.
+    Players who just changed league are checked every min_interval. The interval of the others grows by
+    backoff at every check without changes: up to base_interval for active players, who changed league or
+    whose profile was updated upstream in the last active_window seconds, and up to max_interval otherwise.
+    Dormant accounts, whose profile has not been updated upstream for dormant_after seconds, go straight
+    to max_interval.
+    """
+
+    def __init__(self, base_interval: float = 2700, min_interval: float = 900, max_interval: float = 21600,
+                 backoff: float = 1.5, dormant_after: float = 14 * 86400, active_window: float = 86400):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.backoff = backoff
+        self.dormant_after = dormant_after
+        self.active_window = active_window
+
+    def next_interval(self, current: float | None, rank_changed: bool, now: datetime.datetime,
+                      last_updated_at: datetime.datetime | None = None,
+                      last_rank_change_at: datetime.datetime | None = None) -> float:
+        """
+        :param current: The interval used for the last check, None for links never checked.
+        :param rank_changed: Whether the league changed in this check.
+        :param now: The time of the check.
+        :param last_updated_at: The last_updated_at of the Rematch profile.
+        :param last_rank_change_at: When the league changed for the last time.
+        :return: The interval before the next check, in seconds.
+        """
+        if rank_changed:
+            return self.min_interval
+        updated_ago = (now - last_updated_at).total_seconds() if last_updated_at is not None else None
+        if updated_ago is not None and updated_ago > self.dormant_after:
+            return self.max_interval
+        changed_ago = (now - last_rank_change_at).total_seconds() if last_rank_change_at is not None else None
+        active = any(ago is not None and ago <= self.active_window for ago in (updated_ago, changed_ago))
+        cap = self.base_interval if active else self.max_interval
+        interval = (current or self.base_interval) * self.backoff
+        return max(self.min_interval, min(interval, cap))
+
+
+def interval_distribution(intervals) -> dict[str, int]:
+    """
+    Counts the given check intervals, in seconds, by INTERVAL_BUCKETS.
+    """
+    distribution = {label: 0 for label, _ in INTERVAL_BUCKETS}
+    for interval in intervals:
+        for label, upper in INTERVAL_BUCKETS:
+            if interval <= upper:
+                distribution[label] += 1
+                break
+    return distribution
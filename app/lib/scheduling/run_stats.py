@@ -0,0 +1,175 @@
+import asyncio
+import datetime
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+LATENCY_BUCKETS: tuple[tuple[str, float], ...] = (
+    ("<=10ms", 0.01),
+    ("<=50ms", 0.05),
+    ("<=100ms", 0.1),
+    ("<=250ms", 0.25),
+    ("<=500ms", 0.5),
+    ("<=1s", 1.0),
+    ("<=2.5s", 2.5),
+    ("<=5s", 5.0),
+    (">5s", float("inf")),
+)
+
+
+class StageStats:
+    """
+    Counters and latency histogram of a stage of a rank update run.
+    items counts the items the stage handled, passed the ones it forwarded to the next stage,
+    dropped the ones it filtered out and errors the ones it failed on.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.passed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds: float, items: int = 1) -> None:
+        """
+        Records a call of the stage that handled the given number of items.
+        """
+        self.items += items
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        for i, (_, upper) in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper:
+                self.histogram[i] += 1
+                break
+
+    @contextmanager
+    def timer(self, items: int = 1) -> Iterator[None]:
+        """
+        Times the wrapped block with observe. An exception raised by the block is counted as an error.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors += items
+            raise
+        finally:
+            self.observe(time.perf_counter() - start, items)
+
+    @property
+    def calls(self) -> int:
+        return sum(self.histogram)
+
+    def percentile(self, fraction: float) -> float | None:
+        """
+        :return: The upper bound of the histogram bucket holding the given fraction of the calls,
+            None if the stage was never called.
+        """
+        calls = self.calls
+        if not calls:
+            return None
+        seen = 0
+        for count, (_, upper) in zip(self.histogram, LATENCY_BUCKETS):
+            seen += count
+            if seen >= fraction * calls:
+                return upper if upper != float("inf") else self.max_time
+        return self.max_time
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "passed": self.passed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "calls": self.calls,
+            "total_time": round(self.total_time, 4),
+            "max_time": round(self.max_time, 4),
+            "histogram": {label: count for count, (label, _) in zip(self.histogram, LATENCY_BUCKETS) if count},
+        }
+
+    def __str__(self) -> str:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        latency = f", p50<={p50:.3g}s p95<={p95:.3g}s" if p50 is not None else ""
+        return (f"{self.items} in, {self.passed} out, {self.dropped} dropped, {self.errors} errors, "
+                f"{self.total_time:.2f}s total{latency}")
+
+
+class RunStats:
+    """
+    Per-stage statistics of a rank update run, together with the counters of the other components of the run.
+    :param run_id: The id of the run in the run journal.
+    """
+
+    def __init__(self, run_id: int | None):
+        self.run_id = run_id
+        self.started_at = datetime.datetime.now(datetime.UTC)
+        self.duration: float | None = None
+        self.stages: dict[str, StageStats] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+        self._start = time.perf_counter()
+
+    def stage(self, name: str) -> StageStats:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats(name)
+        return stage
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._start
+
+    def as_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(),
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "stages": {name: stage.as_dict() for name, stage in self.stages.items()},
+            "counters": self.counters,
+        }
+
+
+class RunStatsHistory:
+    """
+    Ring buffer with the statistics of the last rank update runs.
+    :param maxlen: The number of runs kept.
+    :param dump_path: If given, every finished run is appended to this file as a JSON line.
+    """
+
+    def __init__(self, maxlen: int = 20, dump_path: str | Path | None = None):
+        self.runs: deque[RunStats] = deque(maxlen=maxlen)
+        self.dump_path = Path(dump_path) if dump_path else None
+
+    def __len__(self) -> int:
+        return len(self.runs)
+
+    def __iter__(self) -> Iterator[RunStats]:
+        return iter(self.runs)
+
+    def start(self, run_id: int | None) -> RunStats:
+        stats = RunStats(run_id)
+        self.runs.append(stats)
+        return stats
+
+    async def finish(self, stats: RunStats) -> None:
+        """
+        Closes the statistics of a run and appends them to dump_path, on a worker thread.
+        :raise OSError: If the file cannot be written.
+        """
+        stats.finish()
+        if self.dump_path is not None:
+            await asyncio.to_thread(self._dump, json.dumps(stats.as_dict()) + "\n")
+
+    def _dump(self, line: str) -> None:
+        self.dump_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.dump_path.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+    @property
+    def latest(self) -> RunStats | None:
+        return self.runs[-1] if self.runs else None
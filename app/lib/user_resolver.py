@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING
+
+from discord import HTTPException, NotFound, User
+
+from app.lib.cache import TTLCache
+from app.logger import logger
+
+if TYPE_CHECKING:
+    from discord import Client
+
+USER_FETCH_CONCURRENCY = int(os.getenv("USER_FETCH_CONCURRENCY", "4"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "3600"))
+USER_NEGATIVE_TTL = int(os.getenv("USER_NEGATIVE_TTL", "21600"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+
+class ResolverStats:
+    def __init__(self):
+        self.cache_hits = 0
+        self.negative_hits = 0
+        self.rest_calls = 0
+        self.not_found = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "cache_hits": self.cache_hits,
+            "negative_hits": self.negative_hits,
+            "rest_calls": self.rest_calls,
+            "not_found": self.not_found,
+            "errors": self.errors,
+            "throttled": self.throttled,
+        }
+
+
+class UserResolver:
+    """
+    Resolves discord ids to users, going to the REST API only for the users missing from the caches.
+    Users are looked up in the gateway cache first, which holds every member of the guilds of the bot,
+    then in a cache of the users already fetched. Ids that do not exist anymore are cached as missing for
+    USER_NEGATIVE_TTL seconds. At most USER_FETCH_CONCURRENCY fetches run at once, and after a 429 every
+    fetch waits until the Retry-After delay is over.
+    :param client: The bot.
+    """
+
+    def __init__(self, client: "Client", concurrency: int = USER_FETCH_CONCURRENCY):
+        self.client = client
+        self.stats = ResolverStats()
+        self.run_stats = ResolverStats()
+        self._fetched = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self._missing = TTLCache(USER_CACHE_SIZE, USER_NEGATIVE_TTL)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._retry_at = 0.0
+
+    def _count(self, counter: str) -> None:
+        for stats in (self.stats, self.run_stats):
+            setattr(stats, counter, getattr(stats, counter) + 1)
+
+    def new_run(self) -> None:
+        """
+        Resets the per-run counters.
+        """
+        self.run_stats = ResolverStats()
+
+    async def resolve(self, discord_id: int) -> User | None:
+        """
+        :return: The user, or None if it does not exist or can not be fetched.
+        """
+        user = self.client.get_user(discord_id) or self._fetched.get(discord_id)
+        if user is not None:
+            self._count("cache_hits")
+            return user
+        if self._missing.get(discord_id):
+            self._count("negative_hits")
+            return None
+
+        async with self._semaphore:
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._count("rest_calls")
+            try:
+                user = await self.client.fetch_user(discord_id)
+            except NotFound:
+                self._count("not_found")
+                self._missing.set(discord_id, True)
+                logger.warning(f"User {discord_id} not found, skipped for {USER_NEGATIVE_TTL}s.")
+                return None
+            except HTTPException as e:
+                self._count("errors")
+                if e.status == 429:
+                    self._count("throttled")
+                    retry_after = float(e.response.headers.get("Retry-After", 1)) if e.response else 1.0
+                    self._retry_at = max(self._retry_at, time.monotonic() + retry_after)
+                logger.error(f"Failed to fetch user {discord_id}: {e}")
+                return None
+            except Exception as e:
+                self._count("errors")
+                logger.error(f"Failed to fetch user {discord_id}: {e}", exc_info=True)
+                return None
+        self._fetched.set(discord_id, user)
+        return user
@@ -1,5 +1,6 @@
 import asyncio
-from typing import Optional
+import time
+from typing import Any, Callable, Optional
 
 from app.logger import logger
 import aiohttp
@@ -7,8 +8,14 @@ import os
 
 from app.lib.db.schemes import PlatformEnum
 from app.rematch_tracker.structures import ResolveResponse
-from app.rematch_tracker.structures import ProfileResponse, ProfilePlayer, ProfileRank
+from app.rematch_tracker.structures import ProfileResponse, ProfilePlayer, ProfileRank, Profile
 from app.rematch_tracker.http_session import get_session
+from app.rematch_tracker.cache import TwoTierCache, SqliteCacheStore, CacheStats
+from app.rematch_tracker.singleflight import SingleFlight
+from app.rematch_tracker.rate_limiter import AdaptiveRateLimiter, RequestPriority, parse_retry_after
+from app.rematch_tracker.circuit_breaker import CircuitBreaker, CircuitState
+from app.rematch_tracker.retry import RetryPolicy
+from app.rematch_tracker import decoder
 
 RESOLVE_URL = os.getenv("RESOLVE_URL", None)
 PROFILE_URL = os.getenv("PROFILE_URL", None)
@@ -17,45 +24,263 @@ if not RESOLVE_URL or not PROFILE_URL:
     logger.error("RESOLVE_URL or PROFILE_RUL not found in environment variables. Please set it in your .env file.")
     raise RuntimeError("RESOLVE_URL or PROFILE_URL not found in environment variables. Please set it in your .env file.")
 
+REMATCH_CACHE_SIZE = int(os.getenv("REMATCH_CACHE_SIZE", "5000"))
+REMATCH_PROFILE_CACHE_TTL = int(os.getenv("REMATCH_PROFILE_CACHE_TTL", "300"))
+REMATCH_RESOLVE_CACHE_TTL = int(os.getenv("REMATCH_RESOLVE_CACHE_TTL", "86400"))
+REMATCH_CACHE_DB = os.getenv("REMATCH_CACHE_DB", None)
+REMATCH_CACHE_FLUSH_DELAY = float(os.getenv("REMATCH_CACHE_FLUSH_DELAY", "1.0"))
+REMATCH_RATE_LIMIT = float(os.getenv("REMATCH_RATE_LIMIT", "5"))
+REMATCH_RATE_LIMIT_MIN = float(os.getenv("REMATCH_RATE_LIMIT_MIN", "0.5"))
+REMATCH_RATE_LIMIT_MAX = float(os.getenv("REMATCH_RATE_LIMIT_MAX", "10"))
+REMATCH_RATE_BURST = float(os.getenv("REMATCH_RATE_BURST", "10"))
+REMATCH_INTERACTIVE_SHARE = float(os.getenv("REMATCH_INTERACTIVE_SHARE", "0.2"))
+REMATCH_BREAKER_FAILURES = int(os.getenv("REMATCH_BREAKER_FAILURES", "5"))
+REMATCH_BREAKER_RECOVERY = float(os.getenv("REMATCH_BREAKER_RECOVERY", "60"))
+REMATCH_RETRY_ATTEMPTS = int(os.getenv("REMATCH_RETRY_ATTEMPTS", "3"))
+REMATCH_RETRY_DEADLINE = float(os.getenv("REMATCH_RETRY_DEADLINE", "15"))
+REMATCH_QUEUE_TIMEOUT = float(os.getenv("REMATCH_QUEUE_TIMEOUT", "60"))
+
+_cache_store = SqliteCacheStore(REMATCH_CACHE_DB) if REMATCH_CACHE_DB else None
+profile_cache = TwoTierCache("profile", REMATCH_CACHE_SIZE, REMATCH_PROFILE_CACHE_TTL, _cache_store,
+                             dump=Profile.to_dict, load=Profile.from_dict, flush_delay=REMATCH_CACHE_FLUSH_DELAY)
+resolve_cache = TwoTierCache("resolve", REMATCH_CACHE_SIZE, REMATCH_RESOLVE_CACHE_TTL, _cache_store,
+                             flush_delay=REMATCH_CACHE_FLUSH_DELAY)
+profile_flight = SingleFlight("profile")
+resolve_flight = SingleFlight("resolve")
+rate_limiter = AdaptiveRateLimiter(
+    rate=REMATCH_RATE_LIMIT,
+    min_rate=REMATCH_RATE_LIMIT_MIN,
+    max_rate=REMATCH_RATE_LIMIT_MAX,
+    capacity=REMATCH_RATE_BURST,
+    reserved_share=REMATCH_INTERACTIVE_SHARE
+)
+resolve_breaker = CircuitBreaker("resolve", REMATCH_BREAKER_FAILURES, REMATCH_BREAKER_RECOVERY)
+profile_breaker = CircuitBreaker("profile", REMATCH_BREAKER_FAILURES, REMATCH_BREAKER_RECOVERY)
+retry_policy = RetryPolicy(max_attempts=REMATCH_RETRY_ATTEMPTS, deadline=REMATCH_RETRY_DEADLINE)
+
+
+def get_cache_stats() -> dict[str, CacheStats]:
+    """
+    Returns the counters of the Rematch response caches.
+    """
+    return {"resolve": resolve_cache.stats, "profile": profile_cache.stats}
+
+
+async def flush_caches() -> None:
+    """
+    Writes the queued entries of the Rematch response caches to the disk tier.
+    """
+    for cache in (resolve_cache, profile_cache):
+        await cache.flush()
+
+
+async def close_caches() -> None:
+    """
+    Flushes the Rematch response caches and closes their disk tier. Called once, when the bot shuts down.
+    """
+    await flush_caches()
+    if _cache_store is not None:
+        _cache_store.close()
+
+
+def get_single_flight_stats() -> dict[str, SingleFlight]:
+    """
+    Returns the request coalescing layers, with their counters.
+    """
+    return {"resolve": resolve_flight, "profile": profile_flight}
+
+
+def get_circuit_breakers() -> dict[str, CircuitBreaker]:
+    """
+    Returns the circuit breakers of the Rematch endpoints, with their state.
+    """
+    return {"resolve": resolve_breaker, "profile": profile_breaker}
+
+
+def _record_response(response: aiohttp.ClientResponse, breaker: CircuitBreaker) -> None:
+    """
+    Feeds the rate limiter and the endpoint circuit breaker with the outcome of a request.
+    """
+    if response.status == 429:
+        rate_limiter.on_throttle(parse_retry_after(response.headers.get("Retry-After")))
+        breaker.release()
+    elif response.status >= 500:
+        rate_limiter.on_error()
+        breaker.record_failure()
+    else:
+        rate_limiter.on_success()
+        breaker.record_success()
+
+
+async def _post(
+        url: str,
+        payload: dict,
+        breaker: CircuitBreaker,
+        priority: RequestPriority,
+        label: str,
+        parse: Callable[[bytes], Any] | None = None
+) -> tuple[int, Any] | None:
+    """
+    Sends a request to the Rematch API, retrying transient failures according to retry_policy.
+    Every attempt goes through the endpoint circuit breaker and the rate limiter,
+    and the retries never last longer than the policy deadline, counted from the first attempt.
+    The wait for the first attempt, e.g. during a 429 pause, is bounded by REMATCH_QUEUE_TIMEOUT.
+    :param url: The endpoint URL.
+    :param payload: The JSON payload.
+    :param breaker: The circuit breaker of the endpoint.
+    :param priority: The priority of the request for the rate limiter.
+    :param label: A description of the request used in the logs.
+    :param parse: Decodes the body of a 200 response, instead of the JSON decoder.
+    :return: The status and the decoded body of the last response,
+        or None if the circuit breaker refused the request.
+    :raise aiohttp.ClientError: If the last attempt failed with a client error.
+    :raise asyncio.TimeoutError: If the last attempt timed out or the deadline has been exceeded.
+    """
+    headers = {"Content-Type": "application/json"}
+    session = get_session()
+    deadline: float | None = None
+    attempt = 0
+
+    while True:
+        if not breaker.allow_request():
+            logger.warning(f"{breaker.name.capitalize()} circuit is {breaker.state.value}, skipping {label} "
+                           f"(retry in {breaker.retry_in:.0f}s)")
+            return None
+
+        try:
+            if deadline is None:
+                # Il budget parte dal primo invio: l'attesa in coda al rate limiter ha un suo limite
+                await asyncio.wait_for(rate_limiter.acquire(priority), REMATCH_QUEUE_TIMEOUT)
+                deadline = time.monotonic() + retry_policy.deadline
+            else:
+                await asyncio.wait_for(rate_limiter.acquire(priority), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            breaker.release()
+            if deadline is None:
+                logger.warning(f"{label}: queued for more than {REMATCH_QUEUE_TIMEOUT:.0f}s for the rate limiter")
+            else:
+                logger.warning(f"{label}: deadline exceeded while waiting for the rate limiter")
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+
+        delay = retry_policy.backoff(attempt)
+        try:
+            timeout = aiohttp.ClientTimeout(total=max(0.1, deadline - time.monotonic()))
+            async with session.post(url, json=payload, headers=headers, timeout=timeout) as response:
+                _record_response(response, breaker)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                retryable = retry_policy.is_retryable_status(response.status)
+                if not retryable or not _can_retry(attempt, max(delay, retry_after or 0), deadline):
+                    # Il body viene letto e decodificato una sola volta, anche nei percorsi di errore
+                    body = await response.read()
+                    if response.status == 200 and parse is not None:
+                        data = parse(body)
+                    elif response.status == 200:
+                        data = decoder.loads(body) if body else {}
+                    else:
+                        data = _decode_error_body(body, response.status, label)
+                    if attempt:
+                        if retryable:
+                            retry_policy.exhausted += 1
+                        elif 200 <= response.status < 300:
+                            retry_policy.recovered += 1
+                    return response.status, data
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                logger.debug(f"{label}: retryable status {response.status} on attempt {attempt + 1}, "
+                             f"retrying in {delay:.2f}s")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if isinstance(e, aiohttp.ClientResponseError):
+                breaker.release()
+            else:
+                rate_limiter.on_error()
+                breaker.record_failure()
+            if not retry_policy.is_retryable_error(e) or not _can_retry(attempt, delay, deadline):
+                if attempt:
+                    retry_policy.exhausted += 1
+                raise
+            logger.debug(f"{label}: {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+        except Exception:
+            breaker.release()
+            raise
+
+        retry_policy.retries += 1
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def _decode_error_body(body: bytes, status: int, label: str) -> dict[str, Any]:
+    """
+    Decodes the body of a non-200 response. Proxies may answer with HTML or plain text instead of JSON.
+    :return: The decoded body, or the start of the raw body as the error if it is not JSON.
+    """
+    if not body:
+        return {}
+    try:
+        data = decoder.loads(body)
+    except ValueError as e:
+        logger.warning(f"{label}: undecodable body with status {status}: {e}")
+        return {"error": body[:200].decode("utf-8", errors="replace")}
+    return data if isinstance(data, dict) else {"error": data}
+
+
+def _can_retry(attempt: int, delay: float, deadline: float) -> bool:
+    return attempt + 1 < retry_policy.max_attempts and time.monotonic() + delay < deadline
+
 
 async def resolve_rematch_id(
         platform: PlatformEnum,
-        identifier: str
-) -> Optional[ProfileResponse]:
+        identifier: str,
+        priority: RequestPriority = RequestPriority.INTERACTIVE
+) -> Optional[Profile]:
+    key = (platform.value, identifier)
+    resolve: ResolveResponse | None = await resolve_cache.get(key)
+    if resolve is None:
+        resolve = await resolve_flight.do(key, lambda: _request_resolve(platform, identifier, priority))
+        if resolve is None:
+            return None
+        resolve_cache.set(key, resolve)
+    return await get_rematch_profile(resolve=resolve, priority=priority)
+
+
+async def _request_resolve(
+        platform: PlatformEnum,
+        identifier: str,
+        priority: RequestPriority
+) -> Optional[ResolveResponse]:
     payload = {"platform": platform.value, "identifier": identifier}
-    headers = {"Content-Type": "application/json"}
-    session = get_session()
 
     try:
-        async with session.post(RESOLVE_URL, json=payload, headers=headers) as response:
-            text = await response.text()
-            if response.status == 200:
-                data = await response.json()
-                if data.get("success") is True:
-                    returned = data.get("platform")
-                    expected_platform = platform.value if platform != PlatformEnum.PSN else "psn"
-                    if returned != expected_platform:
-                        logger.warning(
-                            "Resolved platform %s does not match requested platform %s",
-                            returned, platform.value
-                        )
-                        return None
-
-                    resolve = ResolveResponse(
-                        platform=data.get("platform"),
-                        platform_id=data.get("platform_id"),
-                        display_name=data.get("display_name"),
-                        success=True
+        result = await _post(RESOLVE_URL, payload, resolve_breaker, priority, f"resolve {platform}/{identifier}")
+        if result is None:
+            return None
+        status, data = result
+        if status == 200:
+            if data.get("success") is True:
+                returned = data.get("platform")
+                expected_platform = platform.value if platform != PlatformEnum.PSN else "psn"
+                if returned != expected_platform:
+                    logger.warning(
+                        "Resolved platform %s does not match requested platform %s",
+                        returned, platform.value
                     )
-                    return await get_rematch_profile(resolve=resolve)
-                else:
-                    logger.error("Resolve: success flag false for %s: %s", platform, identifier)
                     return None
+
+                return ResolveResponse(
+                    platform=data.get("platform"),
+                    platform_id=data.get("platform_id"),
+                    display_name=data.get("display_name"),
+                    success=True
+                )
             else:
-                err = await response.json()
-                logger.error(f"Resolve: failed {platform}/{identifier} -> {response.status}: "
-                            f"{err.get('error', 'Unknown error')}")
+                logger.error("Resolve: success flag false for %s: %s", platform, identifier)
                 return None
+        else:
+            logger.error(f"Resolve: failed {platform}/{identifier} -> {status}: "
+                         f"{data.get('error', 'Unknown error')}")
+            return None
 
     except aiohttp.ClientError as e:
         logger.error(f"HTTP error in resolve_rematch_id: {e}", exc_info=True)
@@ -71,50 +296,58 @@ async def resolve_rematch_id(
 async def get_rematch_profile(
         resolve: ResolveResponse | None = None,
         platform: Optional[str] = None,
-        platform_id: Optional[str] = None
-) -> Optional[ProfileResponse]:
+        platform_id: Optional[str] = None,
+        priority: RequestPriority = RequestPriority.INTERACTIVE
+) -> Optional[Profile]:
+    platform = resolve["platform"] if platform is None else platform
+    platform_id = resolve["platform_id"] if platform_id is None else platform_id
+    key = (platform, platform_id)
+    profile: Profile | None = await profile_cache.get(key)
+    if profile is None:
+        profile = await profile_flight.do(key, lambda: _request_profile(platform, platform_id, priority))
+        if profile is not None:
+            profile_cache.set(key, profile)
+    return profile
+
+
+async def _request_profile(
+        platform: str,
+        platform_id: str,
+        priority: RequestPriority
+) -> Optional[Profile]:
     payload = {
-        "platform": resolve["platform"] if platform is None else platform,
-        "platformId": resolve["platform_id"] if platform_id is None else platform_id,
+        "platform": platform,
+        "platformId": platform_id,
     }
-    headers = {"Content-Type": "application/json"}
-    session = get_session()
 
     try:
-        async with session.post(PROFILE_URL, json=payload, headers=headers) as resp:
-            text = await resp.text()
-            if resp.status == 200:
-                data = await resp.json()
-                if "player" in data and "rank" in data:
-                    profile_player = ProfilePlayer(**data["player"])
-                    rank = ProfileRank(**data["rank"])
-                    return ProfileResponse(player=profile_player, rank=rank)
-                else:
-                    logger.error(f"Profile: no response for player id {resolve['platform_id']}\n"
-                                 f"response: {data}")
-                    return None
+        result = await _post(PROFILE_URL, payload, profile_breaker, priority, f"profile {platform}/{platform_id}",
+                             parse=Profile.from_bytes)
+        if result is None:
+            return None
+        status, data = result
+        if status == 200:
+            return data
 
-            elif resp.status == 400:
-                err = await resp.json()
-                logger.warning(
-                    f"Profile bad request {resolve['platform']}/{resolve['platform_id']} -> {err.get('error')}"
-                )
-                return None
-            else:
-                err = await resp.json()
-                logger.warning(
-                    f"profile server error {resolve['platform']}/{resolve['platform_id']} -> "
-                    f"{err.get('error')} ({resp.status})"
-                )
-                return None
+        elif status == 400:
+            logger.warning(
+                f"Profile bad request {platform}/{platform_id} -> {data.get('error')}"
+            )
+            return None
+        else:
+            logger.warning(
+                f"profile server error {platform}/{platform_id} -> "
+                f"{data.get('error')} ({status})"
+            )
+            return None
+    except ValueError as e:
+        logger.error(f"Profile: no response for player id {platform_id}: {e}")
+        return None
     except aiohttp.ClientError as e:
         logger.error(f"HTTP error in get_rematch_profile: {e}", exc_info=True, stack_info=True)
         return None
     except asyncio.TimeoutError:
-        if platform and platform_id:
-            logger.warning(f"Timeout error in get_rematch_profile for {platform}/{platform_id}")
-        else:
-            logger.warning(f"Timeout error in get_rematch_profile for {resolve['platform']}/{resolve['platform_id']}")
+        logger.warning(f"Timeout error in get_rematch_profile for {platform}/{platform_id}")
         return None
     except Exception as e:
         logger.error(f"Unexpected error in get_rematch_profile: {e}", exc_info=True, stack_info=True)
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+from app.lib.cache import CacheStats, TTLCache
+from app.logger import logger
+
+_MISSING = object()
+
+
+class SqliteCacheStore:
+    """
+    On-disk cache tier backed by SQLite, so that warm entries survive restarts.
+    Values are stored as JSON together with their expiration timestamp.
+    The methods are blocking: from the event loop they are called through run, which executes them
+    one at a time on a dedicated thread.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._conn: sqlite3.Connection | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rematch-cache")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            logger.debug(f"Rematch disk cache opened at {self.path}")
+        return self._conn
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs a method of the store on its thread, without blocking the event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def get(self, namespace: str, key: str) -> tuple[Any, float] | None:
+        row = self.conn.execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= time.time():
+            self.delete(namespace, key)
+            return None
+        return json.loads(value), expires_at
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: float) -> None:
+        self.write_many(namespace, {key: (value, expires_at)})
+
+    def delete(self, namespace: str, key: str) -> None:
+        self.write_many(namespace, {key: None})
+
+    def write_many(self, namespace: str, writes: dict[str, tuple[Any, float] | None]) -> None:
+        """
+        Applies the given writes with a single commit.
+        :param writes: Maps a key to its (value, expires_at), or to None to delete it.
+        """
+        upserts = [(namespace, key, json.dumps(write[0]), write[1]) for key, write in writes.items()
+                   if write is not None]
+        deletes = [(namespace, key) for key, write in writes.items() if write is None]
+        with self.conn:
+            if upserts:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)", upserts
+                )
+            if deletes:
+                self.conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", deletes)
+
+    def close(self) -> None:
+        """
+        Waits for the queued operations, then stops the thread of the store and closes the connection.
+        """
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class TwoTierCache:
+    """
+    Cache made of an in-memory TTLCache and an optional SqliteCacheStore.
+    Entries found only on disk are promoted to memory with their original expiration.
+    Writes to the disk tier are queued and applied in batches, with one commit, flush_delay seconds
+    after the first queued write, so the event loop never waits on the disk for a set.
+    dump and load convert the cached values to and from JSON-serializable objects for the disk tier.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float, store: SqliteCacheStore | None = None,
+                 dump: Callable[[Any], Any] | None = None, load: Callable[[Any], Any] | None = None,
+                 flush_delay: float = 1.0):
+        self.namespace = namespace
+        self.dump = dump
+        self.load = load
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self.stats = CacheStats()
+        self.memory = TTLCache(maxsize, ttl, self.stats)
+        self.store = store
+        self._pending: dict[str, tuple[Any, float] | None] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _disk_key(key: tuple) -> str:
+        return ":".join(str(part) for part in key)
+
+    async def get(self, key: tuple) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self.stats.hits += 1
+            return value
+        if self.store is not None:
+            disk_key = self._disk_key(key)
+            if disk_key in self._pending:
+                # Scrittura non ancora su disco: vale quella
+                found = self._pending[disk_key]
+                if found is not None and found[1] <= time.time():
+                    found = None
+            else:
+                try:
+                    found = await self.store.run(self.store.get, self.namespace, disk_key)
+                except sqlite3.Error as e:
+                    logger.error(f"Rematch disk cache read failed for {key}: {e}")
+                    found = None
+            if found is not None:
+                value, expires_at = found
+                if self.load is not None:
+                    value = self.load(value)
+                self.memory.set(key, value, expires_at)
+                self.stats.hits += 1
+                self.stats.disk_hits += 1
+                return value
+        self.stats.misses += 1
+        return None
+
+    def set(self, key: tuple, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, value, expires_at)
+        if self.store is not None:
+            stored = self.dump(value) if self.dump is not None else value
+            self._queue(self._disk_key(key), (stored, expires_at))
+
+    def invalidate(self, key: tuple) -> None:
+        self.memory.invalidate(key)
+        if self.store is not None:
+            self._queue(self._disk_key(key), None)
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+    def _queue(self, disk_key: str, write: tuple[Any, float] | None) -> None:
+        self._pending[disk_key] = write
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fuori dal loop, ad esempio in uno script, si scrive subito
+            self._write(self._take())
+            return
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    def _take(self) -> dict[str, tuple[Any, float] | None]:
+        writes, self._pending = self._pending, {}
+        return writes
+
+    def _write(self, writes: dict[str, tuple[Any, float] | None]) -> None:
+        try:
+            self.store.write_many(self.namespace, writes)
+        except sqlite3.Error as e:
+            logger.error(f"Rematch disk cache write of {len(writes)} entries failed: {e}")
+            return
+        self._count(writes)
+
+    def _count(self, writes: dict[str, tuple[Any, float] | None]) -> None:
+        self.stats.disk_writes += sum(1 for write in writes.values() if write is not None)
+        self.stats.disk_flushes += 1
+
+    async def flush(self) -> int:
+        """
+        Writes the queued entries to the disk tier now.
+        :return: The number of entries written or deleted.
+        """
+        if self.store is None or not self._pending:
+            return 0
+        writes = self._take()
+        try:
+            await self.store.run(self.store.write_many, self.namespace, writes)
+        except sqlite3.Error as e:
+            logger.error(f"Rematch disk cache write of {len(writes)} entries failed: {e}")
+            return 0
+        self._count(writes)
+        return len(writes)
@@ -0,0 +1,96 @@
+import time
+from enum import Enum
+
+from app.logger import logger
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding a single upstream endpoint.
+    After failure_threshold consecutive failures the circuit opens and every request is refused.
+    Once recovery_timeout has elapsed the circuit becomes half-open and lets at most
+    half_open_max_calls probe requests through: a successful probe closes it, a failed one opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 60.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._state = CircuitState.CLOSED
+        self._probes = 0
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state is CircuitState.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._probes = 0
+            logger.info(f"Circuit {self.name} is half-open, probing the upstream")
+        return self._state
+
+    @property
+    def retry_in(self) -> float:
+        """
+        Seconds left before the circuit lets a probe request through.
+        """
+        if self.state is not CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self._state is CircuitState.HALF_OPEN:
+            logger.info(f"Circuit {self.name} closed, the upstream is healthy again")
+        self._state = CircuitState.CLOSED
+        self.failures = 0
+        self._probes = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._state is CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open()
+
+    def release(self) -> None:
+        """
+        Called when an allowed request ended with an outcome that says nothing about the upstream health.
+        """
+        if self._state is CircuitState.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def _open(self) -> None:
+        if self._state is not CircuitState.OPEN:
+            self.times_opened += 1
+            logger.warning(f"Circuit {self.name} opened after {self.failures} failures, "
+                           f"requests suspended for {self.recovery_timeout:.0f}s")
+        self._state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+        self._probes = 0
+
+    def as_dict(self) -> dict[str, str | int | float]:
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in, 1),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,58 @@
+import json
+import os
+from typing import Any, Callable
+
+from app.logger import logger
+
+Decoder = Callable[[bytes], Any]
+
+
+def _stdlib_decoder() -> Decoder:
+    return json.loads
+
+
+def _orjson_decoder() -> Decoder:
+    import orjson
+    return orjson.loads
+
+
+def _msgspec_decoder() -> Decoder:
+    import msgspec
+    decoder = msgspec.json.Decoder()
+
+    def loads(body: bytes) -> Any:
+        try:
+            return decoder.decode(body)
+        except msgspec.DecodeError as e:
+            # Stessa eccezione degli altri decoder
+            raise ValueError(str(e)) from e
+
+    return loads
+
+
+DECODERS: dict[str, Callable[[], Decoder]] = {
+    "orjson": _orjson_decoder,
+    "msgspec": _msgspec_decoder,
+    "json": _stdlib_decoder,
+}
+
+
+def get_decoder(name: str | None = None) -> tuple[str, Decoder]:
+    """
+    Returns the JSON decoder with the given name, or the fastest one installed.
+    Every decoder accepts the raw response bytes and raises ValueError on invalid JSON.
+    :param name: One of "orjson", "msgspec" or "json". If None, the first installed one is used.
+    :return: The name of the decoder and the decoder itself.
+    """
+    names = [name] if name else list(DECODERS)
+    for candidate in names:
+        try:
+            return candidate, DECODERS[candidate]()
+        except ImportError:
+            if name:
+                logger.warning(f"JSON decoder {name} is not installed, falling back to the fastest available")
+                return get_decoder()
+    return "json", _stdlib_decoder()
+
+
+JSON_BACKEND, loads = get_decoder(os.getenv("REMATCH_JSON_DECODER") or None)
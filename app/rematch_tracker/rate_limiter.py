@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+import time
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+
+from app.logger import logger
+
+
+class RequestPriority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parses a Retry-After header, given either in seconds or as an HTTP date.
+    :param value: The header value.
+    :return: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.UTC)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.UTC)).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate adapts to the upstream health (AIMD):
+    the rate grows by a fixed step on every success and is multiplied by decrease_factor on errors.
+    A 429 response pauses every request until its Retry-After has elapsed.
+    Background requests never take the tokens reserved to interactive ones,
+    so the scheduler cannot starve the users filling the form.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, capacity: float,
+                 reserved_share: float = 0.2, increase_step: float = 0.1, decrease_factor: float = 0.5,
+                 default_retry_after: float = 30.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = capacity
+        self.reserved = capacity * reserved_share
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.default_retry_after = default_retry_after
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.errors = 0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._interactive_waiting = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self, priority: RequestPriority = RequestPriority.INTERACTIVE) -> None:
+        """
+        Waits until a request with the given priority can be sent.
+        """
+        interactive = priority is RequestPriority.INTERACTIVE
+        if interactive:
+            self._interactive_waiting += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                floor = 0.0 if interactive else self.reserved
+                if not interactive and self._interactive_waiting:
+                    # Le richieste interattive in attesa hanno la precedenza
+                    floor = self.capacity
+                if self.tokens - 1 >= floor:
+                    self.tokens -= 1
+                    return
+                missing = min(floor + 1, self.capacity) - self.tokens
+                await asyncio.sleep(max(missing, 0.01) / self.rate)
+        finally:
+            if interactive:
+                self._interactive_waiting -= 1
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_error(self) -> None:
+        self.errors += 1
+        self._decrease()
+
+    def on_throttle(self, retry_after: float | None) -> None:
+        """
+        Called when the upstream answers with HTTP 429.
+        :param retry_after: The parsed Retry-After header, if any.
+        """
+        self.throttled += 1
+        wait = retry_after if retry_after is not None else self.default_retry_after
+        self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        self.tokens = 0.0
+        self._decrease()
+        logger.warning(f"Rematch API rate limited, pausing requests for {wait:.1f}s (rate {self.rate:.2f}/s)")
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # Una sola riduzione per finestra: gli errori concorrenti della stessa raffica contano una volta
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+    def as_dict(self) -> dict[str, float | int]:
+        return {
+            "rate": round(self.rate, 2),
+            "tokens": round(self.tokens, 2),
+            "paused_for": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            "throttled": self.throttled,
+            "errors": self.errors,
+        }
@@ -0,0 +1,51 @@
+import asyncio
+import random
+
+import aiohttp
+
+# 408/425/429 e gli errori del gateway sono transitori, gli altri 4xx no
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """
+    Retry policy with jittered exponential backoff ("full jitter") and a per-call deadline budget.
+    Attempt n waits a random delay between 0 and min(max_delay, base_delay * 2 ** n).
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0,
+                 deadline: float = 15.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retries = 0
+        self.recovered = 0
+        self.exhausted = 0
+
+    def backoff(self, attempt: int) -> float:
+        """
+        :param attempt: The number of the attempt that just failed, starting from 0.
+        :return: The delay in seconds before the next attempt.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def is_retryable_status(status: int) -> bool:
+        return status in RETRYABLE_STATUSES
+
+    @staticmethod
+    def is_retryable_error(error: BaseException) -> bool:
+        if isinstance(error, asyncio.TimeoutError):
+            return True
+        # ContentTypeError e simili sono risposte sbagliate, riprovare non serve
+        if isinstance(error, aiohttp.ClientResponseError):
+            return False
+        return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "retries": self.retries,
+            "recovered": self.recovered,
+            "exhausted": self.exhausted,
+        }
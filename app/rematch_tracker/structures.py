@@ -1,5 +1,16 @@
+import datetime
+import hashlib
 from typing import TypedDict
 
+from app.rematch_tracker.decoder import loads
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+_UNPARSED = object()
+
 
 class ResolveResponse(TypedDict):
     """
@@ -32,4 +43,186 @@ class ProfileRank(TypedDict):
 
 class ProfileResponse(TypedDict):
     player: ProfilePlayer
-    rank: ProfileRank
\ No newline at end of file
+    rank: ProfileRank
+
+
+if msgspec is not None:
+    class _PlayerStruct(msgspec.Struct):
+        platform: str
+        platform_id: str
+        display_name: str | None = None
+        last_updated_at: str | None = None
+
+    class _RankStruct(msgspec.Struct):
+        current_league: int
+        current_division: int | None = None
+
+    class _ProfileStruct(msgspec.Struct):
+        player: _PlayerStruct
+        rank: _RankStruct
+
+    _struct_decoder = msgspec.json.Decoder(_ProfileStruct)
+else:
+    _struct_decoder = None
+
+class _PlayerView:
+    """
+    Read-only view of a Profile exposing the ProfilePlayer keys.
+    """
+    __slots__ = ("_profile",)
+
+    def __init__(self, profile: "Profile"):
+        self._profile = profile
+
+    def __getitem__(self, key: str):
+        if key == "last_updated_at":
+            return self._profile.last_updated_raw
+        if key in Profile.PLAYER_FIELDS:
+            return getattr(self._profile, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class _RankView:
+    """
+    Read-only view of a Profile exposing the ProfileRank keys.
+    """
+    __slots__ = ("_profile",)
+
+    def __init__(self, profile: "Profile"):
+        self._profile = profile
+
+    def __getitem__(self, key: str):
+        if key in Profile.RANK_FIELDS:
+            return getattr(self._profile, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class Profile:
+    """
+    Compact representation of a profile response, keeping only the fields used by the bot.
+    Assets, title and level are dropped and last_updated_at is parsed only when accessed.
+    Callers written for ProfileResponse keep working: profile["rank"]["current_league"]
+    and profile["player"]["platform_id"] are still supported.
+    """
+    __slots__ = ("platform", "platform_id", "display_name", "current_league", "current_division",
+                 "last_updated_raw", "_last_updated_at")
+
+    PLAYER_FIELDS = ("platform", "platform_id", "display_name")
+    RANK_FIELDS = ("current_league", "current_division")
+
+    def __init__(self, platform: str, platform_id: str, display_name: str, current_league: int,
+                 current_division: int, last_updated_raw: str | None = None):
+        self.platform = platform
+        self.platform_id = platform_id
+        self.display_name = display_name
+        self.current_league = current_league
+        self.current_division = current_division
+        self.last_updated_raw = last_updated_raw
+        self._last_updated_at = _UNPARSED
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Profile":
+        """
+        Builds a Profile from a decoded profile response.
+        :raise ValueError: If the response has no player or rank.
+        """
+        try:
+            player = data["player"]
+            rank = data["rank"]
+            return cls(
+                platform=player["platform"],
+                platform_id=player["platform_id"],
+                display_name=player.get("display_name"),
+                current_league=rank["current_league"],
+                current_division=rank.get("current_division"),
+                last_updated_raw=player.get("last_updated_at"),
+            )
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid profile response: missing {e}") from e
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> "Profile":
+        """
+        Decodes a Profile directly from the response body.
+        With msgspec installed only the used fields are decoded, otherwise the body goes through the JSON decoder.
+        :raise ValueError: If the body is not a valid profile response.
+        """
+        if _struct_decoder is not None:
+            try:
+                decoded = _struct_decoder.decode(body)
+            except msgspec.DecodeError as e:
+                raise ValueError(f"Invalid profile response: {e}") from e
+            player, rank = decoded.player, decoded.rank
+            return cls(player.platform, player.platform_id, player.display_name, rank.current_league,
+                       rank.current_division, player.last_updated_at)
+        return cls.from_dict(loads(body))
+
+    @property
+    def last_updated_at(self) -> datetime.datetime | None:
+        if self._last_updated_at is _UNPARSED:
+            parsed = None
+            if self.last_updated_raw:
+                try:
+                    parsed = datetime.datetime.fromisoformat(self.last_updated_raw.replace("Z", "+00:00"))
+                    if parsed.tzinfo is None:
+                        parsed = parsed.replace(tzinfo=datetime.UTC)
+                except ValueError:
+                    pass
+            self._last_updated_at = parsed
+        return self._last_updated_at
+
+    @property
+    def rank_hash(self) -> str:
+        """
+        Short hash of the rank payload, stored on the platform link to detect rank changes.
+        """
+        payload = f"{self.current_league}:{self.current_division}".encode()
+        return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+    def __getitem__(self, key: str):
+        if key == "player":
+            return _PlayerView(self)
+        if key == "rank":
+            return _RankView(self)
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("player", "rank")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Profile):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return (f"Profile(platform={self.platform!r}, platform_id={self.platform_id!r}, "
+                f"display_name={self.display_name!r}, current_league={self.current_league})")
+
+    def to_dict(self) -> ProfileResponse:
+        """
+        Returns the profile as a (reduced) ProfileResponse, e.g. to store it as JSON.
+        """
+        return {
+            "player": {
+                "platform": self.platform,
+                "platform_id": self.platform_id,
+                "display_name": self.display_name,
+                "last_updated_at": self.last_updated_raw,
+            },
+            "rank": {
+                "current_league": self.current_league,
+                "current_division": self.current_division,
+            },
+        }
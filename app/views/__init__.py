@@ -8,7 +8,7 @@ from app.lib.db.schemes import RankLinkEnum
 from app.logger import logger
 from app.lib.db.queries import link_rank, create_platform_link
 from app.lib.db.schemes import PlatformEnum
-from app.rematch_tracker import ProfileResponse, resolve_rematch_id
+from app.rematch_tracker import Profile, resolve_rematch_id
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -175,7 +175,7 @@ class RematchLinkForm(Modal):
             )
             return
         try:
-            profile: ProfileResponse
+            profile: Profile
             profile, created = await get_platform_link(interaction.user, identifier=nickname,
                                                         platform=PlatformEnum(platform))
             if profile is None:
@@ -224,8 +224,8 @@ class OpenFormView(View):
 
 
 
-async def get_platform_link(member: Member, identifier: str, platform: PlatformEnum) -> Tuple[ProfileResponse, bool] | Tuple[None, None]:
-    profile: ProfileResponse = await resolve_rematch_id(platform=platform, identifier=identifier)
+async def get_platform_link(member: Member, identifier: str, platform: PlatformEnum) -> Tuple[Profile, bool] | Tuple[None, None]:
+    profile: Profile = await resolve_rematch_id(platform=platform, identifier=identifier)
     if profile is None:
         logger.warning("Failed to resolve Rematch ID for %s on platform %s", identifier, platform.value)
         return None, None
@@ -0,0 +1,10 @@
+"""
+Offline benchmarks for the Rematch tracker client and the rank scheduler.
+Run them from the repository root, e.g. ``python -m bench.bench_json_decode``.
+"""
+import os
+
+# app.rematch_tracker richiede gli URL all'import: di default puntiamo allo stand-in locale
+os.environ.setdefault("RESOLVE_URL", "http://127.0.0.1:8765/resolve")
+os.environ.setdefault("PROFILE_URL", "http://127.0.0.1:8765/profile")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
@@ -0,0 +1,95 @@
+"""
+Benchmark of the claim of the due platform links in SQLite.
+
+Compares the old claim_links of the rank update scheduler, which committed one UPDATE per 500 ids,
+with claim_links, which writes every lease in one transaction. Both read the claimed links back with one query.
+The database is a SQLite file in a temporary directory, as in production.
+
+Usage: python -m bench.bench_claim_links [--links 10000 100000]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+import tracemalloc
+
+from tortoise import Tortoise
+from tortoise.expressions import Q
+
+from app.lib.db.queries import claim_links, start_run
+from app.lib.db.schemes import MemberSchema, PlatformLink, PlatformEnum, RankLinkEnum
+
+
+async def legacy_claim_links(link_ids: list[int], run, lease_seconds: float) -> list[PlatformLink]:
+    """
+    claim_links before the single transaction.
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    expires_at = now + datetime.timedelta(seconds=lease_seconds)
+    for i in range(0, len(link_ids), 500):
+        await PlatformLink.filter(
+            Q(lease_run_id__isnull=True) | Q(lease_expires_at__lt=now),
+            id__in=link_ids[i:i + 500]
+        ).update(lease_run_id=run.id, lease_expires_at=expires_at)
+    return await PlatformLink.filter(lease_run_id=run.id).all()
+
+
+async def claim_due(claim) -> list[PlatformLink]:
+    link_ids = list(await PlatformLink.all().values_list("id", flat=True))
+    return await claim(link_ids, await start_run())
+
+
+async def make_links(count: int) -> None:
+    await PlatformLink.all().delete()
+    await MemberSchema.all().delete()
+    await MemberSchema.bulk_create([MemberSchema(discord_id=i) for i in range(count)], batch_size=1000)
+    await PlatformLink.bulk_create([
+        PlatformLink(discord_id_id=i, platform=PlatformEnum.PSN, platform_id=str(i), rematch_display_name=f"P{i}",
+                     cached_rank=RankLinkEnum.ORO)
+        for i in range(count)
+    ], batch_size=1000)
+
+
+async def measure(name: str, count: int, claim) -> None:
+    await make_links(count)
+    start = time.perf_counter()
+    result = await claim()
+    elapsed = time.perf_counter() - start
+    claimed = len(result)
+    del result
+    # Seconda passata solo per il picco di memoria: con tracemalloc attivo i tempi non sono attendibili
+    await make_links(count)
+    tracemalloc.start()
+    result = await claim()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{name:>10} {count:>7} links: {claimed} claimed in {elapsed:8.2f}s, "
+          f"{claimed / elapsed:9.0f} links/s, peak memory {peak / 1024 / 1024:6.1f} MiB")
+
+
+async def run(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        await Tortoise.init(db_url=f"sqlite://{os.path.join(directory, 'bench.db')}",
+                            modules={"models": ["app.lib.db.schemes"]})
+        await Tortoise.generate_schemas()
+        try:
+            for count in args.links:
+                await measure("claim old", count, lambda: claim_due(
+                    lambda link_ids, run: legacy_claim_links(link_ids, run, 600)))
+                await measure("claim", count, lambda: claim_due(
+                    lambda link_ids, run: claim_links(link_ids, run, 600)))
+        finally:
+            await Tortoise.close_connections()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, nargs="+", default=[10000, 100000])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark of write-heavy rank update runs in SQLite under each PRAGMA profile of DatabaseManager.
+
+Every profile gets its own SQLite file in a temporary directory, opened through DatabaseManager as the bot does.
+A run replays the writes of the scheduler: the claim of the stale links, the check results and the cached ranks
+saved in pages, and the single-row commits of the member events (joins, leaves, rank links) that happen
+between the runs, while a reader keeps querying the links as the commands do.
+
+Usage: python -m bench.bench_db_profiles [--links 2000 10000] [--page-size 200] [--single-writes 500]
+    [--profiles legacy default performance]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from app.lib.db import DatabaseManager, SQLITE_PROFILES
+from app.lib.db.queries import claim_links, finish_run, save_cached_ranks, save_check_results, start_run
+from app.lib.db.schemes import MemberSchema, PlatformLink, PlatformEnum, RankLinkEnum, RunStatusEnum
+
+
+async def make_links(count: int) -> list[int]:
+    await MemberSchema.bulk_create([MemberSchema(discord_id=i, username=f"user{i}") for i in range(count)],
+                                   batch_size=1000)
+    await PlatformLink.bulk_create([
+        PlatformLink(discord_id_id=i, platform=PlatformEnum.PSN, platform_id=str(i), rematch_display_name=f"P{i}",
+                     cached_rank=RankLinkEnum.BRONZO)
+        for i in range(count)
+    ], batch_size=1000)
+    return list(await PlatformLink.all().values_list("id", flat=True))
+
+
+async def reader(stop: asyncio.Event) -> int:
+    reads = 0
+    while not stop.is_set():
+        await PlatformLink.filter(cached_rank=RankLinkEnum.ORO).count()
+        reads += 1
+        await asyncio.sleep(0)
+    return reads
+
+
+async def scheduler_run(link_ids: list[int], page_size: int, single_writes: int) -> dict[str, float]:
+    timings = {}
+    start = time.perf_counter()
+    run = await start_run()
+    links = await claim_links(link_ids, run, lease_seconds=600)
+    timings["claim"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    now = datetime.datetime.now(datetime.UTC)
+    for i in range(0, len(links), page_size):
+        page = links[i:i + page_size]
+        for link in page:
+            link.last_checked = now
+            link.next_check_at = now + datetime.timedelta(minutes=45)
+            link.lease_run_id = None
+            link.lease_expires_at = None
+        await save_check_results(page)
+    timings["check_results"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(links), page_size):
+        page = links[i:i + page_size]
+        for link in page:
+            link.cached_rank = RankLinkEnum.ORO
+        await save_cached_ranks(page)
+    timings["cached_ranks"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for link in links[:single_writes]:
+        await PlatformLink.filter(id=link.id).update(rematch_display_name=f"Q{link.id}")
+    timings["single_writes"] = time.perf_counter() - start
+
+    await finish_run(run, RunStatusEnum.COMPLETED, claimed=len(links))
+    return timings
+
+
+async def measure(directory: str, profile: str, count: int, page_size: int, single_writes: int) -> None:
+    db = DatabaseManager(f"sqlite://{os.path.join(directory, f'{profile}-{count}.db')}", generate_schemas=True,
+                         sqlite_profile=profile)
+    await db.connect()
+    try:
+        link_ids = await make_links(count)
+        stop = asyncio.Event()
+        reads = asyncio.create_task(reader(stop))
+        start = time.perf_counter()
+        timings = await scheduler_run(link_ids, page_size, single_writes)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        details = ", ".join(f"{name} {seconds:6.2f}s" for name, seconds in timings.items())
+        print(f"{profile:>12} {count:>6} links: {elapsed:7.2f}s total ({details}), "
+              f"{single_writes / timings['single_writes']:7.0f} commits/s, {await reads} concurrent reads")
+    finally:
+        await db.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.links:
+            for profile in args.profiles:
+                await measure(directory, profile, count, args.page_size, min(args.single_writes, count))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, nargs="+", default=[2000, 10000])
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--single-writes", type=int, default=500)
+    parser.add_argument("--profiles", nargs="+", choices=list(SQLITE_PROFILES), default=list(SQLITE_PROFILES))
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark of the Rematch response decoding.
+
+Compares the old handling (``await response.text()`` followed by ``await response.json()``,
+so the body is decoded to str twice and then parsed) with the single-parse pipeline
+(``await response.read()`` decoded once by the pluggable decoder).
+
+Usage: python -m bench.bench_json_decode [--responses 5000]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from bench.fixtures import profile_body
+from app.rematch_tracker.decoder import DECODERS
+
+
+def legacy(body: bytes):
+    text = body.decode("utf-8")  # response.text()
+    return json.loads(body.decode("utf-8"))  # response.json()
+
+
+def measure(name: str, fn, bodies: list[bytes]) -> None:
+    # Tempo e allocazioni sono misurati separatamente: tracemalloc rallenta molto l'esecuzione
+    start = time.perf_counter()
+    for body in bodies:
+        fn(body)
+    elapsed = time.perf_counter() - start
+
+    # Il picco di un singolo decode misura la memoria temporanea allocata per risposta
+    tracemalloc.start()
+    for body in bodies:
+        tracemalloc.reset_peak()
+        fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_response_us = elapsed / len(bodies) * 1_000_000
+    print(f"{name:<16} {elapsed * 1000:>9.1f} ms {per_response_us:>9.2f} us/resp {peak:>8} B peak/resp")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=5000, help="responses decoded per run (scheduler volume)")
+    args = parser.parse_args()
+
+    bodies = [profile_body(str(i)) for i in range(args.responses)]
+    print(f"Decoding {len(bodies)} profile responses of ~{len(bodies[0])} bytes")
+    measure("text()+json()", legacy, bodies)
+    for name, factory in DECODERS.items():
+        try:
+            loads = factory()
+        except ImportError:
+            print(f"{name:<16} not installed")
+            continue
+        measure(f"read()+{name}", loads, bodies)
+
+
+if __name__ == "__main__":
+    main()
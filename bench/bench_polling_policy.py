@@ -0,0 +1,95 @@
+"""
+Simulation of the adaptive polling policy against the old fixed 45 minutes cadence.
+
+A synthetic population of active, stable and dormant players is simulated for some days. Active players
+play every few hours, which refreshes the last_updated_at of their profile, and change league at random
+times; the others never do. The benchmark prints the upstream calls made by each
+policy and how long it took, on average, to notice a league change.
+
+Usage: python -m bench.bench_polling_policy [--links 10000] [--days 3]
+"""
+import argparse
+import datetime
+import heapq
+import random
+
+from app.lib.scheduling import AdaptivePollingPolicy, interval_distribution, jittered_interval
+
+START = datetime.datetime(2025, 7, 1, tzinfo=datetime.UTC)
+
+
+def make_population(links: int, rng: random.Random) -> list[dict]:
+    population = []
+    for _ in range(links):
+        kind = rng.choices(("active", "stable", "dormant"), weights=(0.15, 0.55, 0.30))[0]
+        # Tempo medio tra due cambi di lega, in secondi
+        change_every = rng.uniform(3 * 3600, 24 * 3600) if kind == "active" else None
+        updated_days_ago = 90 if kind == "dormant" else rng.uniform(0, 3)
+        population.append({
+            "change_every": change_every,
+            "last_updated_at": START - datetime.timedelta(days=updated_days_ago),
+        })
+    return population
+
+
+def simulate(population: list[dict], policy: AdaptivePollingPolicy | None, base: float, days: float,
+             seed: int) -> dict:
+    rng = random.Random(seed)
+    end = days * 86400
+    heap = []
+    state = []
+    for i, player in enumerate(population):
+        first_change = rng.expovariate(1 / player["change_every"]) if player["change_every"] else None
+        state.append({"interval": None, "last_rank_change_at": None, "pending_change": first_change})
+        heapq.heappush(heap, (rng.uniform(0, base), i))
+
+    calls = 0
+    delays = []
+    while heap:
+        t, i = heapq.heappop(heap)
+        if t > end:
+            break
+        calls += 1
+        player, link = population[i], state[i]
+        now = START + datetime.timedelta(seconds=t)
+        changed = link["pending_change"] is not None and link["pending_change"] <= t
+        if player["change_every"]:
+            # I giocatori attivi giocano ogni poche ore
+            player["last_updated_at"] = max(player["last_updated_at"], now - datetime.timedelta(hours=rng.uniform(0, 6)))
+        if changed:
+            delays.append(t - link["pending_change"])
+            player["last_updated_at"] = START + datetime.timedelta(seconds=link["pending_change"])
+            link["pending_change"] = link["pending_change"] + rng.expovariate(1 / player["change_every"])
+        if policy is None:
+            interval = base
+        else:
+            if changed:
+                link["last_rank_change_at"] = now
+            interval = policy.next_interval(link["interval"], changed, now, player["last_updated_at"],
+                                            link["last_rank_change_at"])
+        link["interval"] = interval
+        heapq.heappush(heap, (t + jittered_interval(interval, 0.1, rng), i))
+
+    return {
+        "calls": calls,
+        "calls_per_link_per_day": round(calls / len(population) / days, 1),
+        "changes_seen": len(delays),
+        "mean_detection_delay_min": round(sum(delays) / len(delays) / 60, 1) if delays else None,
+        "intervals": interval_distribution(link["interval"] or base for link in state),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--days", type=float, default=3)
+    parser.add_argument("--base", type=float, default=2700)
+    args = parser.parse_args()
+
+    for name, policy in (("fixed", None), ("adaptive", AdaptivePollingPolicy(base_interval=args.base))):
+        population = make_population(args.links, random.Random(1))
+        print(f"{name}: {simulate(population, policy, args.base, args.days, seed=2)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Memory benchmark of the profile representation.
+
+Compares the memory held by N profiles decoded as nested dicts (the old ProfileResponse TypedDicts)
+with the compact slotted Profile, and the time needed to build them from the response bytes.
+
+Usage: python -m bench.bench_profile_model [--profiles 10000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from bench.fixtures import profile_body
+from app.rematch_tracker.decoder import loads
+from app.rematch_tracker.structures import Profile, ProfilePlayer, ProfileRank, ProfileResponse
+
+
+def as_typed_dict(body: bytes) -> ProfileResponse:
+    data = loads(body)
+    return ProfileResponse(player=ProfilePlayer(**data["player"]), rank=ProfileRank(**data["rank"]))
+
+
+def measure(name: str, build, bodies: list[bytes]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    profiles = [build(body) for body in bodies]
+    elapsed = time.perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del profiles
+    print(f"{name:<12} {held / len(bodies):>8.0f} B/profile {held / 1024 / 1024:>8.2f} MiB total "
+          f"{elapsed * 1000:>8.1f} ms to decode")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=10000)
+    args = parser.parse_args()
+
+    bodies = [profile_body(str(i)) for i in range(args.profiles)]
+    print(f"Holding {len(bodies)} profiles in memory")
+    measure("TypedDict", as_typed_dict, bodies)
+    measure("Profile", Profile.from_bytes, bodies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of the cached rank persistence at the end of the role updates in SQLite.
+
+Compares the old path, which called update_rank once per member and per guild (get_member,
+PlatformLink.get_or_none and save for every call), with save_cached_ranks, which writes the rank of
+every changed link in one transaction with bulk UPDATE ... CASE statements.
+The database is a SQLite file in a temporary directory, as in production.
+
+Usage: python -m bench.bench_rank_persistence [--members 1000 10000] [--guilds 3] [--batch 200]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from tortoise import Tortoise
+
+from app.lib.db.queries import update_rank, save_cached_ranks
+from app.lib.db.schemes import MemberSchema, PlatformLink, PlatformEnum, RankLinkEnum
+
+
+async def make_links(count: int) -> list[PlatformLink]:
+    await PlatformLink.all().delete()
+    await MemberSchema.all().delete()
+    await MemberSchema.bulk_create([MemberSchema(discord_id=i, username=f"user{i}") for i in range(count)],
+                                   batch_size=1000)
+    await PlatformLink.bulk_create([
+        PlatformLink(discord_id_id=i, platform=PlatformEnum.PSN, platform_id=str(i), rematch_display_name=f"P{i}",
+                     cached_rank=RankLinkEnum.BRONZO)
+        for i in range(count)
+    ], batch_size=1000)
+    return await PlatformLink.all()
+
+
+async def legacy(links: list[PlatformLink], guilds: int, _: int) -> int:
+    writes = 0
+    for link in links:
+        member = SimpleNamespace(id=link.discord_id_id, name=f"user{link.discord_id_id}")
+        for _ in range(guilds):
+            await update_rank(member, RankLinkEnum.ORO)
+            writes += 1
+    return writes
+
+
+async def batched(links: list[PlatformLink], _: int, batch: int) -> int:
+    writes = 0
+    for start in range(0, len(links), batch):
+        page = links[start:start + batch]
+        for link in page:
+            link.cached_rank = RankLinkEnum.ORO
+        writes += await save_cached_ranks(page)
+    return writes
+
+
+async def measure(name: str, count: int, guilds: int, batch: int, persist) -> None:
+    links = await make_links(count)
+    start = time.perf_counter()
+    writes = await persist(links, guilds, batch)
+    elapsed = time.perf_counter() - start
+    saved = await PlatformLink.filter(cached_rank=RankLinkEnum.ORO).count()
+    print(f"{name:>8} {count:>6} members x {guilds} guilds: {writes:>6} row writes in {elapsed:7.2f}s, "
+          f"{count / elapsed:8.0f} members/s, {saved} ranks saved")
+
+
+async def run(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        await Tortoise.init(db_url=f"sqlite://{os.path.join(directory, 'bench.db')}",
+                            modules={"models": ["app.lib.db.schemes"]})
+        await Tortoise.generate_schemas()
+        try:
+            for count in args.members:
+                await measure("legacy", count, args.guilds, args.batch, legacy)
+                await measure("batched", count, args.guilds, args.batch, batched)
+        finally:
+            await Tortoise.close_connections()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Throughput and failure-mode benchmark of the rank scheduler profile fetch against the local stand-in.
+
+Runs RankUpdateScheduler._fetch_rematch_profile over synthetic platform links, stored in an in-memory
+SQLite database, while the stand-in injects latency, errors and 429 bursts, then prints the fetch progress
+and the tracker counters. From the second run on, profiles not changed upstream are skipped.
+
+Usage: python -m bench.bench_scheduler_fetch [--links 2000] [--runs 3] [--latency 0.05] [--error-rate 0.02]
+"""
+import argparse
+import asyncio
+import time
+
+from tortoise import Tortoise
+
+from bench.standin import StandinServer, StandinConfig
+
+
+async def run(args: argparse.Namespace) -> None:
+    config = StandinConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           churn=args.churn, burst_every=args.burst_every, burst_duration=args.burst_duration,
+                           retry_after=args.retry_after, seed=1)
+    server = StandinServer(config)
+    base_url = await server.start()
+
+    import app.rematch_tracker as tracker
+    from app.rematch_tracker.http_session import close_session
+    from app.cogs import rank_update_scheduler
+    from app.lib.db.schemes import PlatformEnum, RankLinkEnum, MemberSchema, PlatformLink
+
+    tracker.PROFILE_URL = f"{base_url}/profile"
+    tracker.RESOLVE_URL = f"{base_url}/resolve"
+    tracker.rate_limiter.rate = tracker.rate_limiter.max_rate = args.rate
+    tracker.rate_limiter.capacity = args.rate
+    rank_update_scheduler.REMATCH_FETCH_CONCURRENCY = args.concurrency
+
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.lib.db.schemes"]})
+    await Tortoise.generate_schemas()
+    await MemberSchema.bulk_create([MemberSchema(discord_id=i) for i in range(args.links)], batch_size=1000)
+    await PlatformLink.bulk_create([
+        PlatformLink(discord_id_id=i, platform=PlatformEnum.PSN, platform_id=str(i),
+                     rematch_display_name=f"Player{i}", cached_rank=RankLinkEnum.BRONZO)
+        for i in range(args.links)
+    ], batch_size=1000)
+    # Il cog viene creato senza avviare il loop di discord.ext.tasks
+    scheduler = object.__new__(rank_update_scheduler.RankUpdateScheduler)
+    try:
+        for run_number in range(1, args.runs + 1):
+            tracker.profile_cache.clear()
+            links = await PlatformLink.all()
+            start = time.perf_counter()
+            changed = await scheduler._fetch_rematch_profile(links) or {}
+            elapsed = time.perf_counter() - start
+            print(f"run {run_number}: {scheduler.fetch_progress} -> {len(links) / elapsed:.1f} profiles/s, "
+                  f"{len(changed)} to update")
+            # Simula l'aggiornamento dei ruoli andato a buon fine
+            for discord_id, rank in changed.items():
+                await PlatformLink.filter(discord_id_id=discord_id).update(cached_rank=rank)
+    finally:
+        await close_session()
+        await Tortoise.close_connections()
+        await server.stop()
+
+    print(f"stand-in: {server.stats.as_dict()}")
+    print(f"rate limiter: {tracker.rate_limiter.as_dict()}")
+    print(f"retries: {tracker.retry_policy.as_dict()}")
+    print(f"profile circuit: {tracker.profile_breaker.as_dict()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1000.0, help="rate limiter ceiling in requests/s")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--churn", type=float, default=0.1)
+    parser.add_argument("--burst-every", type=float, default=0.0)
+    parser.add_argument("--burst-duration", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Synthetic Rematch API payloads shared by the benchmarks.
+"""
+import datetime
+import json
+import random
+
+
+def profile_payload(platform_id: str, platform: str = "psn", league: int | None = None) -> dict:
+    """
+    Builds a profile response shaped like the real PROFILE_URL answer.
+    """
+    rng = random.Random(platform_id)
+    updated_at = datetime.datetime(2025, 7, 1, tzinfo=datetime.UTC) + datetime.timedelta(minutes=rng.randint(0, 90000))
+    return {
+        "player": {
+            "platform": platform,
+            "platform_id": platform_id,
+            "display_name": f"Player{platform_id}",
+            "avatar_asset": f"https://cdn.example.com/assets/avatars/{rng.randint(1, 500)}.png",
+            "banner_asset": f"https://cdn.example.com/assets/banners/{rng.randint(1, 500)}.png",
+            "background_asset": f"https://cdn.example.com/assets/backgrounds/{rng.randint(1, 500)}.png",
+            "title": "Giocatore di Rematch",
+            "level": rng.randint(1, 200),
+            "last_updated_at": updated_at.isoformat(),
+        },
+        "rank": {
+            "current_league": rng.randint(0, 6) if league is None else league,
+            "current_division": rng.randint(1, 3),
+        },
+    }
+
+
+def profile_body(platform_id: str, platform: str = "psn") -> bytes:
+    return json.dumps(profile_payload(platform_id, platform)).encode()
@@ -0,0 +1,264 @@
+"""
+Local stand-in for the Rematch API (RESOLVE_URL and PROFILE_URL).
+
+The server answers like the real API with synthetic players and can inject latency, server errors,
+429 bursts and rank churn. In record mode it proxies the requests to the real API and saves the answers
+into a fixtures file; in replay mode it serves the saved answers only.
+
+Usage:
+    python -m bench.standin --port 8765 --latency 0.05 --error-rate 0.02 --churn 0.1
+    python -m bench.standin --record fixtures.json --upstream-resolve <url> --upstream-profile <url>
+    python -m bench.standin --replay fixtures.json
+
+Then point the bot to it with RESOLVE_URL=http://127.0.0.1:8765/resolve and
+PROFILE_URL=http://127.0.0.1:8765/profile.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from bench.fixtures import profile_payload
+
+# Stesse sigle restituite dall'API reale
+API_PLATFORMS = {"steam": "steam", "playstation": "psn", "psn": "psn", "xbox": "xbox"}
+
+
+class StandinConfig:
+    """
+    Behaviour of the stand-in server.
+    :param latency: Mean latency added to every answer, in seconds.
+    :param jitter: Maximum random latency added on top of latency, in seconds.
+    :param error_rate: Probability of answering with HTTP 503.
+    :param churn: Probability that a player changes league between two profile requests.
+    :param burst_every: Seconds between two 429 bursts, 0 disables them.
+    :param burst_duration: Duration of a 429 burst, in seconds.
+    :param retry_after: Value of the Retry-After header sent during a burst.
+    :param seed: Seed of the random generator, for reproducible runs.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, churn: float = 0.0,
+                 burst_every: float = 0.0, burst_duration: float = 0.0, retry_after: float = 1.0,
+                 seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.churn = churn
+        self.burst_every = burst_every
+        self.burst_duration = burst_duration
+        self.retry_after = retry_after
+        self.seed = seed
+
+
+class StandinStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.rank_changes = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "rank_changes": self.rank_changes,
+        }
+
+
+class StandinServer:
+    """
+    The stand-in server. It can be started from tests and benchmarks:
+
+        server = StandinServer(StandinConfig(latency=0.01))
+        base_url = await server.start()
+        ...
+        await server.stop()
+    """
+
+    def __init__(self, config: StandinConfig | None = None, record: str | Path | None = None,
+                 replay: str | Path | None = None, upstream_resolve: str | None = None,
+                 upstream_profile: str | None = None):
+        if record and (not upstream_resolve or not upstream_profile):
+            raise ValueError("Record mode needs both the upstream resolve and profile URLs")
+        self.config = config or StandinConfig()
+        self.stats = StandinStats()
+        self.record_path = Path(record) if record else None
+        self.upstream = {"resolve": upstream_resolve, "profile": upstream_profile}
+        self.fixtures: dict[str, dict[str, dict]] = {"resolve": {}, "profile": {}}
+        if replay:
+            self.fixtures = json.loads(Path(replay).read_text(encoding="utf-8"))
+        self.replay = replay is not None
+        self.players: dict[str, dict] = {}
+        self.display_names: dict[str, str] = {}
+        self._rng = random.Random(self.config.seed)
+        self._started_at = time.monotonic()
+        self._runner: web.AppRunner | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/resolve", self.resolve)
+        self.app.router.add_post("/profile", self.profile)
+        self.app.router.add_get("/stats", self.get_stats)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Starts the server.
+        :return: The base URL of the server.
+        """
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self._started_at = time.monotonic()
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        self.save_recording()
+
+    def save_recording(self) -> None:
+        if self.record_path is not None:
+            self.record_path.parent.mkdir(parents=True, exist_ok=True)
+            self.record_path.write_text(json.dumps(self.fixtures, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    async def _injected_failure(self) -> web.Response | None:
+        """
+        Applies the configured latency and returns the injected error answer, if any.
+        """
+        self.stats.requests += 1
+        config = self.config
+        delay = config.latency + (self._rng.uniform(0, config.jitter) if config.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if config.burst_every and (time.monotonic() - self._started_at) % config.burst_every < config.burst_duration:
+            self.stats.throttled += 1
+            return web.json_response({"error": "Too many requests"}, status=429,
+                                     headers={"Retry-After": str(config.retry_after)})
+        if config.error_rate and self._rng.random() < config.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"error": "Service unavailable"}, status=503)
+        return None
+
+    async def _from_fixtures(self, endpoint: str, key: str, payload: dict) -> web.Response | None:
+        if self.record_path is not None:
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            async with self._session.post(self.upstream[endpoint], json=payload) as response:
+                body = await response.read()
+                entry = {"status": response.status, "body": json.loads(body) if body else None}
+            if response.status < 500 and response.status != 429:
+                self.fixtures[endpoint][key] = entry
+            return web.json_response(entry["body"], status=entry["status"])
+        if self.replay:
+            entry = self.fixtures.get(endpoint, {}).get(key)
+            if entry is None:
+                return web.json_response({"error": "Not recorded"}, status=404)
+            return web.json_response(entry["body"], status=entry["status"])
+        return None
+
+    async def resolve(self, request: web.Request) -> web.Response:
+        failure = await self._injected_failure()
+        if failure is not None:
+            return failure
+        payload = await request.json()
+        platform = API_PLATFORMS.get(payload.get("platform"))
+        identifier = payload.get("identifier")
+        if platform is None or not identifier:
+            return web.json_response({"error": "Invalid platform or identifier"}, status=400)
+        recorded = await self._from_fixtures("resolve", f"{payload['platform']}:{identifier}", payload)
+        if recorded is not None:
+            return recorded
+        if identifier.startswith("unknown"):
+            return web.json_response({"success": False, "error": "Player not found"}, status=404)
+        platform_id = str(int(hashlib.sha1(identifier.encode()).hexdigest()[:15], 16))
+        self.display_names[platform_id] = identifier
+        return web.json_response({
+            "success": True,
+            "platform": platform,
+            "platform_id": platform_id,
+            "display_name": identifier,
+        })
+
+    async def profile(self, request: web.Request) -> web.Response:
+        failure = await self._injected_failure()
+        if failure is not None:
+            return failure
+        payload = await request.json()
+        platform = API_PLATFORMS.get(payload.get("platform"))
+        platform_id = payload.get("platformId")
+        if platform is None or not platform_id:
+            return web.json_response({"error": "Invalid platform or platformId"}, status=400)
+        recorded = await self._from_fixtures("profile", f"{payload['platform']}:{platform_id}", payload)
+        if recorded is not None:
+            return recorded
+        if platform_id.startswith("unknown"):
+            return web.json_response({"error": "Player not found"}, status=400)
+
+        player = self.players.get(platform_id)
+        if player is None:
+            player = self.players[platform_id] = profile_payload(platform_id, platform)
+            if platform_id in self.display_names:
+                player["player"]["display_name"] = self.display_names[platform_id]
+        elif self.config.churn and self._rng.random() < self.config.churn:
+            rank = player["rank"]
+            rank["current_league"] = min(6, max(0, rank["current_league"] + self._rng.choice((-1, 1))))
+            player["player"]["last_updated_at"] = datetime.datetime.now(datetime.UTC).isoformat()
+            self.stats.rank_changes += 1
+        return web.json_response(player)
+
+    async def get_stats(self, _: web.Request) -> web.Response:
+        return web.json_response(self.stats.as_dict())
+
+
+async def _serve(server: StandinServer, host: str, port: int) -> None:
+    base_url = await server.start(host, port)
+    print(f"Rematch stand-in listening on {base_url} (RESOLVE_URL={base_url}/resolve, PROFILE_URL={base_url}/profile)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 answer")
+    parser.add_argument("--churn", type=float, default=0.0, help="probability of a league change per profile request")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="seconds between 429 bursts")
+    parser.add_argument("--burst-duration", type=float, default=0.0, help="duration of a 429 burst in seconds")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent during a burst")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", help="proxy to the upstream API and save the answers in this file")
+    parser.add_argument("--replay", help="serve only the answers saved in this file")
+    parser.add_argument("--upstream-resolve", help="real RESOLVE_URL, used in record mode")
+    parser.add_argument("--upstream-profile", help="real PROFILE_URL, used in record mode")
+    args = parser.parse_args()
+
+    config = StandinConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, churn=args.churn,
+                           burst_every=args.burst_every, burst_duration=args.burst_duration,
+                           retry_after=args.retry_after, seed=args.seed)
+    server = StandinServer(config, record=args.record, replay=args.replay,
+                           upstream_resolve=args.upstream_resolve, upstream_profile=args.upstream_profile)
+    try:
+        asyncio.run(_serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import os
+import tempfile
 import unittest
 
-from app.lib.db import DatabaseManager
+from app.lib.db import DatabaseManager, configure_url
 
 
 class TestDatabaseManager(unittest.IsolatedAsyncioTestCase):
@@ -26,3 +28,43 @@ class TestDatabaseManager(unittest.IsolatedAsyncioTestCase):
         ) as db_manager:
             self.assertTrue(db_manager._initialized)
         self.assertFalse(self.db_manager._initialized)
+
+
+class TestSqliteProfile(unittest.IsolatedAsyncioTestCase):
+    models = {"models": ["app.lib.db.schemes"]}
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_url = f"sqlite://{os.path.join(self.directory.name, 'profile.db')}"
+
+    async def asyncTearDown(self):
+        await DatabaseManager.close()
+        self.directory.cleanup()
+
+    async def test_performance_profile(self):
+        db_manager = DatabaseManager(self.db_url, self.models, generate_schemas=True, sqlite_profile="performance")
+        await db_manager.connect()
+        pragmas = await db_manager.pragmas()
+        self.assertEqual(pragmas["journal_mode"], "wal")
+        self.assertEqual(pragmas["synchronous"], 1)
+        self.assertEqual(pragmas["busy_timeout"], 5000)
+        self.assertEqual(pragmas["temp_store"], 2)
+
+    async def test_url_overrides_profile(self):
+        db_manager = DatabaseManager(f"{self.db_url}?synchronous=FULL", self.models, generate_schemas=True,
+                                     sqlite_profile="performance")
+        await db_manager.connect()
+        pragmas = await db_manager.pragmas()
+        self.assertEqual(pragmas["synchronous"], 2)
+        self.assertEqual(pragmas["cache_size"], -65536)
+
+    def test_configure_url(self):
+        self.assertEqual(configure_url("sqlite://data/x.db", "legacy"),
+                         "sqlite://data/x.db?journal_mode=DELETE&synchronous=FULL")
+        self.assertEqual(configure_url("sqlite://data/x.db", "default"), "sqlite://data/x.db")
+        self.assertEqual(configure_url("postgres://u:p@db:5432/bot?maxsize=20"),
+                         "postgres://u:p@db:5432/bot?minsize=1&maxsize=20")
+        with self.assertRaises(ValueError):
+            configure_url("sqlite://data/x.db", "fast")
+        with self.assertRaises(ValueError):
+            configure_url("mysql://u:p@db:3306/bot")
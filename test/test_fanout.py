@@ -0,0 +1,102 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from discord import HTTPException
+
+from app.lib.fanout import GuildFanout
+
+
+def throttled(retry_after: str | None = "0.05") -> HTTPException:
+    headers = {"Retry-After": retry_after} if retry_after else {}
+    return HTTPException(SimpleNamespace(status=429, reason="", headers=headers), "You are being rate limited.")
+
+
+class TestGuildFanout(unittest.IsolatedAsyncioTestCase):
+
+    async def test_guilds_run_in_parallel_and_calls_of_a_guild_in_order(self):
+        fanout = GuildFanout(concurrency=10)
+        running: dict[int, int] = {}
+        max_running = 0
+        order: list[tuple[int, int]] = []
+
+        async def call(guild_id: int, n: int) -> int:
+            nonlocal max_running
+            running[guild_id] = running.get(guild_id, 0) + 1
+            self.assertEqual(running[guild_id], 1)
+            max_running = max(max_running, sum(running.values()))
+            await asyncio.sleep(0.02)
+            running[guild_id] -= 1
+            order.append((guild_id, n))
+            return n
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await asyncio.gather(*(fanout.run(guild_id, call, guild_id, n)
+                                         for n in range(3) for guild_id in range(5)))
+        elapsed = loop.time() - start
+        self.assertEqual(results, [n for n in range(3) for _ in range(5)])
+        self.assertEqual(max_running, 5)
+        # 15 chiamate da 20ms in 3 turni invece di 15
+        self.assertLess(elapsed, 0.2)
+        for guild_id in range(5):
+            self.assertEqual([n for g, n in order if g == guild_id], [0, 1, 2])
+
+    async def test_global_concurrency_is_bounded(self):
+        fanout = GuildFanout(concurrency=2)
+        running = max_running = 0
+
+        async def call():
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(fanout.run(guild_id, call) for guild_id in range(6)))
+        self.assertEqual(max_running, 2)
+
+    async def test_throttled_guild_backs_off_alone(self):
+        fanout = GuildFanout(concurrency=4, attempts=3)
+        attempts = 0
+        loop = asyncio.get_running_loop()
+        done_at: dict[int, float] = {}
+        start = loop.time()
+
+        async def call(guild_id: int):
+            nonlocal attempts
+            if guild_id == 1:
+                attempts += 1
+                if attempts == 1:
+                    raise throttled()
+            done_at[guild_id] = loop.time() - start
+            return guild_id
+
+        self.assertEqual(await asyncio.gather(*(fanout.run(g, call, g) for g in range(3))), [0, 1, 2])
+        self.assertGreaterEqual(done_at[1], 0.04)
+        self.assertLess(max(done_at[0], done_at[2]), 0.04)
+        self.assertEqual((fanout.stats.throttled, fanout.stats.retries, fanout.stats.failed), (1, 1, 0))
+
+    async def test_gives_up_after_the_last_attempt(self):
+        fanout = GuildFanout(attempts=2, backoff=0.01)
+
+        async def call():
+            raise throttled(None)
+
+        with self.assertRaises(HTTPException):
+            await fanout.run(1, call)
+        self.assertEqual((fanout.stats.calls, fanout.stats.throttled, fanout.stats.failed), (2, 2, 1))
+
+        async def broken():
+            raise RuntimeError("Missing permissions")
+
+        with self.assertRaises(RuntimeError):
+            await fanout.run(2, broken)
+        self.assertEqual(fanout.stats.calls, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import unittest
+
+from discord import Embed, Colour
+
+from app.lib.log_digest import LogDigestDispatcher, digest_embeds, group_messages, chunk_lines
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, fail: bool = False):
+        self.id = channel_id
+        self.fail = fail
+        self.sent: list[tuple[float, list[Embed]]] = []
+
+    async def send(self, embeds: list[Embed]):
+        if self.fail:
+            raise RuntimeError("Missing access")
+        self.sent.append((asyncio.get_running_loop().time(), embeds))
+
+
+class TestLogDigest(unittest.IsolatedAsyncioTestCase):
+
+    def test_lines_are_chunked(self):
+        lines = [f"{i:02d}" + "x" * 98 for i in range(50)]
+        messages = chunk_lines(lines)
+        self.assertTrue(all(len(message) <= 2000 for message in messages))
+        self.assertEqual(len(messages), 3)
+        self.assertEqual("\n".join(messages).split("\n"), lines)
+        self.assertEqual(chunk_lines(["a" * 2500]), ["a" * 2000])
+        self.assertEqual(chunk_lines([]), [])
+
+    def test_digest_is_paginated(self):
+        embeds = digest_embeds("Auto Rank Update", [f"line {i}" for i in range(45)], 20, Colour.dark_gold())
+        self.assertEqual([e.title for e in embeds], ["Auto Rank Update (1/3)", "Auto Rank Update (2/3)",
+                                                     "Auto Rank Update (3/3)"])
+        self.assertEqual(embeds[2].description, "\n".join(f"line {i}" for i in range(40, 45)))
+
+    def test_messages_respect_discord_limits(self):
+        small = [Embed(description="x") for _ in range(25)]
+        self.assertEqual([len(m) for m in group_messages(small)], [10, 10, 5])
+        large = [Embed(description="x" * 4000) for _ in range(3)]
+        self.assertEqual([len(m) for m in group_messages(large)], [1, 1, 1])
+
+    async def test_lines_are_aggregated_per_channel(self):
+        dispatcher = LogDigestDispatcher(window=60, channel_interval=0)
+        first, second = FakeChannel(1), FakeChannel(2)
+        for i in range(30):
+            dispatcher.add(first, "Auto Rank Update", f"member {i}")
+        dispatcher.add(second, "Auto Rank Update", "member 99")
+        dispatcher.send(second, Embed(title="command"))
+        self.assertEqual(len(dispatcher), 32)
+
+        await dispatcher.flush()
+        self.assertEqual(len(dispatcher), 0)
+        self.assertEqual([len(embeds) for _, embeds in first.sent], [2])
+        self.assertEqual([e.title for e in second.sent[0][1]], ["Auto Rank Update", "command"])
+        self.assertEqual(dispatcher.stats.as_dict(), {"entries": 32, "embeds": 4, "messages": 2, "failures": 0})
+
+    async def test_messages_to_a_channel_are_spaced(self):
+        dispatcher = LogDigestDispatcher(window=60, channel_interval=0.05, page_lines=1)
+        channel = FakeChannel(1)
+        for i in range(3):
+            dispatcher.add(channel, "Auto Rank Update", "x" * 3000 + str(i))
+        await dispatcher.flush()
+        times = [sent_at for sent_at, _ in channel.sent]
+        self.assertEqual(len(times), 3)
+        self.assertTrue(all(b - a >= 0.04 for a, b in zip(times, times[1:])))
+
+    async def test_window_flushes_in_background(self):
+        dispatcher = LogDigestDispatcher(window=0.01, channel_interval=0)
+        channel, broken = FakeChannel(1), FakeChannel(2, fail=True)
+        dispatcher.add(channel, "Auto Rank Update", "member")
+        dispatcher.add(broken, "Auto Rank Update", "member")
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(channel.sent), 1)
+        self.assertEqual(dispatcher.stats.failures, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
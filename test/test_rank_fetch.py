@@ -0,0 +1,109 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from tortoise import Tortoise
+
+from app.cogs import rank_update_scheduler
+from app.cogs.rank_update_scheduler import RankUpdateScheduler
+from app.lib.db.queries import claim_links, start_run
+from app.lib.db.schemes import MemberSchema, PlatformLink, PlatformEnum, RankLinkEnum
+from app.rematch_tracker import Profile
+
+
+class TestFetchRematchProfile(unittest.IsolatedAsyncioTestCase):
+    """
+    _fetch_rematch_profile against an in-memory database, with get_rematch_profile replaced by a stub.
+    """
+
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.lib.db.schemes"]})
+        await Tortoise.generate_schemas()
+        self.originals = (rank_update_scheduler.get_rematch_profile, rank_update_scheduler.REMATCH_FETCH_CONCURRENCY)
+        rank_update_scheduler.get_rematch_profile = self.get_rematch_profile
+        rank_update_scheduler.REMATCH_FETCH_CONCURRENCY = 4
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+        self.scheduler = RankUpdateScheduler.__new__(RankUpdateScheduler)
+        self.scheduler.bot = SimpleNamespace()
+
+        await MemberSchema.bulk_create([MemberSchema(discord_id=i, username=f"user{i}") for i in range(20)])
+        await PlatformLink.bulk_create([
+            PlatformLink(discord_id_id=i, platform=PlatformEnum.STEAM, platform_id=str(i),
+                         rematch_display_name=f"P{i}", cached_rank=RankLinkEnum.BRONZO)
+            for i in range(20)
+        ])
+        self.run = await start_run()
+
+    async def asyncTearDown(self):
+        rank_update_scheduler.get_rematch_profile, rank_update_scheduler.REMATCH_FETCH_CONCURRENCY = self.originals
+        await Tortoise.close_connections()
+
+    async def get_rematch_profile(self, platform, platform_id, priority):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.active -= 1
+        discord_id = int(platform_id)
+        if discord_id == 19:
+            return None
+        # I membri con id pari salgono a oro
+        league = RankLinkEnum.ORO if discord_id % 2 == 0 else RankLinkEnum.BRONZO
+        return Profile(platform, platform_id, f"P{discord_id}", int(league), 1, "2025-01-01T00:00:00Z")
+
+    async def claim(self) -> list[PlatformLink]:
+        link_ids = list(await PlatformLink.all().values_list("id", flat=True))
+        return await claim_links(link_ids, self.run, lease_seconds=600)
+
+    async def test_fetch_saves_the_check_results(self):
+        changed = await self.scheduler._fetch_rematch_profile(await self.claim())
+
+        self.assertEqual(changed, {i: RankLinkEnum.ORO for i in range(0, 19, 2)})
+        self.assertEqual(self.calls, 20)
+        self.assertEqual(self.peak, 4)
+        progress = self.scheduler.fetch_progress
+        self.assertEqual((progress.done, progress.changed, progress.unchanged, progress.failed), (20, 10, 9, 1))
+
+        # Il link fallito resta in carico al run, gli altri sono salvati e rilasciati
+        links = {link.discord_id_id: link for link in await PlatformLink.all()}
+        self.assertIsNotNone(links[19].lease_run_id)
+        self.assertIsNone(links[19].rank_hash)
+        for discord_id in range(19):
+            link = links[discord_id]
+            self.assertIsNone(link.lease_run_id)
+            self.assertIsNotNone(link.rank_hash)
+            self.assertIsNotNone(link.next_check_at)
+            self.assertIsNotNone(link.last_checked)
+        # Il cambio di rank non è ancora salvato: nessun intervallo minimo
+        self.assertIsNone(links[0].last_rank_change_at)
+
+    async def test_unchanged_profiles_are_skipped(self):
+        await self.scheduler._fetch_rematch_profile(await self.claim())
+        await PlatformLink.filter(discord_id_id__in=list(range(0, 19, 2))).update(cached_rank=RankLinkEnum.ORO)
+
+        changed = await self.scheduler._fetch_rematch_profile(await self.claim())
+        self.assertEqual(changed, {})
+        progress = self.scheduler.fetch_progress
+        self.assertEqual((progress.skipped, progress.changed, progress.failed), (19, 0, 1))
+
+    async def test_changed_links_stay_leased_for_the_pipeline(self):
+        received = []
+
+        async def on_changed(link, rank):
+            received.append((link.discord_id_id, rank))
+
+        await self.scheduler._fetch_rematch_profile(await self.claim(), on_changed=on_changed)
+        self.assertEqual(sorted(received), [(i, RankLinkEnum.ORO) for i in range(0, 19, 2)])
+        leased = await PlatformLink.filter(lease_run_id=self.run.id).values_list("discord_id_id", flat=True)
+        self.assertEqual(sorted(leased), list(range(0, 19, 2)) + [19])
+
+
+if __name__ == '__main__':
+    unittest.main()
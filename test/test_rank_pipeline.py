@@ -0,0 +1,365 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import datetime
+import unittest
+from types import SimpleNamespace
+
+from discord import HTTPException
+
+from app.cogs import rank_update_scheduler
+from app.cogs.rank_update_scheduler import RankUpdateScheduler
+from app.lib.db.membership import membership
+from app.lib.db.schemes import RankLinkEnum, RunStatusEnum
+from app.lib.scheduling import DueQueue, RunStatsHistory
+from app.lib.user_resolver import UserResolver
+
+
+class FakeScheduler(RankUpdateScheduler):
+    """
+    Scheduler whose stages are replaced by fakes, so the pipeline runs without Discord and the Rematch API.
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, changed: int):
+        self.bot = SimpleNamespace(memory_monitor=lambda: None)
+        self.changed = changed
+        self.events: list[str] = []
+        self.saved: list[list[int]] = []
+
+    async def _fetch_rematch_profile(self, platform_links, on_changed=None):
+        for discord_id in range(self.changed):
+            await asyncio.sleep(0)
+            await on_changed(SimpleNamespace(id=discord_id, discord_id_id=discord_id), RankLinkEnum.ORO)
+            self.events.append(f"fetched {discord_id}")
+        self.events.append("fetch done")
+        return {}
+
+    async def _fetch_user(self, discord_id):
+        return None if discord_id == 3 else SimpleNamespace(id=discord_id)
+
+    async def _get_mutual_guilds(self, user):
+        if user.id == 4:
+            raise RuntimeError("lookup failed")
+        return [SimpleNamespace(id=1)]
+
+    async def _update_member_ranks(self, user, guilds, rank):
+        await asyncio.sleep(0.001)
+        self.events.append(f"updated {user.id}")
+        # Nessuna guild aggiornata per l'utente 5, ad esempio se non è più membro
+        return 0 if user.id == 5 else len(guilds)
+
+    async def _complete(self, link):
+        self.events.append(f"completed {link.id}")
+
+    async def _save_ranks(self, platform_links):
+        if platform_links:
+            self.saved.append([link.id for link in platform_links])
+
+
+class TestRankPipeline(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.queue_size = rank_update_scheduler.RANK_PIPELINE_QUEUE_SIZE
+        rank_update_scheduler.RANK_PIPELINE_QUEUE_SIZE = 2
+
+    def tearDown(self):
+        rank_update_scheduler.RANK_PIPELINE_QUEUE_SIZE = self.queue_size
+
+    async def test_updates_start_before_the_fetch_ends(self):
+        scheduler = FakeScheduler(changed=50)
+        await asyncio.wait_for(scheduler._process_links([]), timeout=5)
+
+        updated = [event for event in scheduler.events if event.startswith("updated")]
+        # L'utente 3 non esiste e il lookup dell'utente 4 fallisce
+        self.assertEqual(len(updated), 48)
+        self.assertNotIn("updated 3", updated)
+        self.assertNotIn("updated 4", updated)
+        self.assertLess(scheduler.events.index("updated 0"), scheduler.events.index("fetch done"))
+        # Ogni link cambiato viene completato, anche quelli senza utente o con un errore
+        completed = [event for event in scheduler.events if event.startswith("completed")]
+        self.assertEqual(len(completed), 50)
+        self.assertLess(scheduler.events.index("updated 0"), scheduler.events.index("completed 0"))
+
+    async def test_stage_stats(self):
+        scheduler = FakeScheduler(changed=50)
+        updated = await asyncio.wait_for(scheduler._process_links([]), timeout=5)
+        self.assertEqual(updated, 47)
+        stages = scheduler.run_stats.stages
+        self.assertEqual((stages["user_fetch"].items, stages["user_fetch"].passed, stages["user_fetch"].dropped),
+                         (50, 49, 1))
+        self.assertEqual((stages["guild_filter"].items, stages["guild_filter"].passed, stages["guild_filter"].errors),
+                         (49, 48, 1))
+        self.assertEqual((stages["role_update"].items, stages["role_update"].passed, stages["role_update"].dropped),
+                         (48, 47, 1))
+        self.assertEqual(stages["role_update"].calls, 48)
+        self.assertGreater(stages["role_update"].total_time, 0)
+
+    async def test_ranks_are_saved_in_batches(self):
+        batch = rank_update_scheduler.RANK_SAVE_BATCH
+        rank_update_scheduler.RANK_SAVE_BATCH = 20
+        try:
+            scheduler = FakeScheduler(changed=50)
+            await asyncio.wait_for(scheduler._process_links([]), timeout=5)
+        finally:
+            rank_update_scheduler.RANK_SAVE_BATCH = batch
+        saved = scheduler.saved
+        self.assertEqual([len(ids) for ids in saved], [20, 20, 7])
+        self.assertEqual(sorted(i for ids in saved for i in ids), [i for i in range(50) if i not in (3, 4, 5)])
+
+    async def test_queues_are_bounded(self):
+        scheduler = FakeScheduler(changed=30)
+        max_pending = 0
+        original = scheduler._update_member_ranks
+
+        async def slow_update(user, guilds, rank):
+            nonlocal max_pending
+            fetched = sum(1 for event in scheduler.events if event.startswith("fetched"))
+            updated = sum(1 for event in scheduler.events if event.startswith("completed"))
+            max_pending = max(max_pending, fetched - updated)
+            await original(user, guilds, rank)
+
+        scheduler._update_member_ranks = slow_update
+        await asyncio.wait_for(scheduler._process_links([]), timeout=5)
+        # Due code da 2 elementi, più quelli in lavorazione in ogni stadio
+        self.assertLessEqual(max_pending, 8)
+
+    async def test_no_changes(self):
+        scheduler = FakeScheduler(changed=0)
+        await asyncio.wait_for(scheduler._process_links([]), timeout=5)
+        self.assertEqual(scheduler.events, ["fetch done"])
+
+
+class LoopScheduler(RankUpdateScheduler):
+    """
+    Scheduler whose database calls are replaced by fakes, to run a tick of the updater loop.
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, link_ids: list[int]):
+        self.bot = SimpleNamespace(memory_monitor=lambda: None)
+        self.fetch_progress = None
+        self.run_history = RunStatsHistory()
+        self.user_resolver = UserResolver(self.bot)
+        self.due_queue = DueQueue()
+        self.check_intervals = {}
+        self._due_queue_loaded = True
+        for link_id in link_ids:
+            self.due_queue.push(link_id, 0)
+
+    async def _schedule_new_links(self, now):
+        pass
+
+    async def _filter_eligible(self, platform_links, now):
+        return platform_links
+
+    async def _process_links(self, platform_links):
+        return 0
+
+
+class TestUpdaterLoop(unittest.IsolatedAsyncioTestCase):
+    patched = ("is_downtime", "start_run", "claim_links", "get_existing_links", "release_leases", "finish_run")
+
+    def setUp(self):
+        self.originals = {name: getattr(rank_update_scheduler, name) for name in self.patched}
+        self.finished: list[RunStatusEnum] = []
+        rank_update_scheduler.is_downtime = lambda: False
+        rank_update_scheduler.start_run = self.start_run
+        rank_update_scheduler.claim_links = self.claim_links
+        rank_update_scheduler.get_existing_links = self.get_existing_links
+        rank_update_scheduler.release_leases = self.release_leases
+        rank_update_scheduler.finish_run = self.finish_run
+        self.fail_on = None
+
+    def tearDown(self):
+        for name, original in self.originals.items():
+            setattr(rank_update_scheduler, name, original)
+
+    def maybe_fail(self, name: str) -> None:
+        if self.fail_on == name:
+            raise RuntimeError("database is locked")
+
+    async def start_run(self):
+        self.maybe_fail("start_run")
+        return SimpleNamespace(id=1)
+
+    async def claim_links(self, link_ids, run, lease_seconds):
+        self.maybe_fail("claim_links")
+        return [SimpleNamespace(id=link_id, lease_run_id=run.id, check_interval=None, next_check_at=None)
+                for link_id in link_ids]
+
+    async def get_existing_links(self, link_ids):
+        return link_ids
+
+    async def release_leases(self, platform_links):
+        return len(platform_links)
+
+    async def finish_run(self, run, status, **counters):
+        self.finished.append(status)
+        self.maybe_fail("finish_run")
+
+    async def tick(self, scheduler: RankUpdateScheduler) -> None:
+        await RankUpdateScheduler._updater_loop.coro(scheduler)
+
+    async def test_links_requeued_when_the_run_cannot_start(self):
+        self.fail_on = "start_run"
+        scheduler = LoopScheduler([1, 2, 3])
+        await self.tick(scheduler)
+        self.assertEqual(sorted(scheduler.due_queue._due), [1, 2, 3])
+        self.assertEqual(self.finished, [])
+
+    async def test_links_requeued_when_the_claim_fails(self):
+        self.fail_on = "claim_links"
+        scheduler = LoopScheduler([1, 2, 3])
+        await self.tick(scheduler)
+        self.assertEqual(sorted(scheduler.due_queue._due), [1, 2, 3])
+        self.assertEqual(self.finished, [RunStatusEnum.FAILED])
+        self.assertIsNotNone(scheduler.run_history.latest.duration)
+
+    async def test_links_rescheduled_when_the_journal_fails(self):
+        self.fail_on = "finish_run"
+        scheduler = LoopScheduler([1, 2, 3])
+        await self.tick(scheduler)
+        self.assertEqual(sorted(scheduler.due_queue._due), [1, 2, 3])
+        self.assertEqual(self.finished, [RunStatusEnum.COMPLETED])
+
+
+class TestRankChangeSchedule(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.original = rank_update_scheduler.save_cached_ranks
+        self.checked_at = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+    def tearDown(self):
+        rank_update_scheduler.save_cached_ranks = self.original
+
+    def make_link(self) -> SimpleNamespace:
+        # Schedule lasciato dal controllo del profilo, senza cambio di rank
+        return SimpleNamespace(id=1, check_interval=4050, next_check_at=self.checked_at, last_checked=self.checked_at,
+                               last_rank_change_at=None, last_updated_at=self.checked_at)
+
+    async def test_saved_rank_counts_as_a_change(self):
+        async def save_cached_ranks(platform_links):
+            return len(platform_links)
+
+        rank_update_scheduler.save_cached_ranks = save_cached_ranks
+        link = self.make_link()
+        await LoopScheduler([])._save_ranks([link])
+        self.assertEqual(link.check_interval, rank_update_scheduler.RANK_CHECK_MIN_INTERVAL)
+        self.assertIsNotNone(link.last_rank_change_at)
+
+    async def test_unsaved_rank_keeps_the_backoff(self):
+        async def save_cached_ranks(platform_links):
+            raise RuntimeError("database is locked")
+
+        rank_update_scheduler.save_cached_ranks = save_cached_ranks
+        link = self.make_link()
+        await LoopScheduler([])._save_ranks([link])
+        self.assertEqual(link.check_interval, 4050)
+        self.assertEqual(link.next_check_at, self.checked_at)
+        self.assertIsNone(link.last_rank_change_at)
+
+
+class TestMutualGuilds(unittest.IsolatedAsyncioTestCase):
+
+    async def test_membership_changes_during_the_lookup(self):
+        user_id = 987654321
+
+        class RankPlans:
+            async def get(self, guild_id):
+                # Il membro entra in un'altra guild mentre il piano viene caricato
+                membership.member_joined(guild_id + 100, user_id)
+                return SimpleNamespace(configured=True)
+
+        original = rank_update_scheduler.rank_plans
+        rank_update_scheduler.rank_plans = RankPlans()
+        membership.add_members(1, (user_id,))
+        membership.add_members(2, (user_id,))
+        try:
+            scheduler = LoopScheduler([])
+            scheduler.bot.get_guild = lambda guild_id: SimpleNamespace(id=guild_id)
+            guilds = await scheduler._get_mutual_guilds(SimpleNamespace(id=user_id))
+        finally:
+            rank_update_scheduler.rank_plans = original
+            for guild_id in (1, 2, 101, 102):
+                membership.member_left(guild_id, user_id)
+        self.assertEqual(sorted(guild.id for guild in guilds), [1, 2])
+
+    async def test_member_not_found_leaves_the_index(self):
+        user_id = 987654322
+
+        async def fetch_member(discord_id):
+            raise HTTPException(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+
+        async def member_left(user, left_at, guild_id):
+            left.append((user.id, guild_id))
+
+        left = []
+        original = rank_update_scheduler.member_left
+        rank_update_scheduler.member_left = member_left
+        membership.add_members(5, (user_id,))
+        try:
+            guild = SimpleNamespace(id=5, get_member=lambda discord_id: None, fetch_member=fetch_member)
+            updated = await LoopScheduler([])._update_guild_member(SimpleNamespace(id=user_id), guild,
+                                                                   RankLinkEnum.ORO)
+        finally:
+            rank_update_scheduler.member_left = original
+        self.assertFalse(updated)
+        self.assertEqual(membership.guilds_of(user_id), set())
+        self.assertEqual(left, [(user_id, 5)])
+
+
+class FakeContext:
+    def __init__(self):
+        self.sent: list[str] = []
+
+    async def send(self, content: str):
+        if len(content) > 2000:
+            raise ValueError("Must be 2000 or fewer in length.")
+        self.sent.append(content)
+
+
+class TestStatsCommands(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rank_stats_fit_the_message_limit(self):
+        scheduler = LoopScheduler([])
+        for run_id in range(3):
+            stats = scheduler.run_history.start(run_id)
+            for name in ("claim", "eligibility", "fetch", "save", "user_fetch", "guild_filter", "role_update",
+                         "rank_save"):
+                stage = stats.stage(name)
+                for seconds in (0.004, 0.03, 0.2, 0.7, 3.0, 9.0):
+                    stage.observe(seconds, 1000)
+                stage.passed, stage.dropped, stage.errors = 4000, 1500, 500
+            stats.counters["users"] = scheduler.user_resolver.run_stats.as_dict()
+            await scheduler.run_history.finish(stats)
+        ctx = FakeContext()
+        await RankUpdateScheduler.rank_stats.callback(scheduler, ctx, 3)
+        self.assertGreater(len(ctx.sent), 1)
+        self.assertEqual(sum(message.count("**#") for message in ctx.sent), 3)
+
+
+    async def test_rank_runs_fit_the_message_limit(self):
+        started_at = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+        runs = [SimpleNamespace(id=100000 + i, status=RunStatusEnum.INTERRUPTED, started_at=started_at,
+                                finished_at=started_at + datetime.timedelta(seconds=1234.5), claimed=100000,
+                                checked=100000, changed=100000, skipped=100000, failed=100000, updated=100000)
+                for i in range(25)]
+
+        async def get_recent_runs(limit):
+            return runs[:limit]
+
+        original = rank_update_scheduler.get_recent_runs
+        rank_update_scheduler.get_recent_runs = get_recent_runs
+        try:
+            ctx = FakeContext()
+            await RankUpdateScheduler.rank_runs.callback(LoopScheduler([]), ctx, 25)
+        finally:
+            rank_update_scheduler.get_recent_runs = original
+        self.assertGreater(len(ctx.sent), 1)
+        self.assertEqual(sum(message.count("**#") for message in ctx.sent), 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from app.rematch_tracker.cache import TTLCache, SqliteCacheStore, TwoTierCache
+
+
+class TestRematchCache(unittest.TestCase):
+
+    def test_ttl_cache_expires_entries(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1, expires_at=time.time() - 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats.expirations, 1)
+
+    def test_ttl_cache_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats.evictions, 1)
+
+
+
+class TestTwoTierCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_two_tier_cache_counts_hits_and_misses(self):
+        cache = TwoTierCache("profile", maxsize=10, ttl=60)
+        self.assertIsNone(await cache.get(("psn", "1")))
+        cache.set(("psn", "1"), {"rank": {"current_league": 3}})
+        self.assertEqual(await cache.get(("psn", "1")), {"rank": {"current_league": 3}})
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.misses, 1)
+
+    async def test_two_tier_cache_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "cache.db"
+            store = SqliteCacheStore(path)
+            cache = TwoTierCache("profile", maxsize=10, ttl=60, store=store)
+            cache.set(("psn", "1"), {"level": 10})
+            await cache.flush()
+            store.close()
+
+            restarted = TwoTierCache("profile", maxsize=10, ttl=60, store=SqliteCacheStore(path))
+            self.assertEqual(await restarted.get(("psn", "1")), {"level": 10})
+            self.assertEqual(restarted.stats.disk_hits, 1)
+            self.assertEqual(len(restarted.memory), 1)
+            restarted.store.close()
+
+    async def test_disk_writes_are_batched(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SqliteCacheStore(Path(tmp) / "cache.db")
+            cache = TwoTierCache("profile", maxsize=1, ttl=60, store=store, flush_delay=0.01)
+            for i in range(20):
+                cache.set(("psn", str(i)), {"level": i})
+            cache.invalidate(("psn", "3"))
+            # Le scritture in coda valgono anche per le voci uscite dalla memoria
+            self.assertEqual(await cache.get(("psn", "5")), {"level": 5})
+            self.assertIsNone(await cache.get(("psn", "3")))
+            await asyncio.sleep(0.05)
+            self.assertEqual((cache.stats.disk_writes, cache.stats.disk_flushes), (19, 1))
+            self.assertEqual(store.get("profile", "psn:7")[0], {"level": 7})
+            self.assertIsNone(store.get("profile", "psn:3"))
+            store.close()
+
+    async def test_close_stops_the_store_thread(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SqliteCacheStore(Path(tmp) / "cache.db")
+            cache = TwoTierCache("profile", maxsize=10, ttl=60, store=store)
+            cache.set(("psn", "1"), {"level": 1})
+            await cache.flush()
+            store.close()
+            self.assertIsNone(store._conn)
+            with self.assertRaises(RuntimeError):
+                await store.run(store.get, "profile", "psn:1")
+
+    async def test_disk_errors_are_not_raised(self):
+        class BrokenStore(SqliteCacheStore):
+            def write_many(self, namespace, writes):
+                raise sqlite3.OperationalError("database is locked")
+
+            def get(self, namespace, key):
+                raise sqlite3.OperationalError("database is locked")
+
+        cache = TwoTierCache("profile", maxsize=10, ttl=60, store=BrokenStore(":memory:"))
+        cache.set(("psn", "1"), {"level": 1})
+        cache.invalidate(("psn", "1"))
+        self.assertEqual(await cache.flush(), 0)
+        self.assertIsNone(await cache.get(("psn", "1")))
+
+if __name__ == '__main__':
+    unittest.main()
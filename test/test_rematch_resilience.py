@@ -0,0 +1,213 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import unittest
+
+from aiohttp import web
+
+import app.rematch_tracker as tracker
+from app.logger import logger
+
+from app.rematch_tracker.singleflight import SingleFlight
+from app.rematch_tracker.rate_limiter import AdaptiveRateLimiter, RequestPriority, parse_retry_after
+from app.rematch_tracker.circuit_breaker import CircuitBreaker, CircuitState
+from app.rematch_tracker.http_session import close_session
+from app.rematch_tracker.retry import RetryPolicy
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_calls_share_one_request(self):
+        flight = SingleFlight("profile")
+        executed = 0
+
+        async def request():
+            nonlocal executed
+            executed += 1
+            await asyncio.sleep(0.01)
+            return {"rank": {"current_league": 2}}
+
+        results = await asyncio.gather(*(flight.do(("psn", "1"), request) for _ in range(5)))
+        self.assertEqual(executed, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(flight.coalesced, 4)
+        self.assertEqual(flight.in_flight, 0)
+
+    async def test_cancelled_caller_does_not_cancel_shared_request(self):
+        flight = SingleFlight("profile")
+
+        async def request():
+            await asyncio.sleep(0.02)
+            return 1
+
+        first = asyncio.ensure_future(flight.do("k", request))
+        second = asyncio.ensure_future(flight.do("k", request))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, 1)
+
+
+class TestAdaptiveRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_aimd_adjusts_rate(self):
+        limiter = AdaptiveRateLimiter(rate=4, min_rate=1, max_rate=5, capacity=4)
+        limiter.on_error()
+        self.assertEqual(limiter.rate, 2)
+        limiter.on_error()
+        self.assertEqual(limiter.rate, 2, "Errors of the same burst decrease the rate once")
+        for _ in range(50):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 5)
+
+    async def test_background_requests_leave_the_interactive_reserve(self):
+        limiter = AdaptiveRateLimiter(rate=0.01, min_rate=0.01, max_rate=0.01, capacity=5, reserved_share=0.4)
+        for _ in range(3):
+            await asyncio.wait_for(limiter.acquire(RequestPriority.BACKGROUND), 0.1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(RequestPriority.BACKGROUND), 0.1)
+        await asyncio.wait_for(limiter.acquire(RequestPriority.INTERACTIVE), 0.1)
+
+    async def test_throttle_pauses_requests(self):
+        limiter = AdaptiveRateLimiter(rate=100, min_rate=1, max_rate=100, capacity=10)
+        limiter.on_throttle(0.2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(), 0.1)
+        self.assertEqual(limiter.throttled, 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("profile", failure_threshold=2, recovery_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.CLOSED)
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.OPEN)
+        self.assertFalse(breaker.allow_request())
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker("profile", failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request(), "Only one probe at a time")
+        breaker.record_success()
+        self.assertIs(breaker.state, CircuitState.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("profile", failure_threshold=3, recovery_timeout=0)
+        for _ in range(3):
+            breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.recovery_timeout = 60
+        breaker.record_failure()
+        self.assertIs(breaker.state, CircuitState.OPEN)
+        self.assertEqual(breaker.times_opened, 2)
+
+
+class TestRetryPolicy(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.statuses = []
+        self.hits = 0
+        self.raw_body = None
+
+        async def profile(request: web.Request) -> web.Response:
+            self.hits += 1
+            status = self.statuses.pop(0) if self.statuses else 200
+            if status != 200:
+                if self.raw_body is not None:
+                    return web.Response(text=self.raw_body, status=status)
+                return web.json_response({"error": "unavailable"}, status=status)
+            body = await request.json()
+            return web.json_response({
+                "player": {"platform": body["platform"], "platform_id": body["platformId"]},
+                "rank": {"current_league": 4, "current_division": 1}
+            })
+
+        app = web.Application()
+        app.router.add_post("/profile", profile)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self._url = tracker.PROFILE_URL
+        tracker.PROFILE_URL = f"http://127.0.0.1:{port}/profile"
+        tracker.retry_policy.base_delay = 0.01
+        tracker.profile_cache.clear()
+        tracker.profile_breaker.record_success()
+
+    async def asyncTearDown(self):
+        tracker.PROFILE_URL = self._url
+        await close_session()
+        await self.runner.cleanup()
+
+    def test_backoff_is_bounded(self):
+        policy = RetryPolicy(base_delay=1, max_delay=4)
+        for attempt in range(10):
+            self.assertLessEqual(policy.backoff(attempt), 4)
+
+    def test_classification(self):
+        self.assertTrue(RetryPolicy.is_retryable_status(503))
+        self.assertFalse(RetryPolicy.is_retryable_status(400))
+        self.assertTrue(RetryPolicy.is_retryable_error(asyncio.TimeoutError()))
+
+    async def test_transient_error_is_retried(self):
+        self.statuses = [503, 502]
+        profile = await tracker.get_rematch_profile(platform="psn", platform_id="retry_1")
+        self.assertEqual(profile["rank"]["current_league"], 4)
+        self.assertEqual(self.hits, 3)
+
+    async def test_fatal_status_is_not_retried(self):
+        self.statuses = [400]
+        profile = await tracker.get_rematch_profile(platform="psn", platform_id="retry_2")
+        self.assertIsNone(profile)
+        self.assertEqual(self.hits, 1)
+
+    async def test_fatal_status_after_retry_is_not_recovered(self):
+        self.statuses = [503, 400]
+        recovered, exhausted = tracker.retry_policy.recovered, tracker.retry_policy.exhausted
+        profile = await tracker.get_rematch_profile(platform="psn", platform_id="retry_3")
+        self.assertIsNone(profile)
+        self.assertEqual(self.hits, 2)
+        self.assertEqual(tracker.retry_policy.recovered, recovered)
+        self.assertEqual(tracker.retry_policy.exhausted, exhausted)
+
+    async def test_undecodable_error_body_is_logged_with_status(self):
+        self.statuses = [400]
+        self.raw_body = "<html>Bad Gateway</html>"
+        with self.assertLogs(logger, "WARNING") as logs:
+            profile = await tracker.get_rematch_profile(platform="psn", platform_id="retry_4")
+        self.assertIsNone(profile)
+        self.assertTrue(any("status 400" in line for line in logs.output))
+        self.assertFalse(any("no response" in line for line in logs.output))
+
+    async def test_first_wait_is_bounded(self):
+        queue_timeout, rate = tracker.REMATCH_QUEUE_TIMEOUT, tracker.rate_limiter.rate
+        tracker.REMATCH_QUEUE_TIMEOUT = 0.1
+        tracker.rate_limiter.on_throttle(30)
+        try:
+            profile = await asyncio.wait_for(
+                tracker.get_rematch_profile(platform="psn", platform_id="queued_1",
+                                            priority=RequestPriority.BACKGROUND), 5)
+        finally:
+            tracker.REMATCH_QUEUE_TIMEOUT = queue_timeout
+            tracker.rate_limiter.blocked_until = 0.0
+            tracker.rate_limiter.rate = rate
+        self.assertIsNone(profile)
+        self.assertEqual(self.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
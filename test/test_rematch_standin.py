@@ -0,0 +1,85 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import app.rematch_tracker as tracker
+from app.lib.db.schemes import PlatformEnum
+from app.rematch_tracker.http_session import close_session
+from bench.standin import StandinServer, StandinConfig
+
+
+class TestRematchTrackerOffline(unittest.IsolatedAsyncioTestCase):
+    """
+    Same checks of test_rematch_tracker, run against the local stand-in instead of the live API.
+    """
+
+    async def asyncSetUp(self):
+        self.server = StandinServer(StandinConfig(seed=1))
+        await self._point_to(self.server)
+
+    async def _point_to(self, server: StandinServer):
+        base_url = await server.start()
+        self._urls = tracker.RESOLVE_URL, tracker.PROFILE_URL
+        tracker.RESOLVE_URL = f"{base_url}/resolve"
+        tracker.PROFILE_URL = f"{base_url}/profile"
+        tracker.resolve_cache.clear()
+        tracker.profile_cache.clear()
+        tracker.retry_policy.base_delay = 0.01
+        tracker.rate_limiter.tokens = tracker.rate_limiter.capacity
+        tracker.rate_limiter.blocked_until = 0.0
+
+    async def asyncTearDown(self):
+        tracker.RESOLVE_URL, tracker.PROFILE_URL = self._urls
+        await close_session()
+        await self.server.stop()
+
+    async def test_resolve_profile_rematch_id(self):
+        response = await tracker.resolve_rematch_id(platform=PlatformEnum.PSN, identifier="Tvrsier")
+        self.assertIsNotNone(response)
+        self.assertEqual(response["player"]["display_name"], "Tvrsier")
+        self.assertEqual(response["player"]["platform"], "psn")
+        self.assertIn(response["rank"]["current_league"], range(7))
+
+    async def test_resolve_rematch_id_unknown_player(self):
+        response = await tracker.resolve_rematch_id(platform=PlatformEnum.STEAM, identifier="unknown_identifier")
+        self.assertIsNone(response)
+
+    async def test_throttled_request_is_retried(self):
+        self.server.config.burst_every = 60
+        self.server.config.burst_duration = 0.1
+        self.server.config.retry_after = 0.2
+        self.server._started_at = time.monotonic()
+        response = await tracker.get_rematch_profile(platform="psn", platform_id="42")
+        self.assertIsNotNone(response)
+        self.assertGreaterEqual(self.server.stats.throttled, 1)
+
+    async def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fixtures = Path(tmp) / "fixtures.json"
+            recorder = StandinServer(record=fixtures, upstream_resolve=tracker.RESOLVE_URL,
+                                     upstream_profile=tracker.PROFILE_URL)
+            await close_session()
+            recorded_urls = self._urls
+            await self._point_to(recorder)
+            self._urls = recorded_urls
+            recorded = await tracker.get_rematch_profile(platform="psn", platform_id="7")
+            await recorder.stop()
+            self.assertIn("psn:7", json.loads(fixtures.read_text())["profile"])
+
+            replayer = StandinServer(replay=fixtures)
+            await close_session()
+            await self._point_to(replayer)
+            self._urls = recorded_urls
+            tracker.profile_cache.clear()
+            self.assertEqual(await tracker.get_rematch_profile(platform="psn", platform_id="7"), recorded)
+            self.assertIsNone(await tracker.get_rematch_profile(platform="psn", platform_id="8"))
+            await replayer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
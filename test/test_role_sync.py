@@ -0,0 +1,53 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import unittest
+from types import SimpleNamespace
+
+from app.lib.role_sync import target_roles, RoleSyncStats
+
+
+def role(role_id: int, default: bool = False):
+    return SimpleNamespace(id=role_id, is_default=lambda: default)
+
+
+class TestTargetRoles(unittest.TestCase):
+
+    def setUp(self):
+        self.everyone = role(0, default=True)
+        self.other = role(1)
+        self.bronze = role(10)
+        self.silver = role(11)
+        self.gold = role(12)
+        self.rank_roles = [self.bronze, self.silver, self.gold]
+
+    def test_swaps_the_rank_role(self):
+        roles, legacy_calls = target_roles([self.everyone, self.other, self.bronze], self.rank_roles, self.silver)
+        self.assertEqual([r.id for r in roles], [1, 11])
+        self.assertEqual(legacy_calls, 2)
+
+    def test_adds_the_first_rank_role(self):
+        roles, legacy_calls = target_roles([self.everyone, self.other], self.rank_roles, self.gold)
+        self.assertEqual([r.id for r in roles], [1, 12])
+        self.assertEqual(legacy_calls, 1)
+
+    def test_member_already_up_to_date(self):
+        roles, legacy_calls = target_roles([self.everyone, self.other, self.gold], self.rank_roles, self.gold)
+        self.assertEqual([r.id for r in roles], [1, 12])
+        self.assertEqual(legacy_calls, 0)
+
+    def test_unlinked_rank_drops_every_rank_role(self):
+        roles, legacy_calls = target_roles([self.other, self.bronze, self.silver], self.rank_roles, None)
+        self.assertEqual([r.id for r in roles], [1])
+        self.assertEqual(legacy_calls, 1)
+
+    def test_stats_count_avoided_calls(self):
+        stats = RoleSyncStats()
+        stats.record(2)
+        stats.record(1)
+        stats.record(0)
+        self.assertEqual(stats.as_dict(), {"edits": 2, "unchanged": 1, "calls_avoided": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import datetime
+import json
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.lib.scheduling import DueQueue, jittered_interval, AdaptivePollingPolicy, interval_distribution, \
+    RunStatsHistory, StageStats
+
+
+class TestDueQueue(unittest.TestCase):
+
+    def test_pop_due_returns_due_links_in_order(self):
+        queue = DueQueue()
+        queue.push(1, 30.0)
+        queue.push(2, 10.0)
+        queue.push(3, 20.0)
+        queue.push(4, 100.0)
+        self.assertEqual(queue.pop_due(50.0), [2, 3, 1])
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.next_due(), 100.0)
+        self.assertEqual(queue.pop_due(50.0), [])
+
+    def test_push_reschedules_a_link(self):
+        queue = DueQueue()
+        queue.push(1, 10.0)
+        queue.push(1, 60.0)
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.pop_due(30.0), [])
+        self.assertEqual(queue.pop_due(60.0), [1])
+        self.assertNotIn(1, queue)
+
+    def test_pop_due_limit_and_discard(self):
+        queue = DueQueue()
+        for link_id in range(10):
+            queue.push(link_id, float(link_id))
+        queue.discard(0)
+        self.assertEqual(queue.pop_due(100.0, limit=3), [1, 2, 3])
+        self.assertEqual(len(queue), 6)
+
+    def test_spread_overdue(self):
+        queue = DueQueue()
+        for link_id in range(100):
+            queue.push(link_id, 0.0)
+        queue.push(100, 5000.0)
+        self.assertEqual(queue.spread_overdue(1000.0, 600.0, random.Random(1)), 100)
+        self.assertEqual(queue.pop_due(1000.0), [])
+        due = [queue.due_at(link_id) for link_id in range(100)]
+        self.assertTrue(all(1000.0 <= due_at <= 1600.0 for due_at in due))
+        # Distribuiti su tutta la finestra, non in un unico blocco
+        self.assertGreater(max(due) - min(due), 300.0)
+        self.assertEqual(queue.due_at(100), 5000.0)
+        self.assertEqual(queue.as_dict(1000.0)["overdue"], 0)
+
+    def test_jittered_interval(self):
+        rng = random.Random(1)
+        intervals = [jittered_interval(100.0, 0.1, rng) for _ in range(1000)]
+        self.assertTrue(all(90.0 <= interval <= 110.0 for interval in intervals))
+        self.assertEqual(jittered_interval(100.0, 0.0), 100.0)
+
+
+class TestAdaptivePollingPolicy(unittest.TestCase):
+    now = datetime.datetime(2025, 7, 23, 12, 0, tzinfo=datetime.UTC)
+
+    def setUp(self):
+        self.policy = AdaptivePollingPolicy(base_interval=2700, min_interval=900, max_interval=21600, backoff=1.5,
+                                            dormant_after=14 * 86400, active_window=86400)
+
+    def test_rank_change_uses_the_min_interval(self):
+        self.assertEqual(self.policy.next_interval(21600, True, self.now, self.now), 900)
+
+    def test_stable_players_back_off_up_to_the_cap(self):
+        interval, intervals = None, []
+        for _ in range(10):
+            interval = self.policy.next_interval(interval, False, self.now, self.now - datetime.timedelta(days=3))
+            intervals.append(interval)
+        self.assertEqual(intervals[0], 4050)
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], 21600)
+
+    def test_active_players_cap_at_the_base_interval(self):
+        recent = self.now - datetime.timedelta(hours=2)
+        old = self.now - datetime.timedelta(days=5)
+        for last_updated_at, last_rank_change_at in ((recent, None), (old, recent)):
+            interval = 900
+            for _ in range(10):
+                interval = self.policy.next_interval(interval, False, self.now, last_updated_at, last_rank_change_at)
+            self.assertEqual(interval, 2700)
+
+    def test_dormant_accounts_use_the_max_interval(self):
+        dormant = self.now - datetime.timedelta(days=90)
+        self.assertEqual(self.policy.next_interval(900, False, self.now, dormant), 21600)
+
+    def test_interval_distribution(self):
+        distribution = interval_distribution([600, 900, 2700, 4050, 21600, 43200])
+        self.assertEqual(distribution, {"<=15m": 2, "<=45m": 1, "<=2h": 1, "<=6h": 1, ">6h": 1})
+
+
+
+class TestRunStats(unittest.IsolatedAsyncioTestCase):
+
+    def test_stage_histogram_and_percentiles(self):
+        stage = StageStats("fetch")
+        for seconds in [0.005] * 90 + [0.3] * 9 + [12.0]:
+            stage.observe(seconds)
+        self.assertEqual(stage.calls, 100)
+        self.assertEqual(stage.as_dict()["histogram"], {"<=10ms": 90, "<=500ms": 9, ">5s": 1})
+        self.assertEqual(stage.percentile(0.5), 0.01)
+        self.assertEqual(stage.percentile(0.95), 0.5)
+        self.assertEqual(stage.percentile(1.0), 12.0)
+        self.assertIsNone(StageStats("empty").percentile(0.5))
+
+    def test_timer_counts_errors(self):
+        stage = StageStats("save")
+        with self.assertRaises(RuntimeError):
+            with stage.timer(items=10):
+                raise RuntimeError("database is locked")
+        self.assertEqual((stage.items, stage.errors, stage.calls), (10, 10, 1))
+
+    async def test_history_is_a_ring_buffer_and_dumps_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "runs.jsonl"
+            history = RunStatsHistory(maxlen=2, dump_path=path)
+            for run_id in range(3):
+                stats = history.start(run_id)
+                stats.stage("claim").observe(0.02, items=5)
+                await history.finish(stats)
+            self.assertEqual([stats.run_id for stats in history], [1, 2])
+            self.assertEqual(history.latest.run_id, 2)
+            dumped = [json.loads(line) for line in path.read_text().splitlines()]
+            self.assertEqual([run["run_id"] for run in dumped], [0, 1, 2])
+            self.assertEqual(dumped[0]["stages"]["claim"]["items"], 5)
+
+if __name__ == '__main__':
+    unittest.main()
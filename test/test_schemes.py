@@ -6,6 +6,7 @@ from types import SimpleNamespace
 
 from tortoise import Tortoise
 
+from app.lib.db.migrations import apply_migrations
 from app.lib.db.queries import *
 
 
@@ -108,53 +109,227 @@ class TestSchemes(unittest.IsolatedAsyncioTestCase):
         )
 
     # noinspection PyTypeChecker
-    async def test_get_platform_to_update_returns_old_links(self):
-        fake_guild = SimpleNamespace(
-            id=12345,
-            name="GuildForUpdate",
-            icon=None,
-            owner_id=54321,
-        )
+    async def test_rank_plan_is_cached_until_link_rank(self):
+        from app.lib.db.rank_plan import RankPlanCache, rank_plans
+        fake_guild = SimpleNamespace(id=7777, name="TestGuild", icon=None, owner_id=2222)
         await add_or_get_guild(fake_guild)
-        fake_member = SimpleNamespace(
-            id=67890,
-            name="MemberForUpdate",
-            discriminator="0002",
-            avatar=None,
-            bot=False,
-            guild=fake_guild,
-            joined_at=datetime.datetime.now(datetime.UTC)
-        )
-        await add_or_get_member(fake_member)
-        member_db = await MemberSchema.get(discord_id=67890)
+        cache = RankPlanCache()
+        plan = await cache.get(7777)
+        self.assertFalse(plan.configured)
 
-        # Create two PlatformLinks: one old, one recent
-        old_time = datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=45)
-        recent_time = datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=10)
+        await link_rank(fake_guild, SimpleNamespace(id=4444, name="Oro"), RankLinkEnum.ORO)
+        await link_rank(fake_guild, SimpleNamespace(id=5555, name="Elite"), RankLinkEnum.ELITE)
+        plan = await rank_plans.get(7777)
+        self.assertTrue(plan.configured)
+        self.assertEqual(plan.roles, {RankLinkEnum.ORO: 4444, RankLinkEnum.ELITE: 5555})
+        self.assertIs(await rank_plans.get(7777), plan)
 
-        await PlatformLink.create(
+        await link_rank(fake_guild, SimpleNamespace(id=6666, name="Oro"), RankLinkEnum.ORO)
+        plan = await rank_plans.get(7777)
+        self.assertEqual(plan.role_id(RankLinkEnum.ORO), 6666)
+        self.assertIsNone(plan.role_id(RankLinkEnum.BRONZO))
+        rank_plans.clear()
+
+    # noinspection PyTypeChecker
+    async def test_membership_and_eligibility_indexes(self):
+        from app.lib.db.eligibility import EligibilityIndex
+        from app.lib.db.membership import MembershipIndex
+        ranked = SimpleNamespace(id=100, name="Ranked", icon=None, owner_id=None)
+        plain = SimpleNamespace(id=200, name="Plain", icon=None, owner_id=None)
+        await add_or_get_guild(ranked)
+        await add_or_get_guild(plain)
+        for discord_id, guild in ((1, ranked), (2, plain), (3, ranked), (3, plain)):
+            await add_or_get_member(SimpleNamespace(id=discord_id, name=f"User{discord_id}", discriminator="0",
+                                                    avatar=None, bot=False, guild=guild, joined_at=None))
+        await link_rank(ranked, SimpleNamespace(id=4444, name="Oro"), RankLinkEnum.ORO)
+        await member_left(SimpleNamespace(id=3), datetime.datetime.now(datetime.UTC), ranked.id)
+
+        members = MembershipIndex()
+        index = EligibilityIndex(members)
+        await index.load()
+        self.assertTrue(members.loaded)
+        self.assertEqual(members.guilds_of(3), {200})
+        self.assertEqual(members.as_dict(), {"members": 3, "memberships": 3})
+        self.assertEqual([index.is_eligible(i) for i in (1, 2, 3)], [True, False, False])
+
+        members.member_joined(ranked.id, 3)
+        members.member_joined(plain.id, 2)
+        members.member_left(ranked.id, 1)
+        self.assertEqual(members.guilds_of(1), set())
+        self.assertEqual([index.is_eligible(i) for i in (1, 2, 3)], [False, False, True])
+
+        index.guild_ranked(plain.id)
+        self.assertTrue(index.is_eligible(2))
+        members.guild_removed(plain.id)
+        self.assertEqual([index.is_eligible(i) for i in (1, 2, 3)], [False, False, True])
+        index.record(checked=4, skipped=1)
+        self.assertEqual(index.as_dict()["skip_rate"], 0.25)
+
+    async def test_rejoining_member_is_present_again(self):
+        guild = SimpleNamespace(id=300, name="G", icon=None, owner_id=None)
+        other = SimpleNamespace(id=301, name="H", icon=None, owner_id=None)
+        await add_or_get_guild(guild)
+        await add_or_get_guild(other)
+        member = SimpleNamespace(id=7, name="User", discriminator="0", avatar=None, bot=False, guild=guild,
+                                 joined_at=None)
+        await add_or_get_member(member)
+        await member_left(member, datetime.datetime.now(datetime.UTC), guild.id)
+        await add_or_get_member(member)
+        member.guild = other
+        await add_or_get_member(member)
+        rows = await GuildMemberSchema.filter(discord_id_id=7).order_by("guild_id_id").values_list(
+            "guild_id_id", "left_at")
+        self.assertEqual(rows, [(300, None), (301, None)])
+
+    # noinspection PyTypeChecker
+    async def test_members_who_left_offline_are_pruned(self):
+        from app.cogs.rank_update_scheduler import RankUpdateScheduler
+        from app.lib.db.membership import membership
+        guild = SimpleNamespace(id=400, name="G", icon=None, owner_id=None)
+        await add_or_get_guild(guild)
+        for discord_id in (11, 12, 13):
+            await add_or_get_member(SimpleNamespace(id=discord_id, name=f"User{discord_id}", discriminator="0",
+                                                    avatar=None, bot=False, guild=guild, joined_at=None))
+        # 12 è uscito mentre il bot era offline, 14 è entrato senza essere registrato
+        members = [SimpleNamespace(id=discord_id, bot=False) for discord_id in (11, 13, 14)]
+        scheduler = RankUpdateScheduler.__new__(RankUpdateScheduler)
+        scheduler.bot = SimpleNamespace(guilds=[SimpleNamespace(id=guild.id, chunked=True, members=members)])
+        await scheduler._load_indexes()
+        self.assertEqual(membership.members_of(guild.id), {11, 13, 14})
+        rows = await GuildMemberSchema.filter(guild_id_id=guild.id, left_at__isnull=False).values_list(
+            "discord_id_id", flat=True)
+        self.assertEqual(list(rows), [12])
+        self.assertEqual(await mark_members_left(guild.id, [12], datetime.datetime.now(datetime.UTC)), 0)
+        membership.guild_removed(guild.id)
+
+    async def test_save_cached_ranks(self):
+        await MemberSchema.bulk_create([MemberSchema(discord_id=i) for i in range(5)])
+        await PlatformLink.bulk_create([
+            PlatformLink(discord_id_id=i, platform=PlatformEnum.PSN, platform_id=str(i),
+                         rematch_display_name=f"P{i}", cached_rank=RankLinkEnum.BRONZO)
+            for i in range(5)
+        ])
+        links = await PlatformLink.filter(discord_id_id__in=[1, 3]).order_by("id")
+        links[0].cached_rank = RankLinkEnum.ORO
+        links[1].cached_rank = RankLinkEnum.ELITE
+        self.assertEqual(await save_cached_ranks(links), 2)
+        self.assertEqual(await save_cached_ranks([]), 0)
+        ranks = await PlatformLink.all().order_by("discord_id_id").values_list("cached_rank", flat=True)
+        self.assertEqual(ranks, [RankLinkEnum.BRONZO, RankLinkEnum.ORO, RankLinkEnum.BRONZO, RankLinkEnum.ELITE,
+                                 RankLinkEnum.BRONZO])
+
+    # noinspection PyTypeChecker
+    async def test_save_check_results(self):
+        member_db = await MemberSchema.create(discord_id=13579)
+        link = await PlatformLink.create(
             discord_id=member_db,
-            platform_id="old_123",
+            platform_id="marker_123",
             platform="playstation",
             cached_rank=RankLinkEnum.ORO,
-            last_checked=old_time,
-            rematch_display_name="OldUser"
+            rematch_display_name="MarkerUser"
         )
+        self.assertIsNone(link.last_updated_at)
+        link.last_updated_at = datetime.datetime(2025, 7, 23, 12, 34, 56, tzinfo=datetime.UTC)
+        link.rank_hash = "abcdef"
+        link.check_interval = 4050
+        link.next_check_at = datetime.datetime(2025, 7, 23, 14, 0, tzinfo=datetime.UTC)
+        self.assertEqual(await save_check_results([link]), 1)
+        self.assertEqual(await save_check_results([]), 0)
+
+        db_link = await PlatformLink.get(id=link.id)
+        self.assertEqual(db_link.last_updated_at, link.last_updated_at)
+        self.assertEqual(db_link.rank_hash, "abcdef")
+        self.assertEqual(db_link.check_interval, 4050)
+        self.assertEqual(db_link.next_check_at, link.next_check_at)
+        self.assertIsNone(db_link.last_rank_change_at)
+
+    async def test_apply_migrations_adds_missing_columns(self):
+        connection = Tortoise.get_connection("default")
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "rank_hash"')
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "last_updated_at"')
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "next_check_at"')
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "check_interval"')
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "last_rank_change_at"')
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "lease_run_id"')
+        await connection.execute_script('ALTER TABLE "platformlink" DROP COLUMN "lease_expires_at"')
+        await connection.execute_script('DROP TABLE "rank_update_run"')
+
+        self.assertEqual(await apply_migrations(connection), 7)
+        self.assertEqual(await RankUpdateRun.all().count(), 0)
+        self.assertEqual(await apply_migrations(connection), 0)
         await PlatformLink.create(
-            discord_id=member_db,
-            platform_id="recent_123",
+            discord_id=await MemberSchema.create(discord_id=24680),
+            platform_id="migrated_123",
             platform="playstation",
             cached_rank=RankLinkEnum.ORO,
-            last_checked=recent_time,
-            rematch_display_name="RecentUser"
+            rematch_display_name="MigratedUser",
+            rank_hash="abcdef"
         )
+        indexes = await connection.execute_query_dict('PRAGMA index_list("platformlink")')
+        self.assertIn("idx_platformlink_next_check_at", [index["name"] for index in indexes])
+
+    async def test_check_schedule(self):
+        member_db = await MemberSchema.create(discord_id=11223)
+        links = [
+            await PlatformLink.create(
+                discord_id=member_db,
+                platform_id=f"schedule_{i}",
+                platform="playstation",
+                cached_rank=RankLinkEnum.ORO,
+                rematch_display_name=f"ScheduleUser{i}"
+            )
+            for i in range(3)
+        ]
+        next_check_at = datetime.datetime(2025, 7, 23, 12, 0, tzinfo=datetime.UTC)
+        links[0].next_check_at = next_check_at
+        links[0].check_interval = 900
+        self.assertEqual(await save_check_results(links[:1]), 1)
+
+        schedule = {link_id: (due, interval) for link_id, due, interval in await get_check_schedule()}
+        self.assertEqual(schedule[links[0].id], (next_check_at, 900))
+        self.assertEqual(schedule[links[1].id], (None, None))
+        unscheduled = [link_id for link_id, _, _ in await get_check_schedule(unscheduled_only=True)]
+        self.assertEqual(sorted(unscheduled), [links[1].id, links[2].id])
+
+        existing = await get_existing_links([links[2].id, links[0].id, 999])
+        self.assertEqual(sorted(existing), [links[0].id, links[2].id])
+
+    async def test_claim_and_release_links(self):
+        member_db = await MemberSchema.create(discord_id=33445)
+        links = [
+            await PlatformLink.create(
+                discord_id=member_db,
+                platform_id=f"lease_{i}",
+                platform="playstation",
+                cached_rank=RankLinkEnum.ORO,
+                rematch_display_name=f"LeaseUser{i}"
+            )
+            for i in range(3)
+        ]
+        link_ids = [link.id for link in links]
+        first, second = await start_run(), await start_run()
+
+        claimed = await claim_links(link_ids[:2], first, lease_seconds=600)
+        self.assertEqual(sorted(link.id for link in claimed), link_ids[:2])
+        # I link già in carico a un altro run non vengono presi due volte
+        claimed = await claim_links(link_ids, second, lease_seconds=600)
+        self.assertEqual([link.id for link in claimed], link_ids[2:])
 
+        first_links = await PlatformLink.filter(lease_run_id=first.id).all()
+        self.assertEqual(await release_leases(first_links[:1]), 1)
+        claimed = await claim_links(link_ids, second, lease_seconds=600)
+        self.assertEqual(sorted(link.id for link in claimed), sorted([first_links[0].id, link_ids[2]]))
 
-        # Only the old one should be returned
-        links = await get_platform_to_update()
-        platform_ids = [link.platform_id for link in links]
-        self.assertIn("old_123", platform_ids)
-        self.assertNotIn("recent_123", platform_ids)
+        # Il run "first" non è mai terminato: al riavvio viene segnato come interrotto
+        await finish_run(second, RunStatusEnum.COMPLETED, claimed=2, checked=2)
+        released = await recover_interrupted_runs()
+        self.assertEqual(released, [first_links[1].id])
+        self.assertEqual(await recover_interrupted_runs(), [])
+        runs = await get_recent_runs()
+        self.assertEqual([(run.id, run.status) for run in runs],
+                         [(second.id, RunStatusEnum.COMPLETED), (first.id, RunStatusEnum.INTERRUPTED)])
+        self.assertEqual(runs[0].claimed, 2)
+        self.assertIsNone(await PlatformLink.get(id=first_links[1].id).values_list("lease_run_id", flat=True))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,61 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import datetime
+import json
+import unittest
+
+from app.rematch_tracker.structures import Profile
+
+PROFILE = {
+    "player": {
+        "platform": "psn",
+        "platform_id": "3502400170348263876",
+        "display_name": "Tvrsier",
+        "avatar_asset": "https://cdn.example.com/a.png",
+        "banner_asset": "https://cdn.example.com/b.png",
+        "background_asset": "https://cdn.example.com/c.png",
+        "title": "Title",
+        "level": 50,
+        "last_updated_at": "2025-07-23T12:34:56Z",
+    },
+    "rank": {"current_league": 5, "current_division": 2},
+}
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_from_bytes_keeps_the_used_fields(self):
+        profile = Profile.from_bytes(json.dumps(PROFILE).encode())
+        self.assertEqual(profile.platform_id, "3502400170348263876")
+        self.assertEqual(profile.current_league, 5)
+        self.assertFalse(hasattr(profile, "__dict__"))
+
+    def test_key_access_is_compatible_with_profile_response(self):
+        profile = Profile.from_dict(PROFILE)
+        self.assertEqual(profile["rank"]["current_league"], 5)
+        self.assertEqual(profile["player"]["platform"], "psn")
+        self.assertEqual(profile["player"]["display_name"], "Tvrsier")
+        self.assertEqual(profile["player"]["last_updated_at"], "2025-07-23T12:34:56Z")
+        with self.assertRaises(KeyError):
+            profile["player"]["avatar_asset"]
+
+    def test_last_updated_at_is_parsed(self):
+        profile = Profile.from_dict(PROFILE)
+        self.assertEqual(profile.last_updated_at,
+                         datetime.datetime(2025, 7, 23, 12, 34, 56, tzinfo=datetime.UTC))
+
+    def test_rank_hash_changes_with_the_rank(self):
+        profile = Profile.from_dict(PROFILE)
+        self.assertEqual(profile.rank_hash, Profile.from_dict(PROFILE).rank_hash)
+        profile.current_division = 3
+        self.assertNotEqual(profile.rank_hash, Profile.from_dict(PROFILE).rank_hash)
+
+    def test_invalid_response(self):
+        with self.assertRaises(ValueError):
+            Profile.from_bytes(b'{"player": {"platform": "psn"}}')
+        self.assertEqual(Profile.from_dict(Profile.from_dict(PROFILE).to_dict()), Profile.from_dict(PROFILE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import dotenv
+dotenv.load_dotenv("../.env")
+
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from discord import HTTPException, NotFound
+
+from app.lib.user_resolver import UserResolver
+
+
+def response(status: int, headers: dict | None = None):
+    return SimpleNamespace(status=status, reason="", headers=headers or {})
+
+
+class FakeClient:
+    """
+    Client with a gateway cache of users 1-3, REST users 10-19, an unknown user 404 and a throttled user 429.
+    """
+
+    def __init__(self):
+        self.cached = {i: SimpleNamespace(id=i) for i in range(1, 4)}
+        self.fetches: list[int] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get_user(self, discord_id):
+        return self.cached.get(discord_id)
+
+    async def fetch_user(self, discord_id):
+        self.fetches.append(discord_id)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if discord_id == 404:
+                raise NotFound(response(404), "Unknown User")
+            if discord_id == 429:
+                raise HTTPException(response(429, {"Retry-After": "0.05"}), "You are being rate limited.")
+            return SimpleNamespace(id=discord_id)
+        finally:
+            self.in_flight -= 1
+
+
+class TestUserResolver(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rest_only_for_cache_misses(self):
+        client = FakeClient()
+        resolver = UserResolver(client, concurrency=3)
+        ids = [1, 2, 3] + list(range(10, 20))
+        users = await asyncio.gather(*(resolver.resolve(i) for i in ids))
+        self.assertEqual([user.id for user in users], ids)
+        self.assertEqual(sorted(client.fetches), list(range(10, 20)))
+        self.assertLessEqual(client.max_in_flight, 3)
+
+        resolver.new_run()
+        await asyncio.gather(*(resolver.resolve(i) for i in ids))
+        self.assertEqual(resolver.run_stats.as_dict()["cache_hits"], 13)
+        self.assertEqual(resolver.run_stats.rest_calls, 0)
+        self.assertEqual(resolver.stats.rest_calls, 10)
+
+    async def test_unknown_users_are_cached_as_missing(self):
+        client = FakeClient()
+        resolver = UserResolver(client)
+        self.assertIsNone(await resolver.resolve(404))
+        self.assertIsNone(await resolver.resolve(404))
+        self.assertEqual(client.fetches, [404])
+        self.assertEqual((resolver.stats.not_found, resolver.stats.negative_hits), (1, 1))
+
+    async def test_throttled_fetch_delays_the_next_ones(self):
+        client = FakeClient()
+        resolver = UserResolver(client)
+        self.assertIsNone(await resolver.resolve(429))
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.assertEqual((await resolver.resolve(10)).id, 10)
+        self.assertGreaterEqual(loop.time() - start, 0.04)
+        self.assertEqual((resolver.stats.throttled, resolver.stats.errors), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()